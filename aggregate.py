@@ -0,0 +1,431 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+from blob_store import BLOB_DIR, BlobStore, is_ref
+
+# --- Streaming aggregation over scan outputs ---
+# Prevalence and co-occurrence of ";"-joined multi-value fields (Frameworks,
+# detected_platforms, data_attributes...) and adoption rates of single-value
+# fields (security headers, lazy loading...), computed chunk by chunk with
+# NumPy so memory stays bounded however many rows the outputs hold. Rows are
+# compared per input file, or per ruleset version when reading the result index.
+# The index keeps only the latest row per (domain, analyzer), so its ruleset groups
+# are different sets of domains (those not rescanned since the bump and those
+# that were), not the same domains before and after a ruleset change. Blob-store
+# references in the outputs (see blob_store.py) are read back from --blob-dir.
+#
+#   python aggregate.py mvc_frameworks7.csv --multi Frameworks
+#   python aggregate.py technical_details.parquet technical_details.part-*.parquet \
+#       --multi data_attributes --flag strict_transport_security content_security_policy lazy_loading_images
+#   python aggregate.py --index results.db --analyzer abv3 --multi detected_platforms
+
+CHUNK_ROWS = 100_000
+TOP_N = 30  # tokens listed per column
+COOC_MAX_TOKENS = 256  # co-occurrence is only kept for columns with at most this many distinct tokens
+COOC_BLOCK = 8192  # rows per incidence-matrix multiply
+COOC_REPORT = 15  # most common tokens shown in the co-occurrence matrix
+VOCAB_LIMIT = 1_000_000  # distinct tokens per column; later new tokens are counted as OTHER_TOKEN
+OTHER_TOKEN = "(other)"
+FLAG_FALSE = {"", "no", "none", "false", "0", "null"}  # values that count as "not set"
+
+# Analyzer defaults, so a plain "python aggregate.py <file>" reports something useful
+DEFAULT_MULTI = ["Frameworks", "detected_platforms", "data_attributes", "web_component_tags"]
+DEFAULT_FLAGS = [
+    "strict_transport_security", "content_security_policy", "x_frame_options",
+    "access_control_allow_origin", "lazy_loading_images", "lazy_loading_iframes",
+    "service_worker", "manifest_link",
+]
+
+
+def _numpy():
+    # Called where NumPy is used, so "import aggregate" and --help work without it
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("aggregate.py needs the 'numpy' package")
+    return numpy
+
+
+# --- Readers: each yields {column: [str, ...]} chunks for the requested columns ---
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _csv_chunks(path, columns, chunk_rows):
+    try:
+        import pyarrow.csv as pacsv
+    except ImportError:
+        pacsv = None
+    if pacsv is not None:
+        # Multi-threaded C parser; large blocks so long cells (scripts, CSP) fit in one
+        with open(path, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        wanted = [c for c in columns if c in header]
+        if not wanted:
+            return
+        reader = pacsv.open_csv(
+            path,
+            read_options=pacsv.ReadOptions(block_size=64 << 20),
+            # Quoted cells may span lines (CSP headers, JSON-LD); the default parser splits them into rows
+            parse_options=pacsv.ParseOptions(newlines_in_values=True),
+            convert_options=pacsv.ConvertOptions(include_columns=wanted,
+                                                 column_types={c: "string" for c in wanted},
+                                                 strings_can_be_null=False),
+        )
+        for batch in reader:
+            yield from _arrow_batch_chunks(batch, columns, chunk_rows)
+        return
+
+    csv.field_size_limit(2**31 - 1)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [(col, header.index(col)) for col in columns if col in header]
+        chunk = {col: [] for col, _ in positions}
+        rows = 0
+        for row in reader:
+            for col, i in positions:
+                chunk[col].append(row[i] if i < len(row) else "")
+            rows += 1
+            if rows >= chunk_rows:
+                yield chunk
+                chunk = {col: [] for col, _ in positions}
+                rows = 0
+        if rows:
+            yield chunk
+
+
+def _arrow_batch_chunks(batch, columns, chunk_rows):
+    names = set(batch.schema.names)
+    for start in range(0, batch.num_rows, chunk_rows):
+        part = batch.slice(start, chunk_rows)
+        yield {col: [_text(v) for v in part.column(col).to_pylist()]
+               for col in columns if col in names}
+
+
+def _parquet_chunks(path, columns, chunk_rows):
+    import pyarrow.parquet as pq
+    f = pq.ParquetFile(path)
+    wanted = [c for c in columns if c in f.schema_arrow.names]
+    if not wanted:
+        return
+    for batch in f.iter_batches(batch_size=chunk_rows, columns=wanted):
+        yield from _arrow_batch_chunks(batch, columns, chunk_rows)
+
+
+def _arrow_chunks(path, columns, chunk_rows):
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            yield from _arrow_batch_chunks(reader.get_batch(i), columns, chunk_rows)
+
+
+def _jsonl_zst_chunks(path, columns, chunk_rows):
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("reading jsonl.zst needs the 'zstandard' package")
+    with open(path, "rb") as raw:
+        text = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True),
+                                encoding="utf-8")
+        chunk = {col: [] for col in columns}
+        rows = 0
+        for line in text:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for col in columns:
+                chunk[col].append(_text(record.get(col)))
+            rows += 1
+            if rows >= chunk_rows:
+                yield chunk
+                chunk = {col: [] for col in columns}
+                rows = 0
+        if rows:
+            yield chunk
+
+
+READERS = [
+    (".jsonl.zst", _jsonl_zst_chunks),
+    (".parquet", _parquet_chunks),
+    (".arrow", _arrow_chunks),
+    (".csv", _csv_chunks),
+]
+
+
+def iter_file_chunks(path, columns, chunk_rows=CHUNK_ROWS):
+    for ext, reader in READERS:
+        if path.endswith(ext):
+            return reader(path, columns, chunk_rows)
+    raise ValueError(f"unsupported output file: {path}")
+
+
+def iter_index_chunks(index_path, analyzer, columns, chunk_rows=CHUNK_ROWS):
+    # -> (ruleset versions, chunk) from the stored rows of one analyzer
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(
+            "SELECT ruleset_version, data FROM results WHERE analyzer = ? AND data IS NOT NULL", (analyzer,))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            records = [json.loads(data) for _, data in rows]
+            yield ([version or "" for version, _ in rows],
+                   {col: [_text(r.get(col)) for r in records] for col in columns})
+    finally:
+        conn.close()
+
+
+# --- Counters ---
+
+class _Grid:
+    # Growable (groups x tokens) int64 matrix
+    def __init__(self):
+        np = _numpy()
+        self.data = np.zeros((1, 64), np.int64)
+
+    def ensure(self, groups, tokens):
+        np = _numpy()
+        rows, cols = self.data.shape
+        if groups > rows or tokens > cols:
+            grown = np.zeros((max(groups, rows), max(tokens, cols * 2) if tokens > cols else cols), np.int64)
+            grown[:rows, :cols] = self.data
+            self.data = grown
+
+
+class TokenCounter:
+    # Rows containing each token of a ";"-joined column, per group, plus token co-occurrence
+    def __init__(self, blob_store=None):
+        np = _numpy()
+        self.vocab = {}
+        self.tokens = []
+        self.present = _Grid()
+        self.cooc = np.zeros((0, 0), np.int64)
+        self.cooc_enabled = True
+        self.blob_store = blob_store
+
+    def _token_id(self, token):
+        token = token.strip()
+        if not token:
+            return -1
+        tid = self.vocab.get(token)
+        if tid is None:
+            if len(self.tokens) >= VOCAB_LIMIT:
+                token = OTHER_TOKEN
+                tid = self.vocab.get(token)
+                if tid is not None:
+                    return tid
+            tid = self.vocab[token] = len(self.tokens)
+            self.tokens.append(token)
+        return tid
+
+    def _resolve(self, values):
+        # Reference plus preview would otherwise be split into junk tokens
+        if self.blob_store is None:
+            raise RuntimeError("multi-value column holds blob-store references; aggregate with a BlobStore")
+        try:
+            return [self.blob_store.resolve(v) if is_ref(v) else v for v in values]
+        except FileNotFoundError as e:
+            raise RuntimeError(f"blob missing from {self.blob_store.root}: {e.filename}")
+
+    def add(self, values, groups, n_groups):
+        np = _numpy()
+        if any(map(is_ref, values)):
+            values = self._resolve(values)
+        n = len(values)
+        lengths = np.fromiter((v.count(";") + 1 if v else 0 for v in values), np.int64, n)
+        if not lengths.any():
+            return
+        flat = np.array(";".join(v for v in values if v).split(";"), dtype=object)
+        rows = np.repeat(np.arange(n, dtype=np.int64), lengths)
+        # Tokens are interned once per distinct value in the chunk, not once per occurrence
+        uniq, inverse = np.unique(flat, return_inverse=True)
+        ids = np.fromiter((self._token_id(t) for t in uniq), np.int64, len(uniq))[inverse]
+        keep = ids >= 0
+        rows, ids = rows[keep], ids[keep]
+        width = len(self.tokens)
+        if not width or not len(ids):
+            return
+
+        # One (row, token) pair per row, however often the token repeats in it
+        pairs = np.unique(rows * width + ids)
+        rows, ids = np.divmod(pairs, width)
+        self.present.ensure(n_groups, width)
+        counts = np.bincount(groups[rows] * width + ids, minlength=n_groups * width).reshape(n_groups, width)
+        self.present.data[:n_groups, :width] += counts
+
+        if self.cooc_enabled and width > COOC_MAX_TOKENS:
+            self.cooc_enabled = False
+            self.cooc = np.zeros((0, 0), np.int64)
+        if self.cooc_enabled:
+            self._add_cooc(rows, ids, width)
+
+    def _add_cooc(self, rows, ids, width):
+        np = _numpy()
+        if self.cooc.shape[0] < width:
+            grown = np.zeros((width, width), np.int64)
+            grown[:self.cooc.shape[0], :self.cooc.shape[1]] = self.cooc
+            self.cooc = grown
+        # Incidence blocks times their transpose; float32 BLAS is exact for counts below 2**24
+        # pairs come out of np.unique sorted by row, so each block is a contiguous slice
+        used_rows, local = np.unique(rows, return_inverse=True)
+        for start in range(0, len(used_rows), COOC_BLOCK):
+            lo, hi = np.searchsorted(local, [start, start + COOC_BLOCK])
+            block = np.zeros((min(COOC_BLOCK, len(used_rows) - start), width), np.float32)
+            block[local[lo:hi] - start, ids[lo:hi]] = 1.0
+            self.cooc[:width, :width] += np.rint(block.T @ block).astype(np.int64)
+
+    def report(self, group_rows, group_names, top=TOP_N):
+        np = _numpy()
+        width = len(self.tokens)
+        self.present.ensure(len(group_names), width)  # groups with no tokens at all
+        present = self.present.data[:len(group_names), :width]
+        total = present.sum(axis=0)
+        order = np.argsort(-total, kind="stable")[:top]
+        all_rows = max(1, int(group_rows.sum()))
+        out = {"distinct_tokens": width, "top": []}
+        for t in order:
+            entry = {"token": self.tokens[t], "rows": int(total[t]), "share": round(total[t] / all_rows, 4)}
+            if len(group_names) > 1:
+                entry["by_group"] = {name: {"rows": int(present[g, t]),
+                                            "share": round(present[g, t] / max(1, group_rows[g]), 4)}
+                                     for g, name in enumerate(group_names)}
+            out["top"].append(entry)
+        if self.cooc_enabled and width:
+            keep = order[:COOC_REPORT]
+            names = [self.tokens[t] for t in keep]
+            matrix = self.cooc[np.ix_(keep, keep)]
+            out["cooccurrence"] = {a: {b: int(matrix[i, j]) for j, b in enumerate(names) if matrix[i, j]}
+                                   for i, a in enumerate(names)}
+        return out
+
+
+class FlagCounter:
+    # Rows where a single-value column is set (not empty, "no", "none"...), per group
+    def __init__(self):
+        np = _numpy()
+        self.hits = np.zeros(1, np.int64)
+
+    def add(self, values, groups, n_groups):
+        np = _numpy()
+        set_ = np.fromiter((v.strip().lower() not in FLAG_FALSE for v in values), bool, len(values))
+        if len(self.hits) < n_groups:
+            self.hits = np.concatenate([self.hits, np.zeros(n_groups - len(self.hits), np.int64)])
+        self.hits[:n_groups] += np.bincount(groups[set_], minlength=n_groups)
+
+    def report(self, group_rows, group_names):
+        hits = self.hits[:len(group_names)]
+        out = {"rows": int(hits.sum()), "share": round(hits.sum() / max(1, group_rows.sum()), 4)}
+        if len(group_names) > 1:
+            out["by_group"] = {name: {"rows": int(hits[g]), "share": round(hits[g] / max(1, group_rows[g]), 4)}
+                               for g, name in enumerate(group_names)}
+        return out
+
+
+class Aggregator:
+    def __init__(self, multi=(), flags=(), blob_store=None):
+        np = _numpy()
+        self.multi = {col: TokenCounter(blob_store) for col in multi}
+        self.flags = {col: FlagCounter() for col in flags}
+        self.groups = {}
+        self.group_rows = np.zeros(1, np.int64)
+        self.seen_columns = set()
+
+    def columns(self):
+        return list(self.multi) + list(self.flags)
+
+    def add(self, chunk, group):
+        # group: one label for the whole chunk, or one label per row
+        np = _numpy()
+        if not chunk:
+            return
+        n = len(next(iter(chunk.values())))
+        if isinstance(group, str):
+            gid = self.groups.setdefault(group, len(self.groups))
+            groups = np.full(n, gid, np.int64)
+        else:
+            labels, inverse = np.unique(np.array(group, dtype=object), return_inverse=True)
+            mapping = np.array([self.groups.setdefault(label, len(self.groups)) for label in labels], np.int64)
+            groups = mapping[inverse]
+        n_groups = len(self.groups)
+        if len(self.group_rows) < n_groups:
+            self.group_rows = np.concatenate([self.group_rows, np.zeros(n_groups - len(self.group_rows), np.int64)])
+        self.group_rows[:n_groups] += np.bincount(groups, minlength=n_groups)
+        for col, values in chunk.items():
+            self.seen_columns.add(col)
+            counter = self.multi.get(col) or self.flags.get(col)
+            counter.add(values, groups, n_groups)
+
+    def report(self, top=TOP_N):
+        names = list(self.groups)
+        group_rows = self.group_rows[:len(names)]
+        return {
+            "rows": int(group_rows.sum()),
+            "groups": {name: int(group_rows[g]) for g, name in enumerate(names)},
+            "multi_value": {col: c.report(group_rows, names, top) for col, c in self.multi.items()
+                            if col in self.seen_columns},
+            "flags": {col: c.report(group_rows, names) for col, c in self.flags.items()
+                      if col in self.seen_columns},
+        }
+
+
+def aggregate_files(paths, multi=DEFAULT_MULTI, flags=DEFAULT_FLAGS, chunk_rows=CHUNK_ROWS, top=TOP_N,
+                    blob_store=None):
+    agg = Aggregator(multi, flags, blob_store)
+    for path in paths:
+        label = os.path.basename(path)
+        for chunk in iter_file_chunks(path, agg.columns(), chunk_rows):
+            agg.add(chunk, label)
+    return agg.report(top)
+
+
+def aggregate_index(index_path, analyzer, multi=DEFAULT_MULTI, flags=DEFAULT_FLAGS, chunk_rows=CHUNK_ROWS,
+                    top=TOP_N, blob_store=None):
+    # Groups are ruleset versions of the rows currently stored. Rows are replaced per
+    # (domain, analyzer), so each group is a different set of domains; this shows how far
+    # a rescan has got, not how one domain's result changed with the ruleset
+    agg = Aggregator(multi, flags, blob_store)
+    for versions, chunk in iter_index_chunks(index_path, analyzer, agg.columns(), chunk_rows):
+        agg.add(chunk, [f"ruleset {v}" for v in versions])
+    return agg.report(top)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Streaming prevalence / co-occurrence statistics over scan outputs")
+    parser.add_argument("paths", nargs="*", help="output files (csv, jsonl.zst, parquet, arrow); one group each")
+    parser.add_argument("--index", help="read an analyzer's current rows from this result index instead, grouped "
+                                        "by ruleset (each group is a different set of domains)")
+    parser.add_argument("--analyzer", help="analyzer to read from --index")
+    parser.add_argument("--multi", nargs="+", default=DEFAULT_MULTI, help="';'-joined multi-value columns")
+    parser.add_argument("--flag", nargs="+", default=DEFAULT_FLAGS, help="single-value columns to rate as set/unset")
+    parser.add_argument("--top", type=int, default=TOP_N)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--blob-dir", default=BLOB_DIR,
+                        help="blob store the outputs or index were written with, for references in multi-value columns")
+    parser.add_argument("--no-resolve-blobs", action="store_true",
+                        help="fail on blob-store references instead of reading them (see blob_store.py)")
+    args = parser.parse_args(argv)
+
+    store = None if args.no_resolve_blobs else BlobStore(args.blob_dir)
+    if args.index:
+        if not args.analyzer:
+            parser.error("--index needs --analyzer")
+        report = aggregate_index(args.index, args.analyzer, args.multi, args.flag, args.chunk_rows, args.top, store)
+    elif args.paths:
+        report = aggregate_files(args.paths, args.multi, args.flag, args.chunk_rows, args.top, store)
+    else:
+        parser.error("give output files or --index")
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    print()
+
+
+if __name__ == "__main__":
+    main()
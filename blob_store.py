@@ -0,0 +1,119 @@
+import csv
+import hashlib
+import os
+import re
+import threading
+import zlib
+from collections.abc import Mapping
+
+# --- Content-addressed blob store ---
+# Large field values (JSON-LD, CSP headers, script lists...) repeat across many
+# domains. They are stored once under their SHA-256 and the output row keeps a
+# short reference ("blob:<hash>") followed by an optional inline preview.
+
+BLOB_DIR = ".blobs"
+BLOB_THRESHOLD = 2048  # values at least this many chars are moved out of the row
+PREVIEW_CHARS = 120  # 0 keeps only the reference
+REF_PREFIX = "blob:"
+REF_LEN = len(REF_PREFIX) + 64
+COMPRESS_LEVEL = 6
+
+_REF = re.compile(rf"{REF_PREFIX}[0-9a-f]{{64}}(?: |$)")  # reference, then the preview or nothing
+
+
+def is_ref(value):
+    # Exact layout only, so a real value that happens to start with "blob:" is left alone
+    return isinstance(value, str) and value.startswith(REF_PREFIX) and _REF.match(value) is not None
+
+
+class BlobStore:
+    def __init__(self, root=BLOB_DIR, threshold=BLOB_THRESHOLD, preview_chars=PREVIEW_CHARS):
+        self.root = root
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+        self._known = set()
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, text):
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._known:
+                self.deduplicated += 1
+                return digest
+            self._known.add(digest)
+        path = self._path(digest)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a concurrent reader never sees a partial blob
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(data, COMPRESS_LEVEL))
+        os.replace(tmp, path)
+        with self._lock:
+            self.stored += 1
+        return digest
+
+    def get(self, digest):
+        with open(self._path(digest), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def encode(self, value):
+        # Row value to write: unchanged if short, otherwise a reference plus preview
+        if not isinstance(value, str) or len(value) < self.threshold:
+            return value
+        ref = REF_PREFIX + self.put(value)
+        if self.preview_chars:
+            preview = " ".join(value[:self.preview_chars].split())
+            return f"{ref} {preview}"
+        return ref
+
+    def resolve(self, value):
+        if is_ref(value):
+            return self.get(value[len(REF_PREFIX):REF_LEN])
+        return value
+
+    def stats(self):
+        return {"stored": self.stored, "deduplicated": self.deduplicated}
+
+
+class LazyRow(Mapping):
+    # Row whose blob references are only read from disk when the field is accessed
+    def __init__(self, row, store):
+        self._row = row
+        self._store = store
+        self._resolved = {}
+
+    def __getitem__(self, key):
+        if key in self._resolved:
+            return self._resolved[key]
+        value = self._row[key]
+        if is_ref(value):
+            value = self._resolved[key] = self._store.resolve(value)
+        return value
+
+    def raw(self, key):
+        # Stored value (reference and preview) without touching the blob
+        return self._row[key]
+
+    def __iter__(self):
+        return iter(self._row)
+
+    def __len__(self):
+        return len(self._row)
+
+
+def read_rows(path, store=None):
+    # Reads a CSV written through a blob-enabled sink, yielding LazyRow mappings
+    store = store or BlobStore()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield LazyRow(row, store)
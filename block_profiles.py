@@ -0,0 +1,82 @@
+import re
+
+# --- Request blocking profiles for headless rendering ---
+# resource_types use Playwright's request.resource_type names. For Selenium the
+# same types are mapped to URL patterns for CDP Network.setBlockedURLs.
+
+AD_HOSTS = ["doubleclick.net", "googlesyndication.com", "adservice.google.com", "amazon-adsystem.com",
+            "adnxs.com", "criteo.com", "taboola.com", "outbrain.com"]
+BEACON_HOSTS = ["google-analytics.com", "facebook.com/tr", "connect.facebook.net", "hotjar.com",
+                "clarity.ms", "segment.io", "bat.bing.com", "analytics.tiktok.com"]
+
+BLOCK_PROFILES = {
+    # Framework detection reads headers, DOM and scripts only
+    "framework": {"resource_types": {"image", "media", "font"}, "hosts": AD_HOSTS + BEACON_HOSTS},
+    # Technical details read the DOM; resource URLs stay in the markup even when blocked
+    "details": {"resource_types": {"image", "media", "font"}, "hosts": AD_HOSTS + BEACON_HOSTS},
+    # A/B detection needs scripts, XHR and analytics tags (dataLayer, gtag based tools)
+    "ab": {"resource_types": {"image", "media", "font"}, "hosts": AD_HOSTS},
+    "none": {"resource_types": set(), "hosts": []},
+}
+
+TYPE_EXTENSIONS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+    # No "ts": TypeScript modules and other scripts use it too. Blocking the .m3u8
+    # playlist already keeps an HLS player from requesting its segments.
+    "media": ["mp4", "webm", "ogg", "mp3", "wav", "m4a", "mov", "m3u8"],
+}
+
+_host_patterns = {}
+
+
+def _host_pattern(profile_name):
+    pattern = _host_patterns.get(profile_name)
+    if pattern is None:
+        hosts = BLOCK_PROFILES[profile_name]["hosts"]
+        pattern = re.compile("|".join(re.escape(h) for h in hosts), re.I) if hosts else None
+        _host_patterns[profile_name] = pattern
+    return pattern
+
+
+def should_block(profile_name, resource_type, url):
+    profile = BLOCK_PROFILES[profile_name]
+    if resource_type in profile["resource_types"]:
+        return True
+    pattern = _host_pattern(profile_name)
+    return bool(pattern and pattern.search(url))
+
+
+def cdp_block_patterns(profile_name):
+    profile = BLOCK_PROFILES[profile_name]
+    patterns = []
+    for resource_type in sorted(profile["resource_types"]):
+        for ext in TYPE_EXTENSIONS.get(resource_type, []):
+            patterns += [f"*.{ext}", f"*.{ext}?*"]
+    patterns += [f"*{host}*" for host in profile["hosts"]]
+    return patterns
+
+
+def apply_cdp_blocking(driver, profile_name):
+    # The Network domain must already be enabled on this driver
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": cdp_block_patterns(profile_name)})
+
+
+def count_blocked(log_entries):
+    # Requests stopped by setBlockedURLs show up as loadingFailed with a blockedReason
+    return sum(1 for entry in log_entries
+               if '"Network.loadingFailed"' in entry.get("message", "")
+               and '"blockedReason"' in entry["message"])
+
+
+async def install_playwright_blocking(context, profile_name, counter):
+    # counter is a dict; blocked requests are tallied under "blocked_requests"
+    async def handle_route(route):
+        request = route.request
+        if should_block(profile_name, request.resource_type, request.url):
+            counter["blocked_requests"] = counter.get("blocked_requests", 0) + 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle_route)
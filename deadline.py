@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from aiohttp import ClientTimeout
+
+# --- Per-domain time budget ---
+# One Deadline is created per domain and handed to every stage (fetch, probes,
+# rendering, script downloads). Stages size their own timeouts from what is
+# left, so a slow stage shortens the ones after it instead of adding to them.
+
+DOMAIN_BUDGET = 90  # seconds
+BUDGET_MARKER = "budget_exhausted"
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds=DOMAIN_BUDGET):
+        self.budget = seconds
+        self.expires = time.monotonic() + seconds
+        self.exhausted = False
+        self.stages = set()  # expensive stages that ran (e.g. "render"), kept in the latency history
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def elapsed(self):
+        return self.budget - (self.expires - time.monotonic())
+
+    def expired(self):
+        if self.remaining() <= 0:
+            self.exhausted = True
+        return self.exhausted
+
+    def timeout(self, cap=None):
+        # Seconds a stage may take: what is left, optionally capped by the stage's own limit
+        left = self.remaining()
+        return left if cap is None else min(cap, left)
+
+    def client_timeout(self, cap=None):
+        return ClientTimeout(total=max(0.001, self.timeout(cap)))
+
+    def mark(self, stage):
+        self.stages.add(stage)
+
+    def check(self):
+        if self.expired():
+            raise BudgetExhausted()
+
+    async def run(self, coro, cap=None):
+        # Cancels the awaited work when the budget (or cap) runs out
+        if self.expired():
+            coro.close()
+            raise BudgetExhausted()
+        limit = self.timeout(cap)
+        try:
+            return await asyncio.wait_for(coro, limit)
+        except asyncio.TimeoutError:
+            if self.expired():
+                raise BudgetExhausted()
+            raise
@@ -1,26 +1,41 @@
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup, Doctype
-import csv
 import time
 from urllib.parse import urlparse
 import random
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import WebDriverException
 import warnings
-warnings.filterwarnings("ignore")
+from concurrent.futures import ThreadPoolExecutor
+from block_profiles import apply_cdp_blocking, count_blocked
+from deadline import Deadline, BudgetExhausted, BUDGET_MARKER, DOMAIN_BUDGET
+from egress import as_pool, client_session
+from hedging import HEDGER, hedged_get
+from memory_governor import MemoryGovernor, MEMORY_BUDGET_MB, WINDOW_FACTOR, run_windowed
+from output_sinks import open_sink
+from result_index import ResultIndex, RESULT_DB, STATUS_OK, STATUS_PARTIAL, STATUS_FAILED
+from records import record_class
+from recrawl import Recrawl, page_hash
+from politeness import HostScheduler
+import priority
+from redirect_share import OriginShare
 
 # Add these to your configuration section
 SELENIUM_RETRIES = 0
 SELENIUM_TIMEOUT = 30  # seconds
 HEADLESS = True  # Run browser in headless mode
+CHROMEDRIVER_PATH = os.environ.get('CHROMEDRIVER_PATH')  # None lets Selenium find or download a matching driver
+BLOCK_PROFILE = "details"  # See block_profiles.BLOCK_PROFILES
+HEDGE_REQUESTS = True  # Hedge the page fetch on slow TTFB (see hedging.py)
 
 # Configuration
 INPUT_FILE = 'newdomains.txt'
 OUTPUT_FILE = 'technical_details.csv'
+OUTPUT_FORMAT = 'csv'  # csv, jsonl.zst, parquet or arrow (see output_sinks.py)
+BLOB_COLUMNS = ['structured_data', 'content_security_policy', 'data_attributes']  # see blob_store.py
+ANALYZER = 'details'  # key in the result index (see result_index.py)
+RULESET_VERSION = '1'  # bump when extract_technical_details changes
+SKIP_COMPLETED = False  # only scan domains without a current result in the index
+RECRAWL = False  # reuse stored results for pages that are unchanged since the last run (see recrawl.py)
 FAILED_DOMAINS_FILE = 'failed_domains.txt'
 CONCURRENT_REQUESTS = 80
 TIMEOUT = aiohttp.ClientTimeout(total=30)
@@ -70,8 +85,23 @@ DESIRED_COLUMNS = [
     "conditional_comments"
 ]
 
+# One slotted object per domain instead of a 40-key dict (see records.py)
+DetailsRecord = record_class('DetailsRecord', DESIRED_COLUMNS)
+
+metrics = {'blocked_requests': 0}
+
+def parse_html(html):
+    from bs4 import BeautifulSoup  # imported on first parse, not at module import
+    return BeautifulSoup(html, 'html.parser')
+
+
 # Initialize Selenium (do this once at startup)
-def init_selenium():
+def init_selenium(chromedriver_path=CHROMEDRIVER_PATH):
+    # Selenium is only imported when the browser fallback is actually started
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
     chrome_options = Options()
     if HEADLESS:
         chrome_options.add_argument("--headless=new")
@@ -80,40 +110,72 @@ def init_selenium():
     chrome_options.add_argument("--disable-gpu")
     chrome_options.add_argument("--window-size=1920,1080")
     chrome_options.add_argument(f"user-agent={random.choice(USER_AGENTS)}")
+    # Performance log is only read to count blocked requests
+    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     
-    service = Service(executable_path=r"C:\Users\HP\Downloads\chromedriver-win32\chromedriver-win32\chromedriver.exe")  # Update this path
+    service = Service(executable_path=chromedriver_path) if chromedriver_path else Service()
     driver = webdriver.Chrome(service=service, options=chrome_options)
     driver.set_page_load_timeout(SELENIUM_TIMEOUT)
+    driver.execute_cdp_cmd("Network.enable", {})
+    apply_cdp_blocking(driver, BLOCK_PROFILE)
     return driver
 
-async def fetch_with_selenium(driver, url):
+def _render_with_selenium(driver, url, deadline):
+    # Blocking: only ever run on the Selenium thread (see fetch_with_selenium).
+    # Raises when the browser fails; None means the page rendered but is not HTML.
+    # The render may have queued behind other domains' renders, so its page-load
+    # timeout and settle wait are sized from what is left of this domain's budget
+    if deadline.expired():
+        return None
+    # The driver is shared by the whole batch; start each site without the previous sites' cookies
     try:
-        driver.get(url)
-        # Wait for page to load (simple wait, you could enhance this)
-        time.sleep(2)
-        html = driver.page_source
-        if len(html) < 100 or '<html' not in html.lower():
-            return None
-        
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Prepare response headers (simulated for Selenium)
-        response_headers = {
-            'http_version': 'HTTP/1.1',  # Selenium doesn't expose this
-            'content_encoding': '',
-            'content-security-policy': '',
-            'strict-transport-security': '',
-            'x-frame-options': '',
-            'access-control-allow-origin': ''
-        }
-        
-        details = extract_technical_details(soup, response_headers)
-        details['domain'] = extract_domain(url)
-        return details
-    except Exception as e:
-        print(f"Selenium failed for {url}: {str(e)}")
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    except Exception:
+        pass
+    driver.set_page_load_timeout(max(1, deadline.timeout(SELENIUM_TIMEOUT)))
+    driver.get(url)
+    # Wait for page to load (simple wait, you could enhance this)
+    time.sleep(min(2, deadline.remaining()))
+    try:
+        metrics['blocked_requests'] += count_blocked(driver.get_log('performance'))
+    except Exception:
+        pass
+    html = driver.page_source
+    if len(html) < 100 or '<html' not in html.lower():
         return None
 
+    soup = parse_html(html)
+
+    # Prepare response headers (simulated for Selenium)
+    response_headers = {
+        'http_version': 'HTTP/1.1',  # Selenium doesn't expose this
+        'content_encoding': '',
+        'content-security-policy': '',
+        'strict-transport-security': '',
+        'x-frame-options': '',
+        'access-control-allow-origin': ''
+    }
+
+    details = extract_technical_details(soup, response_headers)
+    soup.decompose()
+    details['domain'] = extract_domain(url)
+    return details
+
+
+_selenium_thread = None
+
+
+async def fetch_with_selenium(driver, url, deadline):
+    # driver.get and the settle wait block, so they run on one dedicated thread instead of
+    # the event loop; one thread also keeps the shared driver from being used concurrently.
+    # Queueing for that thread counts against the budget: a render still waiting when the
+    # budget runs out is cancelled before it starts
+    global _selenium_thread
+    if _selenium_thread is None:
+        _selenium_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="selenium")
+    render = asyncio.get_running_loop().run_in_executor(_selenium_thread, _render_with_selenium,
+                                                        driver, url, deadline)
+    return await deadline.run(render)
 
 
 def get_headers():
@@ -140,7 +202,9 @@ def extract_domain(url):
         return url.strip()
 
 def extract_technical_details(soup, response_headers):
-    details = {col: '' for col in DESIRED_COLUMNS[1:]}  # Skip domain column
+    from bs4 import Doctype
+
+    details = DetailsRecord()  # domain is filled in by the caller
     
     # HTML Document Attributes
     for item in soup.contents:
@@ -280,26 +344,38 @@ def extract_technical_details(soup, response_headers):
     
     return details
 
-async def fetch_url(session, url, selenium_driver=None):
+async def fetch_url(session, url, selenium_driver=None, deadline=None, recrawl=None, on_response=None):
     domain = extract_domain(url)
+    deadline = deadline or Deadline(DOMAIN_BUDGET)
+    previous = recrawl.previous(domain) if recrawl else None
     
-    # First try with aiohttp (fast)
+    # First try with aiohttp (fast); retries share the domain budget
     for attempt in range(RETRIES + 1):
+        if deadline.expired():
+            break
+        request_headers = recrawl.headers(url, get_headers(), previous) if recrawl else get_headers()
         try:
-            async with session.get(url, timeout=TIMEOUT, headers=get_headers()) as response:
+            async with await hedged_get(session, url, enabled=HEDGE_REQUESTS,
+                                        timeout=deadline.client_timeout(TIMEOUT.total), headers=request_headers) as response:
+                if response.status == 304 and recrawl and recrawl.unchanged(url, previous, response.status):
+                    return DetailsRecord(**previous)
                 if response.status >= 400:
                     continue
                 
                 content_type = response.headers.get('Content-Type', '').lower()
                 if 'text/html' not in content_type:
                     continue
+
+                # Another URL already analyzing the same final origin: reuse its row
+                if on_response is not None:
+                    shared = await on_response(response)
+                    if shared is not None:
+                        return DetailsRecord(**{**shared.to_row(), 'domain': domain})
                 
                 html = await response.text(errors='ignore')
                 if len(html) < 100 or '<html' not in html.lower():
                     continue
                 
-                soup = BeautifulSoup(html, 'html.parser')
-                
                 response_headers = {
                     'http_version': f"HTTP/{response.version.major}.{response.version.minor}",
                     'content_encoding': response.headers.get('Content-Encoding', ''),
@@ -308,88 +384,191 @@ async def fetch_url(session, url, selenium_driver=None):
                     'x-frame-options': response.headers.get('X-Frame-Options', ''),
                     'access-control-allow-origin': response.headers.get('Access-Control-Allow-Origin', '')
                 }
-                
+
+                # Same page and same detail-relevant headers as last run: reuse the stored row
+                body_hash = page_hash(html, *sorted(response_headers.items()))
+                if recrawl and recrawl.unchanged(url, previous, response.status, body_hash):
+                    return DetailsRecord(**previous)
+
+                soup = parse_html(html)
                 details = extract_technical_details(soup, response_headers)
+                soup.decompose()  # breaks the tree's reference cycles so it is freed right away
                 details['domain'] = domain
+                if recrawl:
+                    recrawl.remember(url, response.headers, body_hash)
                 return details
                 
         except Exception:
             if attempt == RETRIES:
                 break
-            await asyncio.sleep(1 + attempt)
+            await asyncio.sleep(min(1 + attempt, deadline.remaining()))
     
     # If aiohttp failed, try with Selenium if available
-    if selenium_driver is not None:
+    if selenium_driver is not None and not deadline.expired():
+        deadline.mark("render")
         for attempt in range(SELENIUM_RETRIES + 1):
             try:
-                details = await fetch_with_selenium(selenium_driver, url)
-                if details is not None:
-                    return details
-            except Exception:
-                if attempt == SELENIUM_RETRIES:
+                return await fetch_with_selenium(selenium_driver, url, deadline)
+            except BudgetExhausted:
+                break
+            except Exception as e:
+                print(f"Selenium failed for {url}: {str(e)}")
+                if attempt == SELENIUM_RETRIES or deadline.expired():
                     break
-                time.sleep(1 + attempt)
+                await asyncio.sleep(min(1 + attempt, deadline.remaining()))
     
     return None
 
 
-async def process_batch(batch_urls):
-    connector = aiohttp.TCPConnector(limit=CONCURRENT_REQUESTS)
-    async with aiohttp.ClientSession(connector=connector) as session:
+def result_row(result, deadline=None):
+    # (index status, output row or None, error reason or None) for a fetch_url() result;
+    # with the domain's deadline, results reached after the budget ran out are partial
+    exhausted = deadline is not None and deadline.expired()
+    if result is None:
+        return STATUS_FAILED, None, BUDGET_MARKER if exhausted else 'all fetch attempts failed'
+    return (STATUS_PARTIAL if exhausted else STATUS_OK), result.to_row(), None
+
+
+def record_result(index, url, result, deadline=None):
+    state, row, error = result_row(result, deadline)
+    index.record(extract_domain(url), ANALYZER, state, row=row, error=error, ruleset_version=RULESET_VERSION)
+
+
+async def process_batch(batch_urls, index=None, concurrency=CONCURRENT_REQUESTS, recrawl_enabled=RECRAWL,
+                        chromedriver_path=CHROMEDRIVER_PATH, on_result=None, governor=None, egress=None):
+    # Returns (successful records, failed domains), unless on_result(url, result)
+    # takes each result as it finishes; then nothing is kept and both lists are empty
+    successful, failed = [], []
+
+    def collect(url, result):
+        if result is not None:
+            successful.append(result)
+        else:
+            failed.append(extract_domain(url))
+
+    on_result = on_result or collect
+    scheduler = HostScheduler()
+    share = OriginShare(index, ANALYZER)
+    batch_urls = await scheduler.plan(priority.plan(index, ANALYZER, batch_urls, key=extract_domain))
+    connector = {"limit": concurrency, "ttl_dns_cache": 300}
+    # No cookie jar: nothing here needs cookies sent back, and a shared jar grows with every domain
+    async with client_session(as_pool(egress), connector, cookie_jar=aiohttp.DummyCookieJar()) as session:
         # Initialize Selenium driver once per batch
-        selenium_driver = init_selenium()
+        selenium_driver = init_selenium(chromedriver_path)
         
-        tasks = [fetch_url(session, url, selenium_driver) for url in batch_urls]
-        results = await asyncio.gather(*tasks)
-        
-        successful = [r for r in results if r is not None]
-        failed = [extract_domain(url) for url, result in zip(batch_urls, results) if result is None]
-        
-        # Clean up Selenium
+        sem = asyncio.Semaphore(concurrency)
+        recrawl = Recrawl(index, ANALYZER, RULESET_VERSION, enabled=recrawl_enabled) if index is not None else None
+
+        async def bounded(url):
+            # The domain budget starts when the URL gets a slot, not while it queues
+            async with scheduler.slot(url), sem:
+                deadline = Deadline(DOMAIN_BUDGET)
+                claim = share.claim(extract_domain(url), deadline)
+                try:
+                    result = await fetch_url(session, url, selenium_driver, deadline, recrawl,
+                                             on_response=claim.on_response)
+                except BaseException:
+                    claim.abandon()
+                    raise
+                claim.finish(result, shareable=result is not None)
+            if index is not None:
+                record_result(index, url, result, deadline)
+                index.record_history(extract_domain(url), ANALYZER, deadline.elapsed(), result is not None,
+                                     rendered="render" in deadline.stages)
+            return url, result
+
         try:
-            selenium_driver.quit()
-        except Exception:
-            pass
+            await run_windowed(batch_urls, bounded, concurrency * WINDOW_FACTOR,
+                               lambda item: on_result(*item), governor)
+        finally:
+            # Clean up Selenium
+            try:
+                selenium_driver.quit()
+            except Exception:
+                pass
+        print(f"Host scheduling: {scheduler.stats()}")
+        print(f"Redirect sharing: {share.stats()}")
         
         return successful, failed
 
-async def main(batch_start, batch_end):
-    with open(INPUT_FILE) as f:
+def load_urls(filename=INPUT_FILE, start=BATCH_START, end=BATCH_END):
+    with open(filename) as f:
         urls = [line.strip() for line in f if line.strip()]
-        urls = [url if url.startswith(('http://', 'https://')) else f'http://{url}' for url in urls]
-    
-    batch_urls = urls[batch_start:batch_end]
+    return [url if url.startswith(('http://', 'https://')) else f'http://{url}' for url in urls[start:end]]
+
+
+def log_failed(failed_file, domains):
+    file_exists = os.path.exists(failed_file) and os.path.getsize(failed_file) > 0
+    with open(failed_file, 'a') as f:
+        if not file_exists:
+            f.write('domain\n')
+        f.write('\n'.join(domains) + '\n')
+
+
+async def scan_async(batch_urls, output_file=OUTPUT_FILE, fmt=OUTPUT_FORMAT, index_path=RESULT_DB,
+                     skip_completed=SKIP_COMPLETED, failed_file=FAILED_DOMAINS_FILE,
+                     memory_budget_mb=MEMORY_BUDGET_MB, **options):
+    # Options go to process_batch (concurrency, recrawl_enabled, chromedriver_path, egress).
+    # Rows and failures are written as each URL finishes, so memory does not grow with the batch.
+    batch_urls = [url if url.startswith(('http://', 'https://')) else f'http://{url}' for url in batch_urls]
+    index = ResultIndex(index_path)
+    index.register(ANALYZER, DESIRED_COLUMNS)
+    if skip_completed:
+        todo = set(index.pending(ANALYZER, [extract_domain(u) for u in batch_urls], RULESET_VERSION))
+        batch_urls = [u for u in batch_urls if extract_domain(u) in todo]
+    if not batch_urls:
+        index.close()
+        return {"domains": 0, "ok": 0, "failed": 0}
+
+    governor = MemoryGovernor(memory_budget_mb)
+    counts = {"domains": len(batch_urls), "ok": 0, "failed": 0}
+    sink = None
+
+    def on_result(url, record):
+        nonlocal sink
+        if record is None:
+            counts["failed"] += 1
+            log_failed(failed_file, [extract_domain(url)])
+            return
+        counts["ok"] += 1
+        if sink is None:
+            sink = open_sink(output_file, DESIRED_COLUMNS, fmt, blob_columns=BLOB_COLUMNS)
+        sink.write_row(record.to_row())
+
+    try:
+        await process_batch(batch_urls, index, on_result=on_result, governor=governor, **options)
+    finally:
+        if sink is not None:
+            sink.close()
+        index.close()
+    print(f"Memory: {governor.stats()}")
+    return counts
+
+
+def scan(batch_urls, **options):
+    # Library entry point; domains or URLs, see scan_async for the options
+    return asyncio.run(scan_async(batch_urls, **options))
+
+
+async def main(batch_start, batch_end):
+    warnings.filterwarnings("ignore")
+    batch_urls = load_urls(INPUT_FILE, batch_start, batch_end)
     if not batch_urls:
         print("No URLs in batch range")
         return
 
     start_time = time.time()
-    successful, failed = await process_batch(batch_urls)
-    
-    # Write successful results
-    if successful:
-        file_exists = os.path.exists(OUTPUT_FILE) and os.path.getsize(OUTPUT_FILE) > 0
-        with open(OUTPUT_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=DESIRED_COLUMNS)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerows(successful)
-    
-    # Write failed domains
-    if failed:
-        file_exists = os.path.exists(FAILED_DOMAINS_FILE) and os.path.getsize(FAILED_DOMAINS_FILE) > 0
-        with open(FAILED_DOMAINS_FILE, 'a') as f:
-            if not file_exists:
-                f.write('domain\n')
-            f.write('\n'.join(failed) + '\n')
+    summary = await scan_async(batch_urls)
     
     elapsed = time.time() - start_time
-    print(f"Processed {len(batch_urls)} domains in {elapsed:.2f}s")
-    print(f"Success: {len(successful)}, Failed: {len(failed)}")
+    print(f"Processed {summary['domains']} domains in {elapsed:.2f}s")
+    print(f"Success: {summary['ok']}, Failed: {summary['failed']}")
+    print(f"Blocked requests: {metrics['blocked_requests']}")
+    print(f"Hedged requests: {HEDGER.stats()}")
 
 if __name__ == '__main__':
     
     try:
         asyncio.run(main(BATCH_START, BATCH_END))
     except KeyboardInterrupt:
-        print("\nStopped by user")
\ No newline at end of file
+        print("\nStopped by user")
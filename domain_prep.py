@@ -0,0 +1,139 @@
+import argparse
+import csv
+import heapq
+import os
+import tempfile
+from itertools import groupby
+
+# --- Domain list preparation ---
+# Normalizes newdomains.txt style lists (scheme, case, www., path, port, IDNA),
+# removes duplicates with an external sort so lists of tens of millions fit in
+# bounded memory, and writes the canonical list plus an alias map. After a
+# scan, fan_out_results() copies each canonical result to its aliases.
+
+CANONICAL_FILE = "canonical_domains.txt"
+ALIAS_FILE = "domain_aliases.csv"
+CHUNK_LINES = 1_000_000  # entries sorted in memory per run file
+
+
+def normalize(entry):
+    # -> (dedup key, host to scan) or None for entries that are not a hostname
+    host = entry.strip().lower()
+    if "://" in host:
+        host = host.split("://", 1)[1]
+    host = host.split("/", 1)[0].split("?", 1)[0].split("#", 1)[0]
+    host = host.rsplit("@", 1)[-1]  # drop credentials
+    if host.startswith("["):
+        return None  # IPv6 literal
+    host = host.split(":", 1)[0].strip(".")
+    if not host.isascii():
+        try:
+            host = host.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    if "." not in host or " " in host or "\t" in host:
+        return None
+    key = host[4:] if host.startswith("www.") else host
+    return key, host
+
+
+def _write_run(lines, tmpdir, runs):
+    lines.sort()
+    path = os.path.join(tmpdir, f"run-{len(runs)}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    runs.append(path)
+
+
+def prepare(input_path, canonical_path=CANONICAL_FILE, alias_path=ALIAS_FILE, chunk_lines=CHUNK_LINES):
+    stats = {"entries": 0, "rejected": 0, "canonical": 0, "aliases": 0}
+    with tempfile.TemporaryDirectory(prefix="domain_prep-") as tmpdir:
+        runs, lines = [], []
+        with open(input_path, encoding="utf-8", errors="ignore") as f:
+            for seq, raw in enumerate(f):
+                raw = raw.strip().replace("\t", " ")
+                if not raw:
+                    continue
+                stats["entries"] += 1
+                normalized = normalize(raw)
+                if normalized is None:
+                    stats["rejected"] += 1
+                    continue
+                key, host = normalized
+                # Zero-padded position keeps the first spelling of each site first after sorting
+                lines.append(f"{key}\t{seq:012d}\t{host}\t{raw}\n")
+                if len(lines) >= chunk_lines:
+                    _write_run(lines, tmpdir, runs)
+                    lines = []
+        if lines:
+            _write_run(lines, tmpdir, runs)
+        lines = None
+
+        files = [open(path, encoding="utf-8") for path in runs]
+        try:
+            with open(canonical_path, "w", encoding="utf-8") as out, \
+                    open(alias_path, "w", newline="", encoding="utf-8") as aliases:
+                writer = csv.writer(aliases)
+                writer.writerow(["alias", "canonical"])
+                merged = (line.rstrip("\n").split("\t", 3) for line in heapq.merge(*files))
+                for _, group in groupby(merged, key=lambda parts: parts[0]):
+                    first = next(group)
+                    canonical = first[2]
+                    out.write(canonical + "\n")
+                    stats["canonical"] += 1
+                    seen = {canonical}
+                    for _, _, _, raw in [first, *group]:
+                        if raw not in seen:
+                            seen.add(raw)
+                            writer.writerow([raw, canonical])
+                            stats["aliases"] += 1
+        finally:
+            for f in files:
+                f.close()
+    return stats
+
+
+def fan_out_results(index, analyzer, alias_path=ALIAS_FILE):
+    # Copies each canonical domain's stored result to every alias of it
+    domain_column = index.columns(analyzer)[0]
+    copied = 0
+    with open(alias_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            entry = index.get(row["canonical"], analyzer)
+            if entry is None:
+                continue
+            data = entry["data"]
+            if data is not None:
+                data = {**data, domain_column: row["alias"]}
+            index.record(row["alias"], analyzer, entry["status"], row=data,
+                         error=entry["error"], ruleset_version=entry["ruleset_version"])
+            copied += 1
+    index.flush()
+    return copied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Normalize and deduplicate domain lists")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prep = sub.add_parser("normalize", help="write the canonical list and alias map")
+    prep.add_argument("input")
+    prep.add_argument("--out", default=CANONICAL_FILE)
+    prep.add_argument("--aliases", default=ALIAS_FILE)
+    fan = sub.add_parser("fanout", help="copy canonical results to their aliases in the result index")
+    fan.add_argument("analyzer")
+    fan.add_argument("--aliases", default=ALIAS_FILE)
+    args = parser.parse_args(argv)
+
+    if args.command == "normalize":
+        print(prepare(args.input, args.out, args.aliases))
+    else:
+        from result_index import ResultIndex
+        index = ResultIndex()
+        try:
+            print(f"Copied {fan_out_results(index, args.analyzer, args.aliases)} results to aliases")
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import http.client
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from functools import partial
+from urllib.parse import urlsplit
+
+# --- Egress address pool ---
+# Spreads outgoing connections over several local source addresses (e.g.
+# extra IPs or loopback aliases bound on this machine) or local proxy
+# endpoints, so a high-concurrency run is not limited by one address's
+# ephemeral ports or by per-IP throttling at large CDNs. Each host always
+# leaves through the same endpoint (rendezvous hashing), so keep-alive
+# connections still get reused. Endpoints that are being throttled are rested
+# for a while, and only their hosts move elsewhere. Only throttling statuses and
+# refused/reset connections count against an endpoint: timeouts, DNS failures
+# of dead domains and cancellations (hedge losers, deadlines) say nothing about it.
+#
+#   EGRESS_ENDPOINTS="10.0.0.11,10.0.0.12,http://127.0.0.1:3128" python scanners.py meta ...
+#   python scanners.py meta newdomains.txt --egress 127.0.0.2,127.0.0.3
+
+EGRESS_ENDPOINTS = [e.strip() for e in os.environ.get("EGRESS_ENDPOINTS", "").split(",") if e.strip()]
+THROTTLE_STATUSES = {429, 503}
+HEALTH_WINDOW = 50  # recent outcomes kept per endpoint
+HEALTH_MIN_SAMPLES = 10
+HEALTH_MAX_BAD = 0.3  # share of throttled/failed connections that rests an endpoint
+HEALTH_COOLDOWN = 300  # seconds an unhealthy endpoint is rested before it is tried again
+
+
+class Endpoint:
+    def __init__(self, spec):
+        self.spec = spec
+        if "://" in spec:
+            self.proxy, self.source = spec, None
+        else:
+            self.proxy, self.source = None, spec
+        self.outcomes = deque(maxlen=HEALTH_WINDOW)
+        self.resting_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.rests = 0
+
+    def healthy(self, now):
+        return now >= self.resting_until
+
+
+class EgressPool:
+    def __init__(self, endpoints=None):
+        endpoints = EGRESS_ENDPOINTS if endpoints is None else endpoints
+        self.endpoints = [Endpoint(spec) for spec in endpoints]
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.endpoints)
+
+    def pick(self, host):
+        # Highest-scoring healthy endpoint for this host; if all are resting, the one that recovers first
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.healthy(now)]
+        if not healthy:
+            return min(self.endpoints, key=lambda e: e.resting_until)
+        key = (host or "").lower().encode("utf-8")
+        return max(healthy, key=lambda e: hashlib.blake2b(key + b"\0" + e.spec.encode("utf-8"),
+                                                          digest_size=8).digest())
+
+    def report(self, endpoint, status=None, error=None):
+        # One request outcome: a throttling status or a refused/reset connection counts against the endpoint
+        with self._lock:
+            endpoint.requests += 1
+            if error is not None and not endpoint_error(error):
+                return  # the site's or the caller's doing, not the endpoint's
+            bad = error is not None or status in THROTTLE_STATUSES
+            endpoint.throttled += bad
+            endpoint.outcomes.append(bad)
+            if len(endpoint.outcomes) >= HEALTH_MIN_SAMPLES and \
+                    sum(endpoint.outcomes) > HEALTH_MAX_BAD * len(endpoint.outcomes):
+                endpoint.resting_until = time.monotonic() + HEALTH_COOLDOWN
+                endpoint.outcomes.clear()  # judged afresh after the rest
+                endpoint.rests += 1
+
+    def stats(self):
+        now = time.monotonic()
+        return {e.spec: {"requests": e.requests, "throttled": e.throttled, "rests": e.rests,
+                         "resting": not e.healthy(now)} for e in self.endpoints}
+
+    # --- urllib (blocking callers) ---
+    def urlopen(self, request, timeout=None):
+        endpoint = self.pick(urlsplit(request.full_url).hostname)
+        try:
+            resp = _opener(endpoint).open(request, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            self.report(endpoint, status=e.code)
+            raise
+        except OSError as e:
+            self.report(endpoint, error=e)
+            raise
+        self.report(endpoint, status=resp.status)
+        return resp
+
+
+def endpoint_error(error):
+    # Whether a failed request reflects on the endpoint it left through
+    if isinstance(error, (asyncio.CancelledError, asyncio.TimeoutError, TimeoutError)):
+        return False
+    # aiohttp keeps the socket error in os_error, urllib in reason
+    cause = getattr(error, "os_error", None) or getattr(error, "reason", None) or error.__cause__ or error
+    if isinstance(cause, (socket.gaierror, TimeoutError)):
+        return False
+    return isinstance(cause, (ConnectionRefusedError, ConnectionResetError))
+
+
+_openers = {}
+
+
+def _opener(endpoint):
+    opener = _openers.get(endpoint.spec)
+    if opener is None:
+        if endpoint.proxy:
+            handlers = [urllib.request.ProxyHandler({"http": endpoint.proxy, "https": endpoint.proxy})]
+        else:
+            handlers = [_SourceHTTPHandler(endpoint.source), _SourceHTTPSHandler(endpoint.source)]
+        opener = _openers[endpoint.spec] = urllib.request.build_opener(*handlers)
+    return opener
+
+
+class _SourceHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    def http_open(self, req):
+        return self.do_open(partial(http.client.HTTPConnection, source_address=(self.source, 0)), req)
+
+
+class _SourceHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    def https_open(self, req):
+        return self.do_open(partial(http.client.HTTPSConnection, source_address=(self.source, 0)), req,
+                            context=self._context)
+
+
+# --- aiohttp ---
+class EgressSession:
+    # Stands in for the ClientSession the scrapers pass around: get(), close(), "async with".
+    # One ClientSession per endpoint, created on first use inside the running loop.
+    def __init__(self, pool, connector_kwargs=None, **session_kwargs):
+        self.pool = pool
+        self.connector_kwargs = connector_kwargs or {}
+        self.session_kwargs = session_kwargs
+        self._sessions = {}
+
+    def _session(self, endpoint):
+        session = self._sessions.get(endpoint.spec)
+        if session is None:
+            import aiohttp
+
+            kwargs = dict(self.connector_kwargs)
+            if kwargs.get("limit"):
+                # The caller's limit is for the whole pool, not for each endpoint
+                kwargs["limit"] = -(-kwargs["limit"] // len(self.pool.endpoints))
+            if endpoint.source:
+                kwargs["local_addr"] = (endpoint.source, 0)
+            trace = aiohttp.TraceConfig()
+
+            async def on_end(_session, _ctx, params):
+                self.pool.report(endpoint, status=params.response.status)
+
+            async def on_error(_session, _ctx, params):
+                self.pool.report(endpoint, error=params.exception)
+
+            trace.on_request_end.append(on_end)
+            trace.on_request_exception.append(on_error)
+            session = self._sessions[endpoint.spec] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(**kwargs), trace_configs=[trace], **self.session_kwargs)
+        return session
+
+    def get(self, url, **kwargs):
+        endpoint = self.pool.pick(urlsplit(str(url)).hostname)
+        if endpoint.proxy:
+            kwargs.setdefault("proxy", endpoint.proxy)
+        return self._session(endpoint).get(url, **kwargs)
+
+    @property
+    def closed(self):
+        return all(s.closed for s in self._sessions.values())
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def client_session(pool=None, connector_kwargs=None, **session_kwargs):
+    # A plain ClientSession without a pool (or with an empty one), else an EgressSession
+    if not pool:
+        import aiohttp
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(**(connector_kwargs or {})), **session_kwargs)
+    return EgressSession(pool, connector_kwargs, **session_kwargs)
+
+
+def as_pool(egress):
+    # Accepts an EgressPool, a list of endpoint specs, a comma-separated string or None (environment default)
+    if isinstance(egress, EgressPool):
+        return egress
+    if isinstance(egress, str):
+        egress = [e.strip() for e in egress.split(",") if e.strip()]
+    return EgressPool(egress)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from collections import deque
+
+# --- Hedged requests ---
+# If response headers have not arrived within a recent-TTFB percentile, a second
+# attempt is started; whichever answers first is used and the other is
+# cancelled. Hedges are capped at a fraction of all requests so the extra load
+# stays bounded.
+
+HEDGE_PERCENTILE = 0.95
+HEDGE_WINDOW = 500  # recent TTFB samples kept
+HEDGE_MIN_SAMPLES = 20  # no hedging until the percentile means something
+HEDGE_MIN_DELAY = 0.5  # seconds
+HEDGE_MAX_DELAY = 10.0
+HEDGE_BUDGET_RATIO = 0.05  # at most 5% extra requests
+
+
+class Hedger:
+    def __init__(self, percentile=HEDGE_PERCENTILE, window=HEDGE_WINDOW, budget_ratio=HEDGE_BUDGET_RATIO):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.samples = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record(self, ttfb):
+        self.samples.append(ttfb)
+
+    def delay(self):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        value = ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))]
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, value))
+
+    def _take_budget(self):
+        if self.hedges + 1 > self.budget_ratio * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+    async def _attempt(self, session, url, kwargs):
+        start = time.monotonic()
+        # session.get resolves once the status line and headers are in
+        try:
+            resp = await session.get(url, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Failures (timeouts, resets) are samples too; leaving them out pulls the percentile down
+            self.record(time.monotonic() - start)
+            raise
+        self.record(time.monotonic() - start)
+        return resp
+
+    async def get(self, session, url, **kwargs):
+        # Returns an aiohttp ClientResponse; use it as "async with await hedger.get(...) as resp"
+        self.requests += 1
+        primary = asyncio.ensure_future(self._attempt(session, url, kwargs))
+        try:
+            delay = self.delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._take_budget():
+                    return await self._race(session, url, kwargs, primary)
+            return await primary
+        except BaseException:
+            # Cancelled by the caller (deadline, batch cancel) or failed: asyncio.wait does not pass a
+            # cancellation on, so the attempt is stopped here and a response it still returns is released
+            primary.cancel()
+            primary.add_done_callback(_release_response)
+            raise
+
+    async def _race(self, session, url, kwargs, primary):
+        secondary = asyncio.ensure_future(self._attempt(session, url, kwargs))
+        pending = {primary, secondary}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = task
+                    else:
+                        task.result().release()
+                if winner is not None:
+                    if winner is secondary:
+                        self.hedge_wins += 1
+                    return winner.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_release_response)
+
+    def stats(self):
+        return {"requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+def _release_response(task):
+    # A losing attempt may still complete between cancel() and its next await
+    if not task.cancelled() and task.exception() is None:
+        task.result().release()
+
+
+HEDGER = Hedger()
+
+
+def hedged_get(session, url, enabled=True, **kwargs):
+    # Awaitable ClientResponse either way: "async with await hedged_get(...) as resp"
+    return HEDGER.get(session, url, **kwargs) if enabled else session.get(url, **kwargs)
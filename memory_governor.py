@@ -0,0 +1,126 @@
+import asyncio
+import gc
+import os
+import threading
+import time
+
+# --- Memory governor ---
+# Keeps a run's resident memory flat regardless of batch size. Intake asks
+# admit() before starting the next domain; above the high-water mark of the
+# budget it pauses (after one forced collection) until memory falls back
+# below the low-water mark. Pausing only helps while other work is still in
+# flight, so a caller with nothing in flight is always let through instead of
+# waiting on memory the allocator will not hand back.
+
+MEMORY_BUDGET_MB = 4096  # None or 0 disables backpressure; RSS is still reported
+HIGH_WATER = 0.85  # share of the budget at which intake pauses
+LOW_WATER = 0.70  # share of the budget at which it resumes
+CHECK_INTERVAL = 0.5  # seconds between RSS readings while paused
+SAMPLE_EVERY = 0.1  # RSS is re-read at most this often while admitting
+WINDOW_FACTOR = 4  # tasks kept alive per concurrency slot (see run_windowed)
+
+
+def rss_bytes():
+    # Current resident set size, or None when it cannot be read on this platform
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class MemoryGovernor:
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, high=HIGH_WATER, low=LOW_WATER, interval=CHECK_INTERVAL):
+        self.budget = budget_mb * 1024 * 1024 if budget_mb else None
+        self.high = high
+        self.low = low
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sampled_at = 0.0
+        self._rss = 0
+        self.peak = 0
+        self.pauses = 0
+        self.paused_seconds = 0.0
+
+    def rss(self, fresh=False):
+        now = time.monotonic()
+        with self._lock:
+            if fresh or now - self._sampled_at >= SAMPLE_EVERY:
+                self._rss = rss_bytes() or 0
+                self._sampled_at = now
+                self.peak = max(self.peak, self._rss)
+            return self._rss
+
+    def _over(self, share, fresh=False):
+        return self.budget is not None and self.rss(fresh) > share * self.budget
+
+    def _start_pause(self):
+        gc.collect()
+        with self._lock:
+            self.pauses += 1
+        return time.monotonic()
+
+    def _end_pause(self, started):
+        with self._lock:
+            self.paused_seconds += time.monotonic() - started
+
+    async def admit(self, busy=None):
+        # busy() -> number of tasks still running; pausing stops once it reaches zero
+        if not self._over(self.high):
+            return
+        started = self._start_pause()
+        try:
+            while self._over(self.low, fresh=True) and (busy is None or busy() > 0):
+                await asyncio.sleep(self.interval)
+        finally:
+            self._end_pause(started)
+
+    def admit_blocking(self, busy=None):
+        # Thread-pool variant of admit()
+        if not self._over(self.high):
+            return
+        started = self._start_pause()
+        try:
+            while self._over(self.low, fresh=True) and (busy is None or busy() > 0):
+                time.sleep(self.interval)
+        finally:
+            self._end_pause(started)
+
+    def stats(self):
+        mb = 1024 * 1024
+        return {"rss_mb": round(self.rss(fresh=True) / mb), "peak_mb": round(self.peak / mb),
+                "budget_mb": round(self.budget / mb) if self.budget else None,
+                "pauses": self.pauses, "paused_seconds": round(self.paused_seconds, 1)}
+
+
+async def run_windowed(items, worker, window, on_result, governor=None):
+    # Like gather(*(worker(i) for i in items)), but only `window` tasks exist at a
+    # time and each result is handed to on_result as soon as it finishes
+    # (completion order), so neither tasks nor results pile up over a long run
+    in_flight = set()
+
+    def busy():
+        return sum(not task.done() for task in in_flight)
+
+    async def drain(until):
+        nonlocal in_flight
+        while len(in_flight) > until:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                on_result(task.result())
+
+    try:
+        for item in items:
+            if governor is not None:
+                await governor.admit(busy)
+            await drain(window - 1)
+            in_flight.add(asyncio.ensure_future(worker(item)))
+        await drain(0)
+    finally:
+        for task in in_flight:
+            task.cancel()
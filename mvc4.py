@@ -1,9 +1,20 @@
 import asyncio
-import csv
-from aiohttp import ClientSession, ClientTimeout
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright
+from aiohttp import ClientSession, ClientTimeout, DummyCookieJar
 import re
+from block_profiles import install_playwright_blocking
+from deadline import Deadline, BudgetExhausted, BUDGET_MARKER, DOMAIN_BUDGET
+from egress import as_pool, client_session
+from hedging import HEDGER, hedged_get
+from memory_governor import MemoryGovernor, MEMORY_BUDGET_MB, WINDOW_FACTOR, run_windowed
+from output_sinks import open_sink
+from result_index import ResultIndex, RESULT_DB, STATUS_OK, STATUS_PARTIAL, STATUS_FAILED
+from records import SignalSet, Source
+from recrawl import Recrawl, page_hash
+from politeness import HostScheduler
+import priority
+from redirect_share import OriginShare, REDIRECT_MARKER
+from template_cache import TemplateCache, TEMPLATE_MIN_FEATURES, fingerprint
+from urllib.parse import urlsplit
 
 # --- Settings ---
 HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36",
@@ -13,6 +24,18 @@ HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/
 
 TIMEOUT = ClientTimeout(total=60)
 CONCURRENCY = 10
+BLOCK_PROFILE = "framework"  # See block_profiles.BLOCK_PROFILES
+HEDGE_REQUESTS = True  # Hedge the main-page fetch on slow TTFB (see hedging.py)
+OUTPUT_FILE = "mvc_frameworks7.csv"
+OUTPUT_FORMAT = "csv"  # csv, jsonl.zst, parquet or arrow (see output_sinks.py)
+OUTPUT_COLUMNS = ["Domain", "Frameworks", "Sources"]
+BLOB_COLUMNS = ["Sources"]  # large values go to the blob store (see blob_store.py)
+ANALYZER = "mvc4"  # key in the result index (see result_index.py)
+RULESET_VERSION = "1"  # bump when FRAMEWORK_HINTS or the probes change
+SKIP_COMPLETED = False  # only scan domains without a current result in the index
+RECRAWL = False  # reuse stored results for pages that are unchanged since the last run (see recrawl.py)
+TEMPLATE_CACHE = True  # skip probes/rendering on known page templates (see template_cache.py)
+KEEPALIVE_TIMEOUT = 30  # keep idle connections for the error/common-path probes that follow a page fetch
 batch_start = 0
 batch_end = 200
 
@@ -234,7 +257,112 @@ WEAK_PATH_DEPENDENCIES = {
 
 COMMON_PATHS = ["/login", "/admin", "/dashboard", "/user"]
 
+# --- Network capture (Playwright responses) ---
+CAPTURE_TYPES = {"script", "xhr", "fetch"}
+CAPTURE_MIME = re.compile(r"javascript|ecmascript|json", re.I)
+CAPTURE_SKIP_URLS = re.compile(r"google|gstatic|doubleclick|akamai|fonts|facebook\.com/tr", re.I)
+CAPTURE_MAX_BYTES = 300000
+# --- Batched in-page detection ---
+PLAYWRIGHT_DOM_HINTS = [
+    ("data-reactroot", "React"),
+    ("__react_devtools", "React"),
+    ("data-v-", "Vue.js"),
+    ("vue-component", "Vue.js"),
+    ("ng-app", "AngularJS"),
+    ("ng-version", "AngularJS"),
+    ("data-svelte", "Svelte"),
+    ("id=\"__nuxt\"", "Nuxt.js"),
+    ("data-gatsby", "Gatsby"),  # Added Gatsby
+    ("blazor-id", "Blazor")  # Added Blazor
+]
+
+PLAYWRIGHT_SCRIPT_KEYS = [
+    ("react", "React"),
+    ("vue", "Vue.js"),
+    ("angular", "AngularJS"),
+    ("svelte", "Svelte"),
+    ("next", "Next.js"),
+    ("nuxt", "Nuxt.js"),
+    ("blazor", "Blazor"),  # Added Blazor
+    ("gatsby", "Gatsby"),  # Added Gatsby
+    ("phoenix", "Phoenix"),
+    ("rails-ujs", "Ruby on Rails")
+]
+# (src pattern, text pattern, framework); compiled in the page with new RegExp
+PLAYWRIGHT_SCRIPT_PATTERNS = [(rf"\\b{key}[\\./-]", rf"\\b{key}[\\(\s]", fw) for key, fw in PLAYWRIGHT_SCRIPT_KEYS]
+PLAYWRIGHT_SKIP_SRC = ["google", "gstatic", "googletagmanager", "doubleclick", "akamai", "fonts"]
+
+PLAYWRIGHT_GLOBALS = {
+    "React": "React",
+    "__REACT_DEVTOOLS_GLOBAL_HOOK__": "React",
+    "Vue": "Vue.js",
+    "__VUE__": "Vue.js",
+    "angular": "AngularJS",
+    "__NEXT_DATA__": "Next.js",
+    "__NUXT__": "Nuxt.js",
+    "Ember": "Ember.js",
+    "Backbone": "Backbone.js",
+    "ko": "Knockout.js",
+    "Blazor": "Blazor",
+    "Alpine": "Alpine.js",
+    "Stimulus": "Stimulus",
+    "Meteor": "Meteor",
+    "___gatsby": "Gatsby"
+}
+
+PAGE_SIGNALS_SCRIPT = """
+(args) => {
+    const html = document.documentElement ? document.documentElement.outerHTML : "";
+    const lower = html.toLowerCase();
+    const out = {dom: [], scripts: [], globals: []};
+
+    for (const tag of args.domTags) {
+        if (lower.indexOf(tag) === -1) continue;
+        const at = html.indexOf(tag);
+        let snippet = "";
+        if (at !== -1) {
+            const start = html.lastIndexOf("\\n", at) + 1;
+            let end = html.indexOf("\\n", at);
+            if (end === -1) end = html.length;
+            snippet = html.slice(start, end).trim().slice(0, 150);
+        }
+        out.dom.push([tag, snippet]);
+    }
+
+    const patterns = args.scriptPatterns.map(([s, t]) => [new RegExp(s), new RegExp(t)]);
+    for (const el of document.querySelectorAll("script")) {
+        const src = (el.getAttribute("src") || "").toLowerCase();
+        if (args.skipSrc.some((x) => src.includes(x))) continue;
+        if (src.startsWith("data:") || src.includes("base64")) continue;
+        const text = (el.textContent || "").toLowerCase();
+        patterns.forEach(([srcRe, textRe], i) => {
+            if (srcRe.test(src) || textRe.test(text)) out.scripts.push([i, (src || text).slice(0, 80)]);
+        });
+    }
+
+    for (const name of args.globals) {
+        try {
+            if (window[name] !== undefined && window[name] !== null) out.globals.push(name);
+        } catch (e) {}
+    }
+    return out;
+}
+"""
+
+BODY_HINTS = {
+    "react.createelement": "React",
+    "__react_devtools": "React",
+    "new vue(": "Vue.js",
+    "angular.module": "AngularJS",
+    "ng-version": "AngularJS",
+    "__next_data__": "Next.js",
+    "__nuxt__": "Nuxt.js",
+    "blazor.start": "Blazor",
+    "__meteor_runtime_config__": "Meteor"
+}
+
 failed_domains = []
+metrics = {"blocked_requests": 0}
 
 def extract_snippet(tag: str, html: str, max_len: int = 150) -> str:
     for line in html.splitlines():
@@ -242,117 +370,133 @@ def extract_snippet(tag: str, html: str, max_len: int = 150) -> str:
             return line.strip()[:max_len]
     return ""
 
-async def detect_with_playwright(url):
-    frameworks = {}
-    signals = {}
+async def _page_signals(browser, url, deadline, signals):
+    context = await browser.new_context()
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            # Capture network responses
-            async def handle_response(response):
-                headers = {k.lower(): v.lower() for k, v in response.headers.items()}
-                for key, fw in FRAMEWORK_HINTS.get("headers", {}).items():
-                    if key in headers:
-                        if isinstance(fw, dict):
-                            for hint, name in fw.items():
-                                if hint in headers[key]:
-                                    signals.setdefault(name, []).append(f"playwright:header:{key},line:{headers[key]}")
-                        else:
-                            signals.setdefault(fw, []).append(f"playwright:header:{key}")
-            
-            page.on("response", handle_response)
-            
-            await page.goto(url, timeout=30000, wait_until="domcontentloaded")
-            await page.wait_for_timeout(2000)
-
-            content = await page.content()
-            body = content.lower()
-            scripts = await page.query_selector_all('script')
-
-            # DOM-based detection
-            for tag, fw in [
-                ("data-reactroot", "React"),
-                ("__react_devtools", "React"),
-                ("data-v-", "Vue.js"),
-                ("vue-component", "Vue.js"),
-                ("ng-app", "AngularJS"),
-                ("ng-version", "AngularJS"),
-                ("data-svelte", "Svelte"),
-                ("id=\"__nuxt\"", "Nuxt.js"),
-                ("data-gatsby", "Gatsby"),  # Added Gatsby
-                ("blazor-id", "Blazor")  # Added Blazor
-            ]:
-                if tag in body:
-                    signals.setdefault(fw, []).append(f"playwright:dom,line:{extract_snippet(tag, content)}")
-
-            # Script-based検出
-            for s in scripts:
-                src = await s.get_attribute("src") or ""
-                src = src.lower()
-                text = (await s.inner_text() or "").lower()
-
-                if any(x in src for x in ["google", "gstatic", "googletagmanager", "doubleclick", "akamai", "fonts"]):
-                    continue
-                if src.startswith("data:") or "base64" in src:
-                    continue
-
-                for key, fw in [
-                    ("react", "React"),
-                    ("vue", "Vue.js"),
-                    ("angular", "AngularJS"),
-                    ("svelte", "Svelte"),
-                    ("next", "Next.js"),
-                    ("nuxt", "Nuxt.js"),
-                    ("blazor", "Blazor"),  # Added Blazor
-                    ("gatsby", "Gatsby"),  # Added Gatsby
-                    ("phoenix", "Phoenix"),
-                    ("rails-ujs", "Ruby on Rails")
-                ]:
-                    if re.search(rf"\\b{key}[\\./-]", src) or re.search(rf"\\b{key}[\\(\s]", text):
-                        signals.setdefault(fw, []).append(f"playwright:script,line:{(src or text)[:80]}")
-
-            # Console log detection
-            async def handle_console(msg):
-                text = msg.text.lower()
-                for fw, hints in WEAK_PATH_DEPENDENCIES.items():
-                    for hint in hints:
-                        if hint in text:
-                            signals.setdefault(fw, []).append(f"playwright:console,line:{text[:80]}")
-
-            page.on("console", handle_console)
-            await page.evaluate("console.log('Checking for framework errors')")
-
-            for fw, s_list in signals.items():
-                if len(s_list) >= 1:
-                    frameworks[fw] = ";".join(s_list)
-
-            await browser.close()
+        await install_playwright_blocking(context, BLOCK_PROFILE, metrics)
+        page = await context.new_page()
+        # Capture network responses
+        async def handle_response(response):
+            headers = {k.lower(): v.lower() for k, v in response.headers.items()}
+            for key, fw in FRAMEWORK_HINTS.get("headers", {}).items():
+                if key in headers:
+                    if isinstance(fw, dict):
+                        for hint, name in fw.items():
+                            if hint in headers[key]:
+                                signals.add(name, Source.PLAYWRIGHT_HEADER, key, headers[key])
+                    else:
+                        signals.add(fw, Source.PLAYWRIGHT_HEADER, key)
+
+            # Script/XHR bodies are read from the browser's own response, never re-downloaded
+            if response.request.resource_type not in CAPTURE_TYPES:
+                return
+            if not CAPTURE_MIME.search(headers.get("content-type", "")) or CAPTURE_SKIP_URLS.search(response.url):
+                return
+            length = headers.get("content-length", "")
+            if length.isdigit() and int(length) > CAPTURE_MAX_BYTES * 10:
+                return
+            try:
+                body = (await response.body())[:CAPTURE_MAX_BYTES].decode("utf-8", errors="ignore").lower()
+            except Exception:
+                return
+            for hint, fw in BODY_HINTS.items():
+                if hint in body:
+                    signals.add(fw, Source.PLAYWRIGHT_NETWORK, hint, response.url[:80])
+        
+        page.on("response", handle_response)
+        
+        # Playwright reads a timeout of 0 as "no limit", so a spent budget still gets 1 ms
+        await page.goto(url, timeout=max(1, deadline.timeout(30) * 1000), wait_until="domcontentloaded")
+        await page.wait_for_timeout(deadline.timeout(2) * 1000)
+
+        # DOM tags, script src/text and framework globals in one evaluate call
+        batch = await page.evaluate(PAGE_SIGNALS_SCRIPT, {
+            "domTags": [tag for tag, _ in PLAYWRIGHT_DOM_HINTS],
+            "scriptPatterns": [[src_re, text_re] for src_re, text_re, _ in PLAYWRIGHT_SCRIPT_PATTERNS],
+            "skipSrc": PLAYWRIGHT_SKIP_SRC,
+            "globals": list(PLAYWRIGHT_GLOBALS),
+        })
+
+        dom_frameworks = dict(PLAYWRIGHT_DOM_HINTS)
+        for tag, snippet in batch["dom"]:
+            signals.add(dom_frameworks[tag], Source.PLAYWRIGHT_DOM, line=snippet)
+
+        for index, line in batch["scripts"]:
+            fw = PLAYWRIGHT_SCRIPT_PATTERNS[index][2]
+            signals.add(fw, Source.PLAYWRIGHT_SCRIPT, line=line)
+
+        for name in batch["globals"]:
+            signals.add(PLAYWRIGHT_GLOBALS[name], Source.PLAYWRIGHT_GLOBAL, line=f"window.{name}")
+
+        # Console log detection
+        async def handle_console(msg):
+            text = msg.text.lower()
+            for fw, hints in WEAK_PATH_DEPENDENCIES.items():
+                for hint in hints:
+                    if hint in text:
+                        signals.add(fw, Source.PLAYWRIGHT_CONSOLE, line=text[:80])
+
+        page.on("console", handle_console)
+        await page.evaluate("console.log('Checking for framework errors')")
+    finally:
+        await context.close()
+
+async def detect_with_playwright(url, deadline=None, browser=None):
+    # Renders in the given (already running) browser, or launches one for this URL; None if rendering failed
+    deadline = deadline or Deadline()
+    found = []
+    signals = SignalSet()
+    try:
+        if browser is not None:
+            await _page_signals(browser, url, deadline, signals)
+        else:
+            from playwright.async_api import async_playwright  # only needed without a warm browser
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=True)
+                await _page_signals(browser, url, deadline, signals)
+                await browser.close()
+        found = list(signals)
     except Exception as e:
         failed_domains.append((url, f"Playwright error: {repr(e)}"))
-    return frameworks
+        return None
+    return found
 
 # --- Updated fetch() Function ---
-async def fetch(session: ClientSession, domain: str) -> tuple:
-    fw_signals = {}
+async def fetch(session: ClientSession, domain: str, deadline: Deadline = None, recrawl: Recrawl = None,
+                browser=None, on_response=None, templates=None) -> tuple:
+    deadline = deadline or Deadline()
+    fw_signals = SignalSet()
+    previous = recrawl.previous(domain) if recrawl else None
     base_urls = [f"https://{domain}", f"http://{domain}"] if not domain.startswith("http") else [domain]
 
     for url in base_urls:
         try:
-            async with session.get(url, headers=HEADERS) as res:
+            request_headers = recrawl.headers(url, HEADERS, previous) if recrawl else HEADERS
+            async with await hedged_get(session, url, enabled=HEDGE_REQUESTS, headers=request_headers,
+                                        timeout=deadline.client_timeout(TIMEOUT.total)) as res:
+                # Another domain already analyzing the same final origin: reuse its result
+                if on_response is not None:
+                    shared = await on_response(res)
+                    if shared is not None:
+                        return shared
                 text = await res.text()
                 headers = {k.lower(): v.lower() for k, v in res.headers.items()}
 
+                # Unchanged page (304 or same hash of body, hinted headers and cookie names): reuse the last result
+                body_hash = page_hash(text, *(headers.get(k, "") for k in FRAMEWORK_HINTS["headers"]), *sorted(res.cookies))
+                if recrawl and recrawl.unchanged(url, previous, res.status, body_hash):
+                    status = "Framework detected" if previous["Frameworks"] else "No framework detected"
+                    return domain, previous["Frameworks"], previous["Sources"], f"{status} (unchanged)"
+
                 # Header detection
                 for key, fw in FRAMEWORK_HINTS.get("headers", {}).items():
                     if key in headers:
                         if isinstance(fw, dict):
                             for hint, name in fw.items():
                                 if hint in headers[key]:
-                                    fw_signals.setdefault(name, []).append(f"header:{key},line:{headers[key]}")
+                                    fw_signals.add(name, Source.HEADER, key, headers[key])
                         else:
-                            fw_signals.setdefault(fw, []).append(f"header:{key}")
+                            fw_signals.add(fw, Source.HEADER, key)
 
                 # Cookie detection
                 for cookie in res.cookies.values():
@@ -360,10 +504,11 @@ async def fetch(session: ClientSession, domain: str) -> tuple:
                         ck = cookie.key.lower()
                         for name, fw in FRAMEWORK_HINTS.get("cookies", {}).items():
                             if name in ck:
-                                fw_signals.setdefault(fw, []).append(f"cookie:{name},line:{cookie.key}={cookie.value}")
+                                fw_signals.add(fw, Source.COOKIE, name, f"{cookie.key}={cookie.value}")
                     except AttributeError:
                         continue
 
+                from bs4 import BeautifulSoup  # imported on first parse, not at module import
                 soup = BeautifulSoup(text, "html.parser")
                 body = text.lower()
 
@@ -373,12 +518,12 @@ async def fetch(session: ClientSession, domain: str) -> tuple:
                         content = meta.get("content", "").lower()
                         for key, fw in FRAMEWORK_HINTS.get("meta", {}).get("generator", {}).items():
                             if key in content:
-                                fw_signals.setdefault(fw, []).append(f"meta:generator,line:{content}")
+                                fw_signals.add(fw, Source.META, "generator", content)
 
                 # HTML hints
                 for tag, fw in FRAMEWORK_HINTS.get("html", {}).items():
                     if tag in body:
-                        fw_signals.setdefault(fw, []).append(f"html:{tag},line:{extract_snippet(tag, text)}")
+                        fw_signals.add(fw, Source.HTML, tag, extract_snippet(tag, text))
 
                 # Script tags
                 for script in soup.find_all("script"):
@@ -387,15 +532,15 @@ async def fetch(session: ClientSession, domain: str) -> tuple:
                     if src:
                         for pattern, fw in FRAMEWORK_HINTS.get("scripts", {}).items():
                             if re.search(pattern, src):
-                                fw_signals.setdefault(fw, []).append(f"script:{pattern},line:{src}")
+                                fw_signals.add(fw, Source.SCRIPT, pattern, src)
                     else:
                         lowered = script_text.lower()
                         if "react.createelement" in lowered:
-                            fw_signals.setdefault("React", []).append(f"script:inline,line:{script_text.strip()[:80]}")
+                            fw_signals.add("React", Source.SCRIPT, "inline", script_text.strip()[:80])
                         elif "new vue" in lowered or "vue(" in lowered:
-                            fw_signals.setdefault("Vue.js", []).append(f"script:inline,line:{script_text.strip()[:80]}")
+                            fw_signals.add("Vue.js", Source.SCRIPT, "inline", script_text.strip()[:80])
                         elif "angular.module" in lowered:
-                            fw_signals.setdefault("Angular", []).append(f"script:inline,line:{script_text.strip()[:80]}")
+                            fw_signals.add("Angular", Source.SCRIPT, "inline", script_text.strip()[:80])
 
                 # Path hints
                 for tag in soup.find_all(["script", "link", "img"]):
@@ -404,122 +549,226 @@ async def fetch(session: ClientSession, domain: str) -> tuple:
                         if val:
                             for path, fw in FRAMEWORK_HINTS.get("paths", {}).items():
                                 if path in val:
-                                    fw_signals.setdefault(fw, []).append(f"path:{path},line:{val}")
+                                    fw_signals.add(fw, Source.PATH, path, val)
+                # Last use of the tree: free it now rather than after the probes and rendering below
+                soup.decompose()
+                del soup
 
                 # Weak paths (if path OR matching weak hints in body)
                 for path, fw in FRAMEWORK_HINTS.get("paths", {}).items():
                     if path in body:
                         hints = WEAK_PATH_DEPENDENCIES.get(fw, [])
                         if not hints or any(h in body for h in hints):
-                            fw_signals.setdefault(fw, []).append(f"weak-path:{path},line:{extract_snippet(path, text)}")
+                            fw_signals.add(fw, Source.WEAK_PATH, path, extract_snippet(path, text))
+
+                # Known page template: reuse what probing and rendering found on its other sites
+                template, cached = None, None
+                if templates is not None:
+                    template, features = fingerprint(text, headers, urlsplit(str(res.url)).hostname)
+                    if features >= TEMPLATE_MIN_FEATURES:
+                        cached = templates.lookup(ANALYZER, template)
+                    else:
+                        template = None
+                static_signals = {id(s) for s in fw_signals}
 
-                # Error page detection
-                try:
-                    async with session.get(url + "/__nonexistent__", headers=HEADERS) as err_res:
-                        err_text = await err_res.text()
-                        for snippet, fw in FRAMEWORK_HINTS.get("error_snippets", {}).items():
-                            if snippet in err_text.lower():
-                                fw_signals.setdefault(fw, []).append(f"error:{snippet}")
-                except:
-                    pass
-
-                # Try common paths
-                for path in COMMON_PATHS:
+                if cached is not None:
+                    for fw, source, key in cached:
+                        fw_signals.add(fw, Source(source), key, f"template:{template[:12]}")
+                else:
+                    # Error page detection (every probe draws from the same domain budget)
                     try:
-                        async with session.get(url + path, headers=HEADERS) as r:
-                            if r.status == 200:
-                                extra_body = await r.text()
-                                for tag, fw in FRAMEWORK_HINTS.get("html", {}).items():
-                                    if tag in extra_body:
-                                        fw_signals.setdefault(fw, []).append(f"html:{tag},line:{extract_snippet(tag, extra_body)}")
+                        deadline.check()
+                        async with session.get(url + "/__nonexistent__", headers=HEADERS,
+                                               timeout=deadline.client_timeout(TIMEOUT.total)) as err_res:
+                            err_text = await err_res.text()
+                            for snippet, fw in FRAMEWORK_HINTS.get("error_snippets", {}).items():
+                                if snippet in err_text.lower():
+                                    fw_signals.add(fw, Source.ERROR, snippet)
                     except:
-                        continue
-
-                # Always run Playwright
-                extra = await detect_with_playwright(url)
-                for fw, val in extra.items():
-                    fw_signals.setdefault(fw, []).append(val)
-
-                strong_frameworks = {}
-                medium_frameworks = {}
-                weak_frameworks = {}
-
-                for fw, signals in fw_signals.items():
-                    if any(s.startswith("header") or s.startswith("cookie") or s.startswith("error") or "playwright" in s for s in signals):
-                        strong_frameworks[fw] = "high:" + ";".join(signals)
-                    elif any(s.startswith("html") or s.startswith("script") or s.startswith("meta") for s in signals):
-                        medium_frameworks[fw] = "medium:" + ";".join(signals)
-                    elif any(s.startswith("weak-path") or s.startswith("path") for s in signals):
-                        weak_frameworks[fw] = "low:" + ";".join(signals)
-
-                # Prioritize strongest available detection
-                if strong_frameworks:
-                    final_frameworks = strong_frameworks
-                    status = "Framework confidently detected"
-                elif medium_frameworks:
-                    final_frameworks = medium_frameworks
-                    status = "Framework moderately detected"
-                elif weak_frameworks:
-                    final_frameworks = weak_frameworks
-                    status = "Framework weakly inferred from paths"
-                else:
-                    final_frameworks = {}
-                    status = "No framework confidently detected"
-
-                # Set status
-                if final_frameworks:
-                    status = "Framework detected"
-                else:
-                    status = "No framework detected"
+                        pass
+
+                    # Try common paths
+                    for path in COMMON_PATHS:
+                        if deadline.expired():
+                            break
+                        try:
+                            async with session.get(url + path, headers=HEADERS,
+                                                   timeout=deadline.client_timeout(TIMEOUT.total)) as r:
+                                if r.status == 200:
+                                    extra_body = await r.text()
+                                    for tag, fw in FRAMEWORK_HINTS.get("html", {}).items():
+                                        if tag in extra_body:
+                                            fw_signals.add(fw, Source.HTML, tag, extract_snippet(tag, extra_body))
+                        except:
+                            continue
+
+                    # Always run Playwright, unless the budget is already spent
+                    deadline.mark("render")
+                    try:
+                        extra = await deadline.run(detect_with_playwright(url, deadline, browser))
+                    except (BudgetExhausted, asyncio.TimeoutError):
+                        extra = None
+                    rendered = extra is not None
+                    fw_signals.extend(extra or [])
+                    if template and rendered and not deadline.expired():
+                        # Lists, not tuples, so outcomes still compare equal after a JSON round-trip
+                        outcome = {(s.framework, int(s.source), s.key) for s in fw_signals if id(s) not in static_signals}
+                        templates.learn(ANALYZER, template, [list(o) for o in sorted(outcome)])
+
+                # Keep only the frameworks at the strongest confidence tier found
+                _, final_frameworks = fw_signals.classify()
+                status = "Framework detected" if final_frameworks else "No framework detected"
 
                 frameworks_str = ";".join(final_frameworks.keys())
                 sources_str = ";".join(final_frameworks.values())
+                # Partial result: some stages were cut short by the domain budget
+                if deadline.expired():
+                    sources_str = ";".join(filter(None, [sources_str, BUDGET_MARKER]))
+                    status = f"{status} ({BUDGET_MARKER})"
+                elif recrawl:
+                    recrawl.remember(url, res.headers, body_hash)
                 return domain, frameworks_str, sources_str, status
 
         except Exception as e:
-            failed_domains.append((domain, f"Fetch Error: {repr(e)}"))
+            reason = BUDGET_MARKER if deadline.expired() else repr(e)
+            failed_domains.append((domain, f"Fetch Error: {reason}"))
             return domain, "", "", "Fetch Error"
 
     failed_domains.append((domain, f"All URL variants failed"))
     return domain, "", "", "Fetch Error"
 
-async def run_detection(domains):
-    sem = asyncio.Semaphore(CONCURRENCY)
-    async with ClientSession(timeout=TIMEOUT) as session:
+def result_row(result):
+    # (index status, output row or None, error reason or None) for a fetch() result
+    domain, frameworks, sources, status = result
+    if "Fetch Error" in status:
+        reason = next((r for d, r in reversed(failed_domains) if d == domain), status)
+        return STATUS_FAILED, None, reason
+    row = {"Domain": domain, "Frameworks": frameworks or "", "Sources": sources or ""}
+    return (STATUS_PARTIAL if BUDGET_MARKER in status else STATUS_OK), row, None
+
+def shared_result(domain, result, claim):
+    # Adapts a fetch() result to the domain it is reported for, noting where it redirected
+    _, frameworks, sources, status = result
+    if claim.redirected():
+        sources = ";".join(filter(None, [sources, f"{REDIRECT_MARKER}:{claim.final_url}"]))
+    if claim.shared_from:
+        status = f"{status} (shared with {claim.shared_from})"
+    return domain, frameworks, sources, status
+
+def record_result(index, result):
+    state, row, error = result_row(result)
+    index.record(result[0], ANALYZER, state, row=row, error=error, ruleset_version=RULESET_VERSION)
+
+def take_failures(domain):
+    # Removes and returns the failure reasons logged for a domain (and its URL variants)
+    taken = [f for f in failed_domains if f[0] == domain or f[0].endswith("://" + domain)]
+    if taken:
+        failed_domains[:] = [f for f in failed_domains if f not in taken]
+    return taken
+
+async def run_detection(domains, index=None, concurrency=CONCURRENCY, recrawl_enabled=RECRAWL,
+                        template_cache=TEMPLATE_CACHE, on_result=None, governor=None, egress=None):
+    # Returns the results, unless on_result takes each one as it finishes (then nothing is kept)
+    sem = asyncio.Semaphore(concurrency)
+    recrawl = Recrawl(index, ANALYZER, RULESET_VERSION, enabled=recrawl_enabled) if index is not None else None
+    scheduler = HostScheduler()
+    share = OriginShare(index, ANALYZER)
+    templates = TemplateCache() if template_cache else None
+    # Slowest domains first (see priority.py), then spread across hosts
+    domains = await scheduler.plan(priority.plan(index, ANALYZER, domains))
+    connector = {"keepalive_timeout": KEEPALIVE_TIMEOUT, "ttl_dns_cache": 300}
+    # Cookies are read from each response, never sent back, so the jar does not grow with the run
+    async with client_session(as_pool(egress), connector, timeout=TIMEOUT, cookie_jar=DummyCookieJar()) as session:
         async def bounded(domain):
-            async with sem:
+            # Per-host slot first, so a busy host does not hold one of the global slots while it waits
+            async with scheduler.slot(domain), sem:
                 print(f"Checking: {domain}")
-                return await fetch(session, domain)
-        tasks = [bounded(domain) for domain in domains]
-        return await asyncio.gather(*tasks)
-
-def load_domains(filename):
+                # The budget starts once the domain gets a slot, not while it queues
+                deadline = Deadline(DOMAIN_BUDGET)
+                claim = share.claim(domain, deadline)
+                try:
+                    result = await fetch(session, domain, deadline, recrawl,
+                                         on_response=claim.on_response, templates=templates)
+                except BaseException:
+                    claim.abandon()
+                    raise
+                # Share the unadapted result; each domain adds its own redirect note
+                claim.finish(result, shareable=result_row(result)[0] == STATUS_OK)
+                result = shared_result(domain, result, claim)
+                if index is not None:
+                    record_result(index, result)
+                    index.record_history(domain, ANALYZER, deadline.elapsed(), "Fetch Error" not in result[3],
+                                         rendered="render" in deadline.stages)
+                return result
+        results = []
+        await run_windowed(domains, bounded, concurrency * WINDOW_FACTOR, on_result or results.append, governor)
+    print(f"Host scheduling: {scheduler.stats()}")
+    print(f"Redirect sharing: {share.stats()}")
+    if templates is not None:
+        templates.save()
+        print(f"Template cache: {templates.stats()}")
+    return results
+
+def load_domains(filename, start=batch_start, end=batch_end):
     with open(filename, "r", encoding= "utf-8") as f:
-        return [line.strip() for line in f if line.strip()][batch_start:batch_end]
+        return [line.strip() for line in f if line.strip()][start:end]
     
-def save_to_csv(results, filename="mvc_frameworks7.csv"):
-    with open(filename, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Domain", "Frameworks", "Sources"])
+def save_results(results, filename=OUTPUT_FILE, fmt=OUTPUT_FORMAT):
+    sink = open_sink(filename, OUTPUT_COLUMNS, fmt, blob_columns=BLOB_COLUMNS)
+    try:
         for domain, frameworks, sources, status in results:
             if "Fetch Error" in status:
-                continue  # Don't store fetch errors in CSV
-            writer.writerow([domain, frameworks or "", sources or ""])
-
-def save_failed(filename="failed.txt"):
-    if failed_domains:
+                continue  # Don't store fetch errors
+            sink.write_row({"Domain": domain, "Frameworks": frameworks or "", "Sources": sources or ""})
+    finally:
+        sink.close()
+
+def save_failed(filename="failed.txt", entries=None):
+    entries = failed_domains if entries is None else entries
+    if entries:
         seen = set()
         with open(filename, "a") as f:
-            for domain, reason in failed_domains:
+            for domain, reason in entries:
                 if domain not in seen:
                     f.write(f"{domain},{reason}\n")
                     seen.add(domain)
 
+def scan(domains, output_file=OUTPUT_FILE, fmt=OUTPUT_FORMAT, index_path=RESULT_DB,
+         skip_completed=SKIP_COMPLETED, failed_file="failed.txt", memory_budget_mb=MEMORY_BUDGET_MB, **options):
+    # Library entry point; options go to run_detection (concurrency, recrawl_enabled, template_cache, egress).
+    # Rows and failures are written as each domain finishes, so memory does not grow with the batch.
+    index = ResultIndex(index_path)
+    index.register(ANALYZER, OUTPUT_COLUMNS)
+    if skip_completed:
+        domains = index.pending(ANALYZER, domains, RULESET_VERSION)
+    governor = MemoryGovernor(memory_budget_mb)
+    counts = {"domains": 0, "ok": 0, "failed": 0}
+    sink = open_sink(output_file, OUTPUT_COLUMNS, fmt, blob_columns=BLOB_COLUMNS)
+
+    def on_result(result):
+        state, row, _ = result_row(result)
+        counts["domains"] += 1
+        counts["failed" if row is None else "ok"] += 1
+        if row is not None:
+            sink.write_row(row)
+        save_failed(failed_file, take_failures(result[0]))
+
+    try:
+        asyncio.run(run_detection(domains, index, on_result=on_result, governor=governor, **options))
+    finally:
+        sink.close()
+        index.close()
+    save_failed(failed_file)  # anything logged under a URL no domain result claimed
+    print(f"Memory: {governor.stats()}")
+    return counts
+
+def main():
+    summary = scan(load_domains("newdomains.txt"))
+    print(f"\n✅ Results saved to {OUTPUT_FILE}")
+    print(f"Blocked requests: {metrics['blocked_requests']}")
+    print(f"Hedged requests: {HEDGER.stats()}")
+    if summary["failed"]:
+        print(f"❌ {summary['failed']} domains failed. Saved to failed.txt.")
+
 if __name__ == "__main__":
-    domains = load_domains("newdomains.txt")
-    results = asyncio.run(run_detection(domains))
-    save_to_csv(results)
-    save_failed()
-    print("\n✅ Results saved to mvc_frameworks4.csv")
-    if failed_domains:
-        print(f"❌ {len(failed_domains)} domains failed. Saved to failed.txt.")
+    main()
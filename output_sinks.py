@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+
+# --- Output sinks ---
+# Every scraper writes rows (dicts keyed by its column list) through one of these.
+# csv keeps today's layout; jsonl.zst and parquet/arrow are for large runs that
+# are analyzed later. The column list doubles as the schema (all strings).
+
+ROW_GROUP_SIZE = 50000
+ZSTD_LEVEL = 3
+
+FORMAT_EXTENSIONS = {
+    "csv": ".csv",
+    "jsonl.zst": ".jsonl.zst",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+def sink_path(path, fmt):
+    # "technical_details.csv" + "parquet" -> "technical_details.parquet"
+    base = path
+    for ext in sorted(FORMAT_EXTENSIONS.values(), key=len, reverse=True):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+            break
+    return base + FORMAT_EXTENSIONS[fmt]
+
+
+def _next_part(path):
+    # Columnar files cannot be appended to; later runs write numbered parts next to the first
+    if not os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(path)
+    n = 1
+    while os.path.exists(f"{stem}.part-{n}{ext}"):
+        n += 1
+    return f"{stem}.part-{n}{ext}"
+
+
+class CsvSink:
+    def __init__(self, path, columns):
+        self.columns = columns
+        write_header = not (os.path.exists(path) and os.path.getsize(path) > 0)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns, extrasaction="ignore")
+        if write_header:
+            self._writer.writeheader()
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlZstdSink:
+    def __init__(self, path, columns):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("jsonl.zst output needs the 'zstandard' package")
+        self.columns = columns
+        # zstd frames concatenate, so appending a new frame keeps the file readable
+        self._raw = open(path, "ab")
+        self._file = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._raw)
+
+    def write_row(self, row):
+        record = {col: row.get(col, "") for col in self.columns}
+        self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def close(self):
+        self._file.close()
+        self._raw.close()
+
+
+class _ArrowBatchSink:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+        except ImportError:
+            raise RuntimeError(f"{type(self).__name__} needs the 'pyarrow' package")
+        self._pa = pyarrow
+        self.columns = columns
+        self.schema = pyarrow.schema([(col, pyarrow.string()) for col in columns])
+        self.path = _next_part(path)
+        self._buffer = {col: [] for col in columns}
+        self._rows = 0
+        self._writer = None
+
+    def write_row(self, row):
+        for col in self.columns:
+            value = row.get(col)
+            self._buffer[col].append(None if value is None else str(value))
+        self._rows += 1
+        if self._rows >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        batch = self._pa.RecordBatch.from_arrays(
+            [self._pa.array(self._buffer[col], type=self._pa.string()) for col in self.columns],
+            schema=self.schema,
+        )
+        if self._writer is None:
+            self._writer = self._open_writer()
+        self._write_batch(batch)
+        self._buffer = {col: [] for col in self.columns}
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+class ParquetSink(_ArrowBatchSink):
+    def _open_writer(self):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(self.path, self.schema, compression="zstd")
+
+    def _write_batch(self, batch):
+        self._writer.write_table(self._pa.Table.from_batches([batch]), row_group_size=ROW_GROUP_SIZE)
+
+
+class ArrowIpcSink(_ArrowBatchSink):
+    def _open_writer(self):
+        return self._pa.ipc.new_file(self.path, self.schema,
+                                     options=self._pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    def _write_batch(self, batch):
+        self._writer.write_batch(batch)
+
+
+class BlobSink:
+    # Moves large values of the given columns into a BlobStore before writing
+    def __init__(self, sink, store, blob_columns):
+        self._sink = sink
+        self.store = store
+        self.blob_columns = blob_columns
+        self.columns = sink.columns
+
+    def write_row(self, row):
+        row = dict(row)
+        for col in self.blob_columns:
+            if col in row:
+                row[col] = self.store.encode(row[col])
+        self._sink.write_row(row)
+
+    def close(self):
+        self._sink.close()
+
+
+SINKS = {
+    "csv": CsvSink,
+    "jsonl.zst": JsonlZstdSink,
+    "parquet": ParquetSink,
+    "arrow": ArrowIpcSink,
+}
+
+
+def open_sink(path, columns, fmt="csv", blob_columns=(), blob_store=None):
+    sink = SINKS[fmt](sink_path(path, fmt), columns)
+    if blob_columns:
+        from blob_store import BlobStore
+        sink = BlobSink(sink, blob_store or BlobStore(), blob_columns)
+    return sink
@@ -0,0 +1,158 @@
+import asyncio
+import socket
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# --- Per-host politeness ---
+# Domains are grouped by resolved IP (falling back to the registrable domain
+# when a name does not resolve), each group gets its own concurrency limit and
+# minimum spacing between request starts, and the work list is interleaved
+# across groups so consecutive slots go to different backends instead of
+# bursting one origin. Interleaving keeps the order it is given as far as
+# possible (see priority.py). Groups with many domains of the batch are CDN
+# edges or large shared hosts; they get a wider limit so they are spread out
+# rather than serialized.
+
+GROUP_BY = "ip"  # "ip", or "registrable", which only groups subdomains of one site
+PER_HOST_CONCURRENCY = 2
+PER_HOST_INTERVAL = 0.5  # seconds between request starts to one group
+SHARED_GROUP_SIZE = 20  # domains of one batch on one IP that mark it as a CDN edge / shared host
+SHARED_CONCURRENCY = 8
+SHARED_INTERVAL = 0.1
+RESOLVE_CONCURRENCY = 50
+RESOLVE_TIMEOUT = 3
+
+# Second-level suffixes under which registrations happen one label deeper
+MULTI_PART_SUFFIXES = {
+    "co.uk", "org.uk", "ac.uk", "gov.uk", "me.uk", "com.au", "net.au", "org.au",
+    "co.nz", "co.jp", "ne.jp", "or.jp", "co.in", "co.za", "co.kr", "com.br",
+    "com.cn", "com.mx", "com.tr", "com.sg", "com.hk", "com.tw", "com.ar", "com.pl",
+}
+
+
+def bare_host(domain):
+    host = domain.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0].lower().rstrip(".")
+    return host[4:] if host.startswith("www.") else host
+
+
+def registrable_domain(domain):
+    labels = bare_host(domain).split(".")
+    if len(labels) >= 3 and ".".join(labels[-2:]) in MULTI_PART_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def interleave(domains, key):
+    # Keeps the incoming (priority) order, but a domain whose group just had the
+    # previous slot waits until another group has gone; held-back domains come first
+    held = OrderedDict()
+    ordered = []
+    last = None
+    incoming = iter(domains)
+    while True:
+        group = next((g for g in held if g != last), None)
+        if group is not None:
+            queue = held[group]
+            ordered.append(queue.popleft())
+            if not queue:
+                del held[group]
+            last = group
+            continue
+        domain = next(incoming, None)
+        if domain is None:
+            break
+        group = key(domain)
+        if group == last:
+            held.setdefault(group, deque()).append(domain)
+        else:
+            ordered.append(domain)
+            last = group
+    for queue in held.values():
+        ordered.extend(queue)  # only the last group is left
+    return ordered
+
+
+class HostScheduler:
+    def __init__(self, group_by=GROUP_BY, per_host=PER_HOST_CONCURRENCY, interval=PER_HOST_INTERVAL):
+        self.group_by = group_by
+        self.per_host = per_host
+        self.interval = interval
+        self._keys = {}
+        self._slots = {}
+        self._users = {}
+        self._next_start = {}
+        self._shared = set()
+        self.groups = 0
+        self.waited = 0.0
+
+    def key(self, domain):
+        return self._keys.get(domain) or registrable_domain(domain)
+
+    async def _resolve(self, domains):
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+        async def resolve(domain):
+            async with sem:
+                try:
+                    infos = await asyncio.wait_for(
+                        loop.getaddrinfo(bare_host(domain), 443, type=socket.SOCK_STREAM), RESOLVE_TIMEOUT)
+                except Exception:
+                    return
+                if infos:
+                    self._keys[domain] = min(info[4][0] for info in infos)
+
+        await asyncio.gather(*(resolve(d) for d in domains))
+
+    async def plan(self, domains):
+        # Returns the domains reordered so neighbours belong to different groups
+        if self.group_by == "ip":
+            await self._resolve(domains)
+            sizes = Counter(self.key(d) for d in domains)
+            self._shared.update(key for key, size in sizes.items() if size >= SHARED_GROUP_SIZE)
+        return interleave(domains, self.key)
+
+    def _limits(self, key):
+        if key in self._shared:
+            return SHARED_CONCURRENCY, SHARED_INTERVAL
+        return self.per_host, self.interval
+
+    @asynccontextmanager
+    async def slot(self, domain):
+        key = self.key(domain)
+        concurrency, interval = self._limits(key)
+        sem = self._slots.get(key)
+        if sem is None:
+            sem = self._slots[key] = asyncio.Semaphore(concurrency)
+            self.groups += 1
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with sem:
+                now = time.monotonic()
+                start = max(now, self._next_start.get(key, now))
+                self._next_start[key] = start + interval
+                if start > now:
+                    self.waited += start - now
+                    await asyncio.sleep(start - now)
+                yield
+        finally:
+            self._release(key)
+
+    def _release(self, key):
+        # Groups nobody is using are dropped, so state stays proportional to the work in flight;
+        # the start spacing is kept until it has passed
+        self._users[key] -= 1
+        if self._users[key]:
+            return
+        del self._users[key]
+        del self._slots[key]
+        if self._next_start.get(key, 0) <= time.monotonic():
+            self._next_start.pop(key, None)
+        if len(self._next_start) > 2 * len(self._slots) + 1000:
+            now = time.monotonic()
+            self._next_start = {k: t for k, t in self._next_start.items() if t > now or k in self._slots}
+
+    def stats(self):
+        return {"groups_opened": self.groups, "active_groups": len(self._slots), "shared_groups": len(self._shared),
+                "waited_seconds": round(self.waited, 1)}
@@ -0,0 +1,66 @@
+import csv
+import os
+
+# --- Latency-aware work ordering ---
+# Each scan records how long a domain took, whether it failed and whether it
+# needed rendering (ResultIndex.record_history). The next run starts the
+# slowest domains first and fills the remaining slots with quick ones, so a
+# few hanging hosts no longer hold up the end of a batch. Explicit tiers
+# (lower runs first) always take precedence over the latency estimate.
+#
+#   priority_domains.csv:  domain,tier
+#                          important-client.com,0
+#                          parked-site.net,2
+
+PRIORITY_FILE = "priority_domains.csv"
+DEFAULT_TIER = 1
+DEFAULT_SECONDS = 10.0  # expected scan time for a domain with no history
+FAILURE_SECONDS = 5.0  # per consecutive failure; flaky hosts tend to hang until the budget runs out
+MAX_FAILURE_PENALTY = 4
+
+
+def load_tiers(path=PRIORITY_FILE):
+    # {domain: tier}; a missing file means every domain is in DEFAULT_TIER
+    tiers = {}
+    if not path or not os.path.exists(path):
+        return tiers
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or row[0].startswith("#"):
+                continue
+            try:
+                tiers[row[0].strip()] = int(row[1])
+            except ValueError:
+                continue  # header or malformed line
+    return tiers
+
+
+def expected_seconds(entry):
+    # entry is a ResultIndex.history() value or None
+    if entry is None:
+        return DEFAULT_SECONDS
+    return entry["avg_seconds"] + FAILURE_SECONDS * min(entry["failures"], MAX_FAILURE_PENALTY)
+
+
+def prioritize(items, history, tiers=None, key=None):
+    # Tier first, then longest expected scan first, rendering domains before
+    # static ones at equal estimates; remaining ties keep the input order.
+    # key maps an item (e.g. a URL) to the domain its history is stored under.
+    tiers = tiers or {}
+    key = key or (lambda item: item)
+
+    def rank(item):
+        domain = key(item)
+        entry = history.get(domain)
+        return tiers.get(domain, DEFAULT_TIER), -expected_seconds(entry), not (entry and entry["rendered"])
+
+    return sorted(items, key=rank)
+
+
+def plan(index, analyzer, items, key=None, tiers_path=PRIORITY_FILE):
+    # Convenience for the scrapers: history lookup + tiers + ordering
+    items = list(items)
+    history = {}
+    if index is not None:
+        history = index.history(analyzer, [key(i) for i in items] if key else items)
+    return prioritize(items, history, load_tiers(tiers_path), key)
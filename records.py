@@ -0,0 +1,172 @@
+import sys
+from enum import IntEnum
+
+# --- Compact result and signal records ---
+# Detection state is kept as small slotted objects with enum-coded fields and
+# interned names; the "header:x-powered-by,line:..." strings the CSVs contain
+# are only built when a record is serialized.
+
+
+class Confidence(IntEnum):
+    NONE = 0
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+
+
+CONFIDENCE_LABELS = {
+    Confidence.LOW: "low",
+    Confidence.MEDIUM: "medium",
+    Confidence.HIGH: "high",
+}
+
+
+class Source(IntEnum):
+    HEADER = 1
+    COOKIE = 2
+    ERROR = 3
+    META = 4
+    HTML = 5
+    SCRIPT = 6
+    PATH = 7
+    WEAK_PATH = 8
+    PLAYWRIGHT_HEADER = 9
+    PLAYWRIGHT_NETWORK = 10
+    PLAYWRIGHT_DOM = 11
+    PLAYWRIGHT_SCRIPT = 12
+    PLAYWRIGHT_GLOBAL = 13
+    PLAYWRIGHT_CONSOLE = 14
+
+
+SOURCE_LABELS = {
+    Source.HEADER: "header",
+    Source.COOKIE: "cookie",
+    Source.ERROR: "error",
+    Source.META: "meta",
+    Source.HTML: "html",
+    Source.SCRIPT: "script",
+    Source.PATH: "path",
+    Source.WEAK_PATH: "weak-path",
+    Source.PLAYWRIGHT_HEADER: "playwright:header",
+    Source.PLAYWRIGHT_NETWORK: "playwright:network",
+    Source.PLAYWRIGHT_DOM: "playwright:dom",
+    Source.PLAYWRIGHT_SCRIPT: "playwright:script",
+    Source.PLAYWRIGHT_GLOBAL: "playwright:global",
+    Source.PLAYWRIGHT_CONSOLE: "playwright:console",
+}
+
+# Same tiers mvc4 used to derive with startswith() on the formatted strings
+SOURCE_CONFIDENCE = {
+    Source.HEADER: Confidence.HIGH,
+    Source.COOKIE: Confidence.HIGH,
+    Source.ERROR: Confidence.HIGH,
+    Source.META: Confidence.MEDIUM,
+    Source.HTML: Confidence.MEDIUM,
+    Source.SCRIPT: Confidence.MEDIUM,
+    Source.PATH: Confidence.LOW,
+    Source.WEAK_PATH: Confidence.LOW,
+    Source.PLAYWRIGHT_HEADER: Confidence.HIGH,
+    Source.PLAYWRIGHT_NETWORK: Confidence.HIGH,
+    Source.PLAYWRIGHT_DOM: Confidence.HIGH,
+    Source.PLAYWRIGHT_SCRIPT: Confidence.HIGH,
+    Source.PLAYWRIGHT_GLOBAL: Confidence.HIGH,
+    Source.PLAYWRIGHT_CONSOLE: Confidence.HIGH,
+}
+
+
+class Signal:
+    __slots__ = ("framework", "source", "key", "line")
+
+    def __init__(self, framework, source, key="", line=None):
+        self.framework = sys.intern(framework)
+        self.source = source
+        # Keys come from the hint tables, so interning them shares one copy per hint
+        self.key = sys.intern(key)
+        self.line = line  # None: the signal has no ",line:" part
+
+    @property
+    def confidence(self):
+        return SOURCE_CONFIDENCE[self.source]
+
+    def format(self):
+        text = SOURCE_LABELS[self.source]
+        if self.key:
+            text = f"{text}:{self.key}"
+        if self.line is not None:
+            text = f"{text},line:{self.line}"
+        return text
+
+
+class SignalSet:
+    # Signals grouped per framework, in the order they were found
+    __slots__ = ("by_framework",)
+
+    def __init__(self):
+        self.by_framework = {}
+
+    def add(self, framework, source, key="", line=None):
+        signal = Signal(framework, source, key, line)
+        self.by_framework.setdefault(signal.framework, []).append(signal)
+
+    def extend(self, signals):
+        for signal in signals:
+            self.by_framework.setdefault(signal.framework, []).append(signal)
+
+    def __iter__(self):
+        for signals in self.by_framework.values():
+            yield from signals
+
+    def __bool__(self):
+        return bool(self.by_framework)
+
+    def confidence(self, framework):
+        return max(s.confidence for s in self.by_framework[framework])
+
+    def classify(self):
+        # Frameworks at the highest confidence tier present -> (tier, {framework: "tier:sig;sig"})
+        best = Confidence.NONE
+        for framework in self.by_framework:
+            best = max(best, self.confidence(framework))
+        if best is Confidence.NONE:
+            return best, {}
+        label = CONFIDENCE_LABELS[best]
+        return best, {
+            framework: f"{label}:" + ";".join(s.format() for s in signals)
+            for framework, signals in self.by_framework.items()
+            if self.confidence(framework) is best
+        }
+
+
+def record_class(name, columns):
+    # Slotted row type with dict-style access, for scrapers that fill a fixed column set
+    columns = tuple(columns)
+
+    def __init__(self, **values):
+        for col in columns:
+            setattr(self, col, values.get(col, ""))
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return columns
+
+    def to_row(self):
+        return {col: getattr(self, col) for col in columns}
+
+    return type(name, (), {
+        "__slots__": columns,
+        "columns": columns,
+        "__init__": __init__,
+        "__getitem__": __getitem__,
+        "__setitem__": __setitem__,
+        "get": get,
+        "keys": keys,
+        "to_row": to_row,
+    })
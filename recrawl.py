@@ -0,0 +1,65 @@
+import hashlib
+
+from result_index import STATUS_OK
+
+# --- Incremental recrawl ---
+# Each scraper stores the ETag / Last-Modified and a hash of the page (plus any
+# response headers its result depends on) next to its result in the index.
+# On the next run a page that answers 304, or whose hash is unchanged, reuses
+# the stored result instead of being parsed, probed or rendered again.
+
+
+def page_hash(body, *parts):
+    digest = hashlib.sha1(body.encode("utf-8", errors="ignore"))
+    for part in parts:
+        digest.update(b"\0" + str(part).encode("utf-8", errors="ignore"))
+    return digest.hexdigest()
+
+
+class Recrawl:
+    def __init__(self, index, analyzer, ruleset_version, enabled=True):
+        self.index = index
+        self.analyzer = analyzer
+        self.ruleset_version = ruleset_version
+        self.enabled = enabled
+        self.reused = 0
+
+    def previous(self, domain):
+        # Last good row for the domain, if it was computed with the current ruleset
+        if not self.enabled:
+            return None
+        entry = self.index.get(domain, self.analyzer)
+        if not entry or entry["status"] != STATUS_OK or entry["ruleset_version"] != self.ruleset_version:
+            return None
+        return entry["data"]
+
+    def headers(self, url, headers, previous):
+        # Request headers with If-None-Match / If-Modified-Since when a result can be reused
+        if previous is None:
+            return headers
+        validators = self.index.get_validators(url, self.analyzer)
+        if not validators:
+            return headers
+        headers = dict(headers)
+        if validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def unchanged(self, url, previous, status, body_hash=None):
+        # True when the stored result still applies: a 304, or the same page hash
+        if previous is None:
+            return False
+        if status == 304:
+            self.reused += 1
+            return True
+        validators = self.index.get_validators(url, self.analyzer)
+        if body_hash and validators and validators["body_hash"] == body_hash:
+            self.reused += 1
+            return True
+        return False
+
+    def remember(self, url, response_headers, body_hash):
+        self.index.set_validators(url, self.analyzer, response_headers.get("ETag"),
+                                  response_headers.get("Last-Modified"), body_hash)
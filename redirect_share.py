@@ -0,0 +1,114 @@
+import asyncio
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+# --- Redirect-target result sharing ---
+# Many input domains redirect to the same final origin. The first domain to
+# land on an origin analyzes it; any other domain whose fetch ends on that
+# origin waits for that result and reuses it instead of parsing, probing and
+# rendering the same site again. Waiters never own an origin themselves, so
+# two domains cannot end up waiting on each other.
+
+REDIRECT_MARKER = "redirect"
+SHARE_MAX_ORIGINS = 50000  # finished origins kept for reuse; in-flight ones are never dropped
+SHARE_WAIT_FRACTION = 0.5  # share of its remaining budget a waiter gives the owner before analyzing itself
+
+
+def origin_of(url):
+    parts = urlsplit(str(url))
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}:{parts.port}" if parts.port else host
+
+
+def redirect_chain(response):
+    # Every URL the request went through, ending with the final one
+    return [str(r.url) for r in response.history] + [str(response.url)]
+
+
+class OriginShare:
+    def __init__(self, index=None, analyzer=None, max_origins=SHARE_MAX_ORIGINS):
+        self.index = index  # optional ResultIndex to record redirects in
+        self.analyzer = analyzer
+        self.max_origins = max_origins
+        self._results = {}
+        self._finished = OrderedDict()
+        self.shared = 0
+        self.timeouts = 0
+
+    def _keep(self, origin):
+        # Oldest finished results go first, so a long run does not hold every result it produced
+        self._finished[origin] = None
+        while len(self._finished) > self.max_origins:
+            self._results.pop(self._finished.popitem(last=False)[0], None)
+
+    def claim(self, domain, deadline=None):
+        return OriginClaim(self, domain, deadline)
+
+    def stats(self):
+        return {"origins": len(self._results), "shared": self.shared, "wait_timeouts": self.timeouts}
+
+
+class OriginClaim:
+    # Per-domain handle; on_response() is the hook the fetch layer calls with the final response
+    def __init__(self, share, domain, deadline=None):
+        self.share = share
+        self.domain = domain
+        self.deadline = deadline  # the waiting domain's own budget bounds how long it waits
+        self.origin = None  # origin this domain analyzes on behalf of others
+        self.final_url = None
+        self.chain = []
+        self.shared_from = None
+
+    async def on_response(self, response):
+        # Returns a finished result to reuse, or None to analyze the response here
+        self.chain = redirect_chain(response)
+        self.final_url = self.chain[-1]
+        if self.origin is not None:
+            return None
+        origin = origin_of(self.final_url)
+        future = self.share._results.get(origin)
+        if future is None:
+            self.share._results[origin] = asyncio.get_running_loop().create_future()
+            self.origin = origin
+            return None
+        # The waiter holds its slots and an open response meanwhile, so the wait is bounded;
+        # an owner that is still busy after that is left alone and the page is analyzed here
+        timeout = None if self.deadline is None else self.deadline.timeout() * SHARE_WAIT_FRACTION
+        try:
+            shared = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.share.timeouts += 1
+            return None
+        if shared is None:
+            return None  # the owner gave up; analyze it ourselves
+        owner, result = shared
+        self.shared_from = owner
+        self.share.shared += 1
+        return result
+
+    def redirected(self):
+        return bool(self.final_url) and origin_of(self.final_url) != origin_of(self.chain[0])
+
+    def finish(self, result, shareable=True):
+        if self.share.index is not None and (self.redirected() or self.shared_from):
+            self.share.index.record_redirect(self.domain, self.share.analyzer, self.final_url, self.chain,
+                                             self.shared_from)
+        if self.origin is None:
+            return
+        future = self.share._results[self.origin]
+        if shareable:
+            future.set_result((self.domain, result))
+            self.share._keep(self.origin)
+        else:
+            # Partial or failed: let the next domain on this origin analyze it
+            del self.share._results[self.origin]
+            future.set_result(None)
+        self.origin = None
+
+    def abandon(self):
+        # Fetch raised or was cancelled; wake any waiters so they analyze the origin themselves
+        if self.origin is not None:
+            self.share._results.pop(self.origin).set_result(None)
+            self.origin = None
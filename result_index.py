@@ -0,0 +1,304 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+from blob_store import BlobStore, LazyRow
+
+# --- Result index ---
+# One SQLite row per (domain, analyzer) with upsert semantics, so reruns
+# replace earlier results instead of appending duplicates, and "what still
+# needs scanning" is an indexed query. Writes are buffered and committed in
+# batches; the CSV/Parquet outputs can be regenerated from here with export.
+# Large values are kept in the blob store (see blob_store.py) as bare references,
+# so the index holds each JSON-LD blob or CSP header once, like the outputs do;
+# rows read back resolve them only when a field is accessed.
+
+RESULT_DB = "results.db"
+COMMIT_EVERY = 200  # rows per transaction
+READ_CHUNK = 1000  # rows fetched at a time by iter_rows
+
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial"  # finished, but some stages ran out of budget
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    domain TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    ruleset_version TEXT,
+    data TEXT,
+    first_seen REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (domain, analyzer)
+);
+CREATE INDEX IF NOT EXISTS results_status ON results (analyzer, status);
+CREATE TABLE IF NOT EXISTS analyzers (
+    analyzer TEXT PRIMARY KEY,
+    columns TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS validators (
+    url TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    body_hash TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (url, analyzer)
+);
+CREATE TABLE IF NOT EXISTS history (
+    domain TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    last_seconds REAL NOT NULL,
+    avg_seconds REAL NOT NULL,
+    failures INTEGER NOT NULL,
+    rendered INTEGER NOT NULL,
+    runs INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (domain, analyzer)
+);
+CREATE TABLE IF NOT EXISTS redirects (
+    domain TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    final_url TEXT,
+    chain TEXT,
+    shared_from TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (domain, analyzer)
+);
+"""
+
+UPSERT = """
+INSERT INTO results (domain, analyzer, status, error, ruleset_version, data, first_seen, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (domain, analyzer) DO UPDATE SET
+    status = excluded.status,
+    error = excluded.error,
+    ruleset_version = excluded.ruleset_version,
+    data = excluded.data,
+    updated_at = excluded.updated_at
+"""
+
+SET_VALIDATORS = "INSERT OR REPLACE INTO validators VALUES (?, ?, ?, ?, ?, ?)"
+SET_REDIRECT = "INSERT OR REPLACE INTO redirects VALUES (?, ?, ?, ?, ?, ?)"
+
+# Moving average of scan time; failures counts consecutive failed runs
+ADD_HISTORY = """
+INSERT INTO history VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT (domain, analyzer) DO UPDATE SET
+    last_seconds = excluded.last_seconds,
+    avg_seconds = history.avg_seconds * 0.7 + excluded.last_seconds * 0.3,
+    failures = CASE WHEN excluded.failures > 0 THEN history.failures + 1 ELSE 0 END,
+    rendered = excluded.rendered,
+    runs = history.runs + 1,
+    updated_at = excluded.updated_at
+"""
+HISTORY_CHUNK = 500  # domains per lookup query
+
+
+class ResultIndex:
+    def __init__(self, path=RESULT_DB, commit_every=COMMIT_EVERY, blob_store=None):
+        self.path = path
+        self.commit_every = commit_every
+        self.blobs = blob_store or BlobStore(preview_chars=0)
+        # Writers run on several threads (abv3) or inside an event loop; all access is serialized here
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_validators = []
+        self._pending_redirects = []
+        self._pending_history = []
+
+    def register(self, analyzer, columns):
+        # Remembers the output layout so export can rebuild the original files
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO analyzers VALUES (?, ?)", (analyzer, json.dumps(list(columns))))
+
+    def record(self, domain, analyzer, status, row=None, error=None, ruleset_version=None):
+        now = time.time()
+        data = json.dumps(self._encode(row), ensure_ascii=False) if row is not None else None
+        with self._lock:
+            self._pending.append((domain, analyzer, status, error, ruleset_version, data, now, now))
+            if len(self._pending) >= self.commit_every:
+                self._flush_locked()
+
+    def _encode(self, row):
+        # Rows read back from the index keep their references instead of loading the blobs
+        value = row.raw if isinstance(row, LazyRow) else row.__getitem__
+        return {key: self.blobs.encode(value(key)) for key in row}
+
+    def set_validators(self, url, analyzer, etag=None, last_modified=None, body_hash=None):
+        # Cache validators of the page a result was computed from (see recrawl.py)
+        with self._lock:
+            self._pending_validators.append((url, analyzer, etag, last_modified, body_hash, time.time()))
+            if len(self._pending_validators) >= self.commit_every:
+                self._flush_locked()
+
+    def record_redirect(self, domain, analyzer, final_url, chain, shared_from=None):
+        # Where the domain ended up, and which domain's result it reused (see redirect_share.py)
+        with self._lock:
+            self._pending_redirects.append((domain, analyzer, final_url, json.dumps(chain), shared_from, time.time()))
+            if len(self._pending_redirects) >= self.commit_every:
+                self._flush_locked()
+
+    def record_history(self, domain, analyzer, seconds, ok, rendered=False):
+        # Per-domain timing kept for priority scheduling (see priority.py)
+        with self._lock:
+            self._pending_history.append((domain, analyzer, seconds, seconds, 0 if ok else 1, int(rendered), time.time()))
+            if len(self._pending_history) >= self.commit_every:
+                self._flush_locked()
+
+    def history(self, analyzer, domains):
+        # {domain: {"avg_seconds", "failures", "rendered", "runs"}} for domains seen before
+        self.flush()
+        found = {}
+        domains = list(domains)
+        with self._lock:
+            for i in range(0, len(domains), HISTORY_CHUNK):
+                chunk = domains[i:i + HISTORY_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT domain, avg_seconds, failures, rendered, runs FROM history "
+                    f"WHERE analyzer = ? AND domain IN ({marks})", (analyzer, *chunk))
+                for domain, avg_seconds, failures, rendered, runs in rows:
+                    found[domain] = {"avg_seconds": avg_seconds, "failures": failures,
+                                     "rendered": bool(rendered), "runs": runs}
+        return found
+
+    def get_validators(self, url, analyzer):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, body_hash FROM validators WHERE url = ? AND analyzer = ?",
+                (url, analyzer)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "body_hash"), row))
+
+    def _flush_locked(self):
+        if not (self._pending or self._pending_validators or self._pending_redirects or self._pending_history):
+            return
+        with self._conn:
+            self._conn.executemany(UPSERT, self._pending)
+            self._conn.executemany(SET_VALIDATORS, self._pending_validators)
+            self._conn.executemany(SET_REDIRECT, self._pending_redirects)
+            self._conn.executemany(ADD_HISTORY, self._pending_history)
+        self._pending = []
+        self._pending_validators = []
+        self._pending_redirects = []
+        self._pending_history = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def pending(self, analyzer, domains, ruleset_version=None):
+        # Domains without a finished result (or with one from another ruleset version)
+        self.flush()
+        done = set()
+        query = "SELECT domain, ruleset_version FROM results WHERE analyzer = ? AND status != ?"
+        with self._lock:
+            for domain, version in self._conn.execute(query, (analyzer, STATUS_FAILED)):
+                if ruleset_version is None or version == ruleset_version:
+                    done.add(domain)
+        return [d for d in domains if d not in done]
+
+    def get(self, domain, analyzer):
+        # Committed rows only; lookups are per domain at scan start, so no flush is forced
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, error, ruleset_version, data, updated_at FROM results WHERE domain = ? AND analyzer = ?",
+                (domain, analyzer)).fetchone()
+        if row is None:
+            return None
+        status, error, version, data, updated_at = row
+        return {"status": status, "error": error, "ruleset_version": version,
+                "data": LazyRow(json.loads(data), self.blobs) if data else None, "updated_at": updated_at}
+
+    def status_counts(self, analyzer=None):
+        self.flush()
+        query = "SELECT analyzer, status, COUNT(*) FROM results"
+        args = ()
+        if analyzer:
+            query += " WHERE analyzer = ?"
+            args = (analyzer,)
+        with self._lock:
+            return self._conn.execute(query + " GROUP BY analyzer, status ORDER BY analyzer, status", args).fetchall()
+
+    def failures(self, analyzer):
+        self.flush()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT domain, error FROM results WHERE analyzer = ? AND status = ? ORDER BY domain",
+                (analyzer, STATUS_FAILED)).fetchall()
+
+    def columns(self, analyzer):
+        with self._lock:
+            row = self._conn.execute("SELECT columns FROM analyzers WHERE analyzer = ?", (analyzer,)).fetchone()
+        if row is None:
+            raise KeyError(f"unknown analyzer: {analyzer}")
+        return json.loads(row[0])
+
+    def iter_rows(self, analyzer, statuses=(STATUS_OK, STATUS_PARTIAL)):
+        self.flush()
+        marks = ",".join("?" * len(statuses))
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT data FROM results WHERE analyzer = ? AND status IN ({marks}) AND data IS NOT NULL ORDER BY domain",
+                (analyzer, *statuses))
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(READ_CHUNK)
+            if not rows:
+                return
+            for (data,) in rows:
+                yield LazyRow(json.loads(data), self.blobs)
+
+    def export(self, analyzer, path, fmt="csv"):
+        from output_sinks import open_sink
+        sink = open_sink(path, self.columns(analyzer), fmt)
+        count = 0
+        try:
+            for row in self.iter_rows(analyzer):
+                sink.write_row(row)
+                count += 1
+        finally:
+            sink.close()
+        return count
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv):
+    # python result_index.py status [analyzer]
+    # python result_index.py export <analyzer> <path> [csv|jsonl.zst|parquet|arrow]
+    # python result_index.py failed <analyzer>
+    if not argv or argv[0] not in ("status", "export", "failed"):
+        print("usage: result_index.py status [analyzer] | export <analyzer> <path> [format] | failed <analyzer>")
+        return 2
+    index = ResultIndex()
+    try:
+        if argv[0] == "status":
+            for analyzer, status, count in index.status_counts(argv[1] if len(argv) > 1 else None):
+                print(f"{analyzer}\t{status}\t{count}")
+        elif argv[0] == "export":
+            fmt = argv[3] if len(argv) > 3 else "csv"
+            print(f"Exported {index.export(argv[1], argv[2], fmt)} rows")
+        else:
+            for domain, error in index.failures(argv[1]):
+                print(f"{domain},{error or ''}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web, DummyCookieJar
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_interaction"))
+from deadline import Deadline, DOMAIN_BUDGET
+from egress import EgressPool, client_session
+from hedging import HEDGER
+from memory_governor import MemoryGovernor, WINDOW_FACTOR, run_windowed
+from politeness import HostScheduler
+import priority
+from recrawl import Recrawl
+from redirect_share import OriginShare
+from result_index import ResultIndex, RESULT_DB, STATUS_OK, STATUS_FAILED
+
+# --- Scan service ---
+# Long-running process that keeps the HTTP connection pool, DNS cache, compiled
+# hint tables, Playwright browsers and Selenium drivers warm across batches.
+#
+#   python scan_service.py                       # http://127.0.0.1:8765
+#   python scan_service.py --unix /tmp/scan.sock
+#   python scan_service.py --analyzers meta details   # no browsers are started for these
+#
+#   POST /scan  {"domains": ["example.com", "http://127.0.0.1:8001"], "analyzers": ["framework", "details", "meta"]}
+#       -> one JSON line per (domain, analyzer) as it finishes:
+#          {"domain": ..., "analyzer": ..., "status": "ok|partial|failed", "row": {...}, "error": ...}
+#   GET  /stats
+#
+# Full URLs are accepted in place of domains, so local stand-in sites can be scanned
+# (see standin_sites.py).
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+MAX_BATCH = 5000
+BROWSER_POOL_SIZE = 2  # Playwright browsers; each renders many pages in separate contexts
+AB_DRIVERS = 3  # Selenium drivers for the A/B analyzer, one per worker thread
+CONCURRENCY = {"framework": 10, "details": 80, "meta": 100, "ab": AB_DRIVERS}
+KEEPALIVE_TIMEOUT = 60
+ANALYZERS = ["framework", "details", "meta", "ab"]
+
+
+class ScanService:
+    def __init__(self, analyzers=None, index_path=RESULT_DB):
+        self.index = None
+        self.index_path = index_path
+        self.session = None
+        self.scheduler = HostScheduler()
+        self.limits = {name: asyncio.Semaphore(n) for name, n in CONCURRENCY.items()}
+        handlers = {"framework": self.scan_framework, "details": self.scan_details, "meta": self.scan_meta,
+                    "ab": self.scan_ab}
+        self.analyzers = {name: handlers[name] for name in (analyzers or ANALYZERS)}
+        self.modules = {}
+        self._playwright = None
+        self._browsers = []
+        self._next_browser = 0
+        self._details_driver = None
+        self._details_driver_ready = None
+        self._ab_local = threading.local()
+        self._ab_drivers = []
+        self._ab_executor = ThreadPoolExecutor(max_workers=AB_DRIVERS)
+        self.templates = None
+        self.shares = {}
+        self.governor = MemoryGovernor()
+        self.egress = EgressPool()  # endpoints from EGRESS_ENDPOINTS; empty means the default route
+        self.active = 0
+        self.batches = 0
+
+    async def start(self, app):
+        # Heavy imports and rule compilation happen once, here
+        global mvc4, details_scraper, meta_scraper, abv3
+        import mvc4
+        import details_scraper
+        import abv3
+        from scrapingdomains import meta_scraper
+
+        # One cache for both analyzers that use templates, so they do not overwrite each other's file
+        self.templates = abv3.get_templates()
+        self.index = ResultIndex(self.index_path)
+        self.recrawl = {}
+        modules = {"framework": mvc4, "details": details_scraper, "meta": meta_scraper, "ab": abv3}
+        self.modules = {name: modules[name] for name in self.analyzers}
+        for name, module in self.modules.items():
+            columns = getattr(module, "OUTPUT_COLUMNS", None) or module.DESIRED_COLUMNS
+            self.index.register(module.ANALYZER, columns)
+            self.recrawl[name] = Recrawl(self.index, module.ANALYZER, module.RULESET_VERSION,
+                                         enabled=getattr(module, "RECRAWL", False))
+        # Domains redirecting to an origin another scan is already on reuse its result (see redirect_share.py)
+        self.shares = {name: OriginShare(self.index, self.modules[name].ANALYZER)
+                       for name in ("framework", "details") if name in self.modules}
+        connector = {"limit": sum(CONCURRENCY.values()) * 2, "keepalive_timeout": KEEPALIVE_TIMEOUT,
+                     "ttl_dns_cache": 300}
+        # Shared by every domain of every batch, so no cookie jar to accumulate state in
+        self.session = client_session(self.egress, connector, timeout=mvc4.TIMEOUT, cookie_jar=DummyCookieJar())
+        abv3.configure_egress(self.egress)
+        if "framework" not in self.analyzers:
+            return
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        for _ in range(BROWSER_POOL_SIZE):
+            self._browsers.append(await self._playwright.chromium.launch(headless=True))
+
+    async def stop(self, app):
+        await self.session.close()
+        for browser in self._browsers:
+            await browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        for driver in self._ab_drivers + [self._details_driver]:
+            if driver is not None:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+        self._ab_executor.shutdown(wait=False)
+        abv3.close_script_fetcher()
+        self.templates.save()
+        self.index.close()
+
+    def _browser(self):
+        browser = self._browsers[self._next_browser % len(self._browsers)]
+        self._next_browser += 1
+        return browser
+
+    async def scan_framework(self, domain, deadline):
+        claim = self.shares["framework"].claim(domain, deadline)
+        try:
+            result = await mvc4.fetch(self.session, domain, deadline, self.recrawl["framework"], self._browser(),
+                                      on_response=claim.on_response, templates=self.templates)
+        except BaseException:
+            claim.abandon()
+            raise
+        claim.finish(result, shareable=mvc4.result_row(result)[0] == STATUS_OK)
+        result = mvc4.shared_result(domain, result, claim)
+        state, row, error = mvc4.result_row(result)
+        # Failure reasons are only kept until they are reported; the service never calls save_failed()
+        mvc4.take_failures(domain)
+        self.index.record(result[0], mvc4.ANALYZER, state, row=row, error=error, ruleset_version=mvc4.RULESET_VERSION)
+        return state, row, error
+
+    async def _selenium_driver(self):
+        # One shared driver for the details fallback, started on first use
+        if self._details_driver_ready is None:
+            self._details_driver_ready = asyncio.get_running_loop().run_in_executor(None, details_scraper.init_selenium)
+        try:
+            self._details_driver = await asyncio.shield(self._details_driver_ready)
+        except Exception:
+            self._details_driver = None
+        return self._details_driver
+
+    async def scan_details(self, domain, deadline):
+        url = domain if domain.startswith(("http://", "https://")) else f"http://{domain}"
+        driver = await self._selenium_driver()
+        claim = self.shares["details"].claim(details_scraper.extract_domain(url), deadline)
+        try:
+            result = await details_scraper.fetch_url(self.session, url, driver, deadline, self.recrawl["details"],
+                                                     on_response=claim.on_response)
+        except BaseException:
+            claim.abandon()
+            raise
+        claim.finish(result, shareable=details_scraper.result_row(result, deadline)[0] == STATUS_OK)
+        details_scraper.record_result(self.index, url, result, deadline)
+        return details_scraper.result_row(result, deadline)
+
+    async def scan_meta(self, domain, deadline):
+        result = await deadline.run(meta_scraper.fetch(self.session, domain, self.recrawl["meta"]))
+        meta_scraper.failed_domains.discard(domain)  # reported here instead of in failed.txt
+        if result is None:
+            state, row, error = STATUS_FAILED, None, "no 200 response"
+        else:
+            state, row, error = STATUS_OK, {**result[1], "Domain": domain}, None
+        self.index.record(domain, meta_scraper.ANALYZER, state, row=row, error=error,
+                          ruleset_version=meta_scraper.RULESET_VERSION)
+        return state, row, error
+
+    def _scrape_ab(self, domain, deadline):
+        # Runs on an executor thread that keeps its own warm driver
+        driver = getattr(self._ab_local, "driver", None)
+        if driver is None:
+            driver = self._ab_local.driver = abv3.get_driver()
+            self._ab_drivers.append(driver)
+        row = abv3.scrape_domain(domain, driver, deadline)
+        if row is None:
+            # The driver may be what failed; start the next domain on a fresh one
+            self._ab_local.driver = None
+            self._ab_drivers.remove(driver)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        return row
+
+    async def scan_ab(self, domain, deadline):
+        row = await asyncio.get_running_loop().run_in_executor(self._ab_executor, self._scrape_ab, domain, deadline)
+        state, record, error = abv3.result_row(row)
+        self.index.record(domain, abv3.ANALYZER, state, row=record, error=error, ruleset_version=abv3.RULESET_VERSION)
+        return state, record, error
+
+    async def _run(self, analyzer, domain):
+        async with self.scheduler.slot(domain), self.limits[analyzer]:
+            deadline = Deadline(DOMAIN_BUDGET)
+            self.active += 1
+            try:
+                state, row, error = await self.analyzers[analyzer](domain, deadline)
+            except Exception as e:
+                state, row, error = STATUS_FAILED, None, repr(e)
+            finally:
+                self.active -= 1
+            self.index.record_history(domain, self.modules[analyzer].ANALYZER, deadline.elapsed(),
+                                      state != STATUS_FAILED, rendered="render" in deadline.stages)
+        return {"domain": domain, "analyzer": analyzer, "status": state, "row": row, "error": error}
+
+    async def handle_scan(self, request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="body must be JSON")
+        domains = [d.strip() for d in payload.get("domains", []) if isinstance(d, str) and d.strip()]
+        analyzers = payload.get("analyzers") or ["framework"]
+        unknown = [a for a in analyzers if a not in self.analyzers]
+        if unknown:
+            raise web.HTTPBadRequest(text=f"unknown analyzers: {', '.join(unknown)}")
+        if not domains or len(domains) > MAX_BATCH:
+            raise web.HTTPBadRequest(text=f"send between 1 and {MAX_BATCH} domains")
+
+        self.batches += 1
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        # Ordered by the history of the first analyzer requested (see priority.py)
+        domains = priority.plan(self.index, self.modules[analyzers[0]].ANALYZER, domains)
+        domains = await self.scheduler.plan(domains)
+        # Only a window of scans exists at a time, and near the memory budget new ones wait
+        # (see memory_governor.py); rows are streamed as they finish
+        finished = asyncio.Queue()
+        window = WINDOW_FACTOR * sum(CONCURRENCY[a] for a in set(analyzers))
+        batch = asyncio.ensure_future(run_windowed(((a, d) for d in domains for a in analyzers),
+                                                   lambda job: self._run(*job), window, finished.put_nowait,
+                                                   self.governor))
+        batch.add_done_callback(lambda _: finished.put_nowait(None))
+        try:
+            while True:
+                item = await finished.get()
+                if item is None:
+                    break
+                await response.write((json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
+            await batch
+        finally:
+            # Client went away: stop the rest of its batch
+            batch.cancel()
+            self.index.flush()
+        await response.write_eof()
+        return response
+
+    async def handle_stats(self, request):
+        return web.json_response({
+            "batches": self.batches,
+            "active": self.active,
+            "results": self.index.status_counts(),
+            "hedging": HEDGER.stats(),
+            "hosts": self.scheduler.stats(),
+            "reused": {name: r.reused for name, r in self.recrawl.items()},
+            "templates": self.templates.stats(),
+            "memory": self.governor.stats(),
+            "egress": self.egress.stats(),
+            "redirects": {name: share.stats() for name, share in self.shares.items()},
+        })
+
+
+def make_app(service=None, analyzers=None):
+    service = service or ScanService(analyzers)
+    app = web.Application()
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    app.router.add_post("/scan", service.handle_scan)
+    app.router.add_get("/stats", service.handle_stats)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the scanners as a long-lived local service")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--analyzers", nargs="+", choices=ANALYZERS, help="analyzers to serve (default: all)")
+    args = parser.parse_args(argv)
+    if args.unix:
+        web.run_app(make_app(analyzers=args.analyzers), path=args.unix)
+    else:
+        web.run_app(make_app(analyzers=args.analyzers), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
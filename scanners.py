@@ -0,0 +1,87 @@
+import argparse
+import importlib
+import os
+import sys
+
+# --- Library and command-line entry points ---
+# Runs any scraper from Python or from the shell. A scraper module, and with it
+# aiohttp, bs4, Selenium or Playwright, is only imported when a scan actually
+# runs, so importing this module or printing --help stays cheap for the many
+# short-lived shard processes. Settings are passed in; anything left out falls
+# back to the scraper's own defaults.
+#
+#   python scanners.py meta newdomains.txt --start 0 --end 5000 --output meta-0.csv
+#   python scanners.py details newdomains.txt --start 5000 --end 10000 --chromedriver /usr/bin/chromedriver
+#
+#   from scanners import scan
+#   scan("framework", ["example.com"], output_file="frameworks.csv", concurrency=20)
+
+SCANNERS = {
+    "framework": "mvc4",
+    "details": "details_scraper",
+    "meta": "scrapingdomains.meta_scraper",
+    "ab": "abv3",
+}
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# abv3 imports its helper modules as top-level modules
+USER_INTERACTION = os.path.join(ROOT, "user_interaction")
+
+
+def load(name):
+    if name not in SCANNERS:
+        raise ValueError(f"unknown scanner {name!r}, expected one of: {', '.join(SCANNERS)}")
+    for path in (ROOT, USER_INTERACTION):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return importlib.import_module(SCANNERS[name])
+
+
+def read_domains(path, start=0, end=None):
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return [line.strip() for line in f if line.strip()][start:end]
+
+
+def scan(name, domains, **options):
+    # -> {"domains", "ok", "failed"}; rows go to the output file and the result index
+    return load(name).scan(list(domains), **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run one of the scrapers over a slice of a domain list")
+    parser.add_argument("scanner", choices=sorted(SCANNERS))
+    parser.add_argument("input", help="domain list, one per line")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--end", type=int)
+    parser.add_argument("--output", dest="output_file", help="output file (default: the scraper's own)")
+    parser.add_argument("--format", dest="fmt", help="csv, jsonl.zst, parquet or arrow")
+    parser.add_argument("--index", dest="index_path", help="result index database")
+    parser.add_argument("--skip-completed", action="store_true", default=None,
+                        help="only scan domains without a current result in the index")
+    parser.add_argument("--concurrency", type=int, help="parallel requests (threads for ab)")
+    parser.add_argument("--recrawl", dest="recrawl_enabled", action="store_true", default=None,
+                        help="reuse stored results for unchanged pages")
+    parser.add_argument("--chromedriver", dest="chromedriver_path", help="chromedriver binary (details)")
+    parser.add_argument("--memory-budget", dest="memory_budget_mb", type=int,
+                        help="memory budget in MB; intake pauses near it (0 disables, see memory_governor.py)")
+    parser.add_argument("--egress", help="comma-separated source addresses or proxy URLs (see egress.py)")
+    args = parser.parse_args(argv)
+
+    options = {k: v for k, v in vars(args).items()
+               if k not in ("scanner", "input", "start", "end") and v is not None}
+    if args.scanner == "ab":
+        if "recrawl_enabled" in options or "chromedriver_path" in options:
+            parser.error("ab supports neither --recrawl nor --chromedriver")
+        if "concurrency" in options:
+            options["threads"] = options.pop("concurrency")
+    elif "chromedriver_path" in options and args.scanner != "details":
+        parser.error("--chromedriver only applies to details")
+
+    domains = read_domains(args.input, args.start, args.end)
+    if not domains:
+        print("No domains in range")
+        return
+    print(scan(args.scanner, domains, **options))
+
+
+if __name__ == "__main__":
+    main()
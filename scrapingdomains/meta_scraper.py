@@ -1,21 +1,36 @@
-import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
 import csv
 import os
+import sys
 from aiohttp import ClientSession, ClientTimeout, DummyCookieJar
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from egress import as_pool, client_session
+from hedging import HEDGER, hedged_get
+from memory_governor import MemoryGovernor, MEMORY_BUDGET_MB, WINDOW_FACTOR, run_windowed
+from output_sinks import open_sink
+from result_index import ResultIndex, RESULT_DB, STATUS_OK, STATUS_FAILED
+from recrawl import Recrawl, page_hash
+from politeness import HostScheduler
+
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90 Safari/537.36"
 }
 
-csv.field_size_limit(2**31 - 1)
-
 BATCH_START = 785000
 BATCH_END = 785500
 CONCURRENT_REQUESTS = 100
 RETRIES = 1
 TIMEOUT = ClientTimeout(total=20)
+HEDGE_REQUESTS = True  # Hedge the page fetch on slow TTFB (see hedging.py)
+INPUT_FILE = "newdomains.txt"
+FAILED_FILE = "failed.txt"
+OUTPUT_FILE = "newdomains_tags.csv"
+OUTPUT_FORMAT = "csv"  # csv, jsonl.zst, parquet or arrow (see output_sinks.py)
+ANALYZER = "meta"  # key in the result index (see result_index.py)
+RULESET_VERSION = "1"
+SKIP_COMPLETED = False  # only scan domains without a current result in the index
+RECRAWL = False  # reuse stored results for pages that are unchanged since the last run (see recrawl.py)
 
 desired_column_order = [
     "Domain", "title", "og:title", "twitter:title",
@@ -26,133 +41,217 @@ desired_column_order = [
     "mobile-web-app-capable", "apple-mobile-web-app-title", "apple-mobile-web-app-status-bar-style",
     "google-site-verification", "msvalidate.01"
 ]
+OUTPUT_COLUMNS = desired_column_order  # same name as in the other scrapers (see scan_service.py)
 
 failed_domains = set()
 
-with open("newdomains.txt", "r") as f:
-    all_domains = [d.strip() for d in f if d.strip()]
-    domains = all_domains[BATCH_START:BATCH_END]
 
+# Looked up by name first, then by property
+EXTRA_TAGS = [
+    "og:type", "og:image", "twitter:image", "twitter:card",
+    "theme-color", "mobile-web-app-capable", "apple-mobile-web-app-title",
+    "apple-mobile-web-app-status-bar-style", "google-site-verification", "msvalidate.01",
+]
+
+
+def parse_html(html):
+    # Only <meta> and <link> elements are built into the tree; the rest of the page is tokenized and dropped
+    from bs4 import BeautifulSoup, SoupStrainer  # imported on first parse, not at module import
+    only = SoupStrainer(["meta", "link"])
+    try:
+        return BeautifulSoup(html, "lxml", parse_only=only)
+    except Exception:
+        return BeautifulSoup(html, "html.parser", parse_only=only)
+
+
+def dedup_fields(values, field_group):
+    seen, final_values = set(), {}
+    for key in field_group:
+        val = values.get(key)
+        if val:
+            if val not in seen:
+                final_values[key] = val
+                seen.add(val)
+            else:
+                final_values[key] = ""
+    return final_values
+
+
+def extract_tags(html):
+    # One pass over the page's meta and link elements; every column is then a dict lookup
+    soup = parse_html(html)
+    values = {}
+    meta_tags = {tag: "" for tag in desired_column_order[1:]}
+    by_name, by_property, links = {}, {}, {}  # first element per attribute value, as soup.find() would return
+
+    for tag in soup.find_all(["meta", "link"]):
+        if tag.name == "link":
+            rel = tag.get("rel") or []
+            if isinstance(rel, str):
+                rel = rel.split()
+            for kind in ("canonical", "icon"):  # rel="shortcut icon" contains "icon" too
+                if kind in rel:
+                    links.setdefault(kind, tag)
+            continue
+
+        name, prop = tag.get("name"), tag.get("property")
+        if name is not None:
+            by_name.setdefault(name, tag)
+        if prop is not None:
+            by_property.setdefault(prop, tag)
+        if tag.get("charset"):
+            meta_tags["charset"] = (tag.get("charset").strip())
+            continue
+        key = (name or prop or tag.get("itemprop") or "").lower().strip()
+        value = tag.get("content", "").strip()
+        if not key or not value:
+            continue
+        values[key] = (value)
+
+    canonical = links.get("canonical")
+    if canonical and canonical.get("href"):
+        values["canonical"] = (canonical.get("href").strip())
+
+    favicon = links.get("icon")
+    if favicon and favicon.get("href"):
+        values["favicon"] = (favicon.get("href").strip())
+
+    for tag in EXTRA_TAGS:
+        meta = by_name.get(tag) or by_property.get(tag)
+        if meta and meta.get("content"):
+            values[tag] = (meta.get("content").strip())
+
+    title_vals = dedup_fields(values, ["title", "og:title", "twitter:title"])
+    desc_vals = dedup_fields(values, ["description", "og:description", "twitter:description"])
+    url_vals = dedup_fields(values, ["og:url", "canonical", "favicon"])
 
-async def fetch(session: ClientSession, domain: str, retries=RETRIES):
-    for protocol in ["https", "http"]:
-        url = f"{protocol}://{domain}"
+    for k, v in {**values, **title_vals, **desc_vals, **url_vals}.items():
+        if k in meta_tags:
+            meta_tags[k] = (v)
+
+    soup.decompose()  # breaks the tree's reference cycles so it is freed right away
+    return meta_tags
+
+
+async def fetch(session: ClientSession, domain: str, recrawl: Recrawl, retries=RETRIES):
+    previous = recrawl.previous(domain)
+    # Full URLs (e.g. local stand-in sites) are fetched as given
+    urls = [domain] if domain.startswith(("http://", "https://")) else [f"https://{domain}", f"http://{domain}"]
+    for url in urls:
         try:
-            async with session.get(url, headers=headers, timeout=TIMEOUT) as resp:
+            async with await hedged_get(session, url, enabled=HEDGE_REQUESTS,
+                                        headers=recrawl.headers(url, headers, previous), timeout=TIMEOUT) as resp:
+                if resp.status == 304 and recrawl.unchanged(url, previous, resp.status):
+                    return domain, {k: v for k, v in previous.items() if k != "Domain"}
                 if resp.status != 200:
                     return None
 
                 html = await resp.text(errors="ignore")
+                body_hash = page_hash(html)
+                if recrawl.unchanged(url, previous, resp.status, body_hash):
+                    return domain, {k: v for k, v in previous.items() if k != "Domain"}
 
-                try:
-                    soup = BeautifulSoup(html, "lxml")
-                except Exception:
-                    soup = BeautifulSoup(html, "html.parser")
-
-                values = {}
-                meta_tags = {tag: "" for tag in desired_column_order[1:]}
-
-                for tag in soup.find_all("meta"):
-                    key = (tag.get("name") or tag.get("property") or tag.get("itemprop") or "").lower().strip()
-                    value = tag.get("content", "").strip()
-                    if key == "title":
-                        values["meta:title"] = (value)
-
-                for tag in soup.find_all("meta"):
-                    if tag.get("charset"):
-                        meta_tags["charset"] = (tag.get("charset").strip())
-                        continue
-                    key = (tag.get("name") or tag.get("property") or tag.get("itemprop") or "").lower().strip()
-                    value = tag.get("content", "").strip()
-                    if not key or not value:
-                        continue
-                    values[key] = (value)
-
-                canonical = soup.find("link", rel="canonical")
-                if canonical and canonical.get("href"):
-                    values["canonical"] = (canonical.get("href").strip())
-
-                favicon = soup.find("link", rel="icon") or soup.find("link", rel="shortcut icon")
-                if favicon and favicon.get("href"):
-                    values["favicon"] = (favicon.get("href").strip())
-
-                for tag in ["og:type", "og:image", "twitter:image", "twitter:card",
-                            "theme-color", "mobile-web-app-capable", "apple-mobile-web-app-title",
-                            "apple-mobile-web-app-status-bar-style", "google-site-verification", "msvalidate.01"]:
-                    meta = soup.find("meta", attrs={"name": tag}) or soup.find("meta", attrs={"property": tag})
-                    if meta and meta.get("content"):
-                        values[tag] = (meta.get("content").strip())
-
-                def dedup_fields(field_group):
-                    seen, final_values = set(), {}
-                    for key in field_group:
-                        val = values.get(key)
-                        if val:
-                            if val not in seen:
-                                final_values[key] = val
-                                seen.add(val)
-                            else:
-                                final_values[key] = ""
-                    return final_values
-
-                title_vals = dedup_fields(["title", "og:title", "twitter:title"])
-                desc_vals = dedup_fields(["description", "og:description", "twitter:description"])
-                url_vals = dedup_fields(["og:url", "canonical", "favicon"])
-
-                for k, v in {**values, **title_vals, **desc_vals, **url_vals}.items():
-                    if k in meta_tags:
-                        meta_tags[k] = (v)
-
+                meta_tags = extract_tags(html)
+                recrawl.remember(url, resp.headers, body_hash)
                 return domain, meta_tags
 
         except Exception as e:
             
             if retries > 0:
                 await asyncio.sleep(0.5)
-                return await fetch(session, domain, retries - 1)
+                return await fetch(session, domain, recrawl, retries - 1)
             else:
-                if domain not in failed_domains:
-                    failed_domains.add(domain)
-                    with open("failed.txt", "a") as fail_log:
-                        fail_log.write(f"{domain}\n")
+                failed_domains.add(domain)
                 return None
 
 
-async def worker(queue: asyncio.Queue, session: ClientSession, results: list):
-    while not queue.empty():
-        domain = await queue.get()
-        result = await fetch(session, domain)
+async def run(domains, index, concurrency=CONCURRENT_REQUESTS, recrawl_enabled=RECRAWL, on_result=None,
+              governor=None, egress=None):
+    # Returns the successful results, unless on_result(domain, result) takes each one as it finishes
+    results = []
+
+    def collect(domain, result):
         if result:
             results.append(result)
-        queue.task_done()
 
-async def main():
-    queue = asyncio.Queue()
-    for domain in domains:
-        await queue.put(domain)
+    on_result = on_result or collect
+    recrawl = Recrawl(index, ANALYZER, RULESET_VERSION, enabled=recrawl_enabled)
+    scheduler = HostScheduler()
+    domains = await scheduler.plan(domains)
+    sem = asyncio.Semaphore(concurrency)
 
-    results = []
-    connector = aiohttp.TCPConnector(limit=CONCURRENT_REQUESTS, ttl_dns_cache=300)
-    async with aiohttp.ClientSession(connector=connector, 
+    connector = {"limit": concurrency, "ttl_dns_cache": 300}
+    async with client_session(as_pool(egress), connector,
                 timeout=TIMEOUT,
                 cookie_jar=DummyCookieJar()) as session:
-        tasks = [worker(queue, session, results) for _ in range(CONCURRENT_REQUESTS)]
-        await asyncio.gather(*tasks)
+        async def bounded(domain):
+            # Per-host slot first, so a busy host does not hold one of the global slots while it waits
+            async with scheduler.slot(domain), sem:
+                result = await fetch(session, domain, recrawl)
+            if result:
+                index.record(domain, ANALYZER, STATUS_OK, row={**result[1], "Domain": domain}, ruleset_version=RULESET_VERSION)
+            else:
+                index.record(domain, ANALYZER, STATUS_FAILED, error="no 200 response", ruleset_version=RULESET_VERSION)
+            return domain, result
 
+        await run_windowed(domains, bounded, concurrency * WINDOW_FACTOR, lambda done: on_result(*done), governor)
+
+    print(f"Reused unchanged results: {recrawl.reused}")
+    print(f"Host scheduling: {scheduler.stats()}")
     return results
 
-results = asyncio.run(main())
 
-file_exists = os.path.exists("newdomains_tags.csv") and os.path.getsize("newdomains_tags.csv") > 0
-with open("newdomains_tags.csv", "a", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=desired_column_order)
-    if not file_exists:
-        writer.writeheader()
-    for result in results:
+def load_domains(filename=INPUT_FILE, start=BATCH_START, end=BATCH_END):
+    with open(filename, "r") as f:
+        return [d.strip() for d in f if d.strip()][start:end]
+
+
+def save_failed(filename=FAILED_FILE, domains=None):
+    domains = sorted(failed_domains) if domains is None else domains
+    with open(filename, "a") as fail_log:
+        for domain in domains:
+            fail_log.write(f"{domain}\n")
+    failed_domains.difference_update(domains)
+
+
+def scan(domains, output_file=OUTPUT_FILE, fmt=OUTPUT_FORMAT, index_path=RESULT_DB,
+         skip_completed=SKIP_COMPLETED, failed_file=FAILED_FILE, memory_budget_mb=MEMORY_BUDGET_MB, **options):
+    # Library entry point; options go to run (concurrency, recrawl_enabled, egress).
+    # Rows and failures are written as each domain finishes, so memory does not grow with the batch.
+    index = ResultIndex(index_path)
+    index.register(ANALYZER, desired_column_order)
+    if skip_completed:
+        domains = index.pending(ANALYZER, domains, RULESET_VERSION)
+    governor = MemoryGovernor(memory_budget_mb)
+    counts = {"domains": len(domains), "ok": 0, "failed": 0}
+    sink = open_sink(output_file, desired_column_order, fmt)
+
+    def on_result(domain, result):
         if result is None:
-            continue
-        domain, meta_data = result
+            counts["failed"] += 1
+            if domain in failed_domains:
+                save_failed(failed_file, [domain])
+            return
+        counts["ok"] += 1
+        meta_data = result[1]
         meta_data["Domain"] = domain
-        writer.writerow(meta_data)
+        sink.write_row(meta_data)
+
+    try:
+        asyncio.run(run(domains, index, on_result=on_result, governor=governor, **options))
+    finally:
+        sink.close()
+        index.close()
+    print(f"Memory: {governor.stats()}")
+    return counts
+
+
+def main():
+    csv.field_size_limit(2**31 - 1)
+    scan(load_domains())
+    print(f"Finished scraping batch: {BATCH_START}-{BATCH_END}")
+    print(f"Hedged requests: {HEDGER.stats()}")
+
 
-print(f"Finished scraping batch: {BATCH_START}-{BATCH_END}")
+if __name__ == "__main__":
+    main()
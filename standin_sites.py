@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+# --- Local stand-in sites ---
+# A few small sites with known content, each on its own 127.0.0.1 port, for
+# exercising the scan service without touching the internet. "check" starts
+# them together with an in-process scan service, submits one batch and compares
+# the streamed rows with what each page is known to contain.
+#
+#   python standin_sites.py serve                      # sites only, scan them with any scraper
+#   python standin_sites.py check                      # meta + details, no browser needed
+#   python standin_sites.py check --analyzers framework meta details ab
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SITE_HOST = "127.0.0.1"
+PORT_BASE = 8801
+CHECK_ANALYZERS = ["meta", "details"]
+CHECK_TIMEOUT = 300  # seconds for the whole batch
+
+STOREFRONT = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Stand-in Store</title>
+<meta name="description" content="Everything a stand-in store sells">
+<meta property="og:title" content="Stand-in Store">
+<meta property="og:type" content="website">
+<meta name="theme-color" content="#336699">
+<link rel="canonical" href="https://store.example/">
+<link rel="icon" href="/favicon.ico">
+<script src="/static/react.min.js"></script>
+<script>window.optimizely = {"revision": "42", "experiments": [{"id": "1", "variant": "B"}]};</script>
+</head>
+<body>
+<div id="root" data-reactroot=""><h1>Stand-in Store</h1></div>
+<img src="/static/product.png" loading="lazy" alt="product">
+</body>
+</html>
+"""
+
+PLAIN = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Plain</title>
+<meta name="description" content="A page with nothing on it">
+</head>
+<body><p>Nothing to see here, just enough text to look like a real page.</p></body>
+</html>
+"""
+
+REACT_STUB = "/* react.min.js stand-in */ var React = {createElement: function () {}};"
+
+# name -> {path: (status, content type, body, extra headers)}
+SITES = {
+    "storefront": {
+        "/": (200, "text/html", STOREFRONT, {"Strict-Transport-Security": "max-age=31536000"}),
+        "/static/react.min.js": (200, "application/javascript", REACT_STUB, {}),
+    },
+    "plain": {
+        "/": (200, "text/html", PLAIN, {}),
+    },
+    "missing": {},
+}
+
+# (site, analyzer) -> {column: expected substring}, or None when the scan must fail
+EXPECTED = {
+    ("storefront", "meta"): {"og:title": "Stand-in Store", "canonical": "https://store.example/",
+                             "theme-color": "#336699"},
+    ("storefront", "details"): {"lazy_loading_images": "yes", "strict_transport_security": "max-age"},
+    ("storefront", "framework"): {"Frameworks": "React"},
+    ("storefront", "ab"): {"detected_platforms": "optimizely"},
+    ("plain", "meta"): {"description": "A page with nothing on it"},
+    ("plain", "framework"): {"Frameworks": ""},
+    ("missing", "meta"): None,
+    ("missing", "details"): None,
+}
+
+
+def site_app(pages):
+    async def handle(request):
+        page = pages.get(request.path)
+        if page is None:
+            raise web.HTTPNotFound()
+        status, content_type, body, headers = page
+        return web.Response(status=status, text=body, content_type=content_type, headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    return app
+
+
+async def start_sites(port_base=PORT_BASE):
+    # -> ({site: base url}, runners)
+    urls, runners = {}, []
+    for offset, (name, pages) in enumerate(SITES.items()):
+        runner = web.AppRunner(site_app(pages))
+        await runner.setup()
+        await web.TCPSite(runner, SITE_HOST, port_base + offset).start()
+        urls[name] = f"http://{SITE_HOST}:{port_base + offset}"
+        runners.append(runner)
+    return urls, runners
+
+
+def compare(item, expected):
+    # -> problem description, or None when the streamed row matches
+    if expected is None:
+        return None if item["status"] == "failed" else f"expected a failure, got {item['status']}"
+    if item["status"] == "failed":
+        return f"failed: {item['error']}"
+    row = item["row"] or {}
+    for column, value in expected.items():
+        actual = row.get(column) or ""
+        # An empty expectation means the column must be empty
+        if (value not in actual) if value else actual:
+            return f"{column} = {actual!r}, expected {value!r}"
+    return None
+
+
+async def check(analyzers=CHECK_ANALYZERS, port_base=PORT_BASE):
+    # Index, blobs, template cache and failed-domain files are written relative to the
+    # working directory, so the check runs in a scratch directory and then restores it
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="standin-")
+    os.chdir(workdir)
+    try:
+        return await _check(workdir, analyzers, port_base)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _check(workdir, analyzers, port_base):
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from scan_service import ScanService, make_app
+
+    urls, runners = await start_sites(port_base)
+    service_runner = web.AppRunner(make_app(ScanService(analyzers, index_path=os.path.join(workdir, "results.db"))))
+    await service_runner.setup()
+    await web.TCPSite(service_runner, SITE_HOST, 0).start()
+    service_port = service_runner.addresses[0][1]
+    sites = {url: name for name, url in urls.items()}
+    problems = []
+    try:
+        async with ClientSession(timeout=ClientTimeout(total=CHECK_TIMEOUT)) as client:
+            async with client.post(f"http://{SITE_HOST}:{service_port}/scan",
+                                   json={"domains": list(urls.values()), "analyzers": analyzers}) as resp:
+                if resp.status != 200:
+                    return [f"service answered {resp.status}: {await resp.text()}"]
+                seen = set()
+                async for line in resp.content:
+                    item = json.loads(line)
+                    key = (sites[item["domain"]], item["analyzer"])
+                    seen.add(key)
+                    problem = compare(item, EXPECTED[key]) if key in EXPECTED else None
+                    print(f"{key[0]:<12} {key[1]:<10} {item['status']:<8} {problem or 'ok'}")
+                    if problem:
+                        problems.append(f"{key[0]}/{key[1]}: {problem}")
+            missing = {(site, a) for site in urls for a in analyzers} - seen
+            problems += [f"{site}/{a}: no result streamed" for site, a in sorted(missing)]
+            async with client.get(f"http://{SITE_HOST}:{service_port}/stats") as resp:
+                stats = await resp.json()
+                print(f"Index: {stats['results']}")
+    finally:
+        await service_runner.cleanup()
+        for runner in runners:
+            await runner.cleanup()
+    return problems
+
+
+async def serve(port_base=PORT_BASE):
+    urls, runners = await start_sites(port_base)
+    for name, url in urls.items():
+        print(f"{name:<12} {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in sites for the scan service")
+    parser.add_argument("command", choices=["serve", "check"])
+    parser.add_argument("--analyzers", nargs="+", default=CHECK_ANALYZERS,
+                        choices=["framework", "details", "meta", "ab"])
+    parser.add_argument("--port-base", type=int, default=PORT_BASE)
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.port_base))
+        except KeyboardInterrupt:
+            pass
+        return
+    problems = asyncio.run(check(args.analyzers, args.port_base))
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# --- Page-template fingerprints ---
+# Platform-hosted sites (Shopify, Wix, Zyro, WordPress themes...) share their
+# script/stylesheet layout, generator tag and platform headers. The hash of
+# those features identifies the template; once a template has produced the
+# same probe/render outcome several times, later sites on it reuse that
+# outcome and skip probing and headless rendering.
+
+TEMPLATE_CACHE_FILE = ".template_cache.json"
+TEMPLATE_MIN_SAMPLES = 3  # identical outcomes needed before a template is trusted
+TEMPLATE_MIN_FEATURES = 4  # pages with fewer features are too generic to fingerprint
+TEMPLATE_MAX_ENTRIES = 200000  # per analyzer, least recently seen dropped first
+TEMPLATE_SCAN_CHARS = 512 * 1024
+
+TEMPLATE_HEADERS = (
+    "server", "x-powered-by", "x-generator", "x-shopify-stage", "x-shopid", "x-wix-request-id",
+    "x-drupal-cache", "x-pingback", "x-hostinger-datacenter", "x-zyro-request-id", "x-squarespace-content",
+)
+
+_SCRIPT_SRC = re.compile(r"<script\b[^>]*?\bsrc\s*=\s*[\"']([^\"']+)", re.I)
+_LINK_HREF = re.compile(r"<link\b[^>]*?\brel\s*=\s*[\"']?(?:stylesheet|preload|modulepreload)[^>]*?\bhref\s*=\s*[\"']([^\"']+)", re.I)
+_GENERATOR = re.compile(r"<meta\b[^>]*?\bname\s*=\s*[\"']generator[\"'][^>]*?\bcontent\s*=\s*[\"']([^\"']*)", re.I)
+# Store ids, theme versions and content hashes differ per site; the layout does not
+_VOLATILE = re.compile(r"[0-9a-f]{8,}|\d+")
+
+
+def _normalize_url(url, host):
+    parts = urlsplit(url.strip())
+    url_host = (parts.hostname or "").lower()
+    if not url_host or url_host == host or url_host.endswith("." + host):
+        url_host = "self"
+    return url_host + _VOLATILE.sub("#", parts.path.lower())
+
+
+def fingerprint(html, headers, host):
+    # -> (hex digest, number of features); headers must have lowercased names
+    host = (host or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    head = html[:TEMPLATE_SCAN_CHARS]
+    features = set()
+    features.update("script:" + _normalize_url(src, host) for src in _SCRIPT_SRC.findall(head))
+    features.update("link:" + _normalize_url(href, host) for href in _LINK_HREF.findall(head))
+    features.update("generator:" + _VOLATILE.sub("#", g.lower().strip()) for g in _GENERATOR.findall(head))
+    for name in TEMPLATE_HEADERS:
+        if name in headers:
+            features.add(f"header:{name}={_VOLATILE.sub('#', headers[name].lower())}")
+    digest = hashlib.sha1("\n".join(sorted(features)).encode("utf-8")).hexdigest()
+    return digest, len(features)
+
+
+class TemplateCache:
+    def __init__(self, path=TEMPLATE_CACHE_FILE, min_samples=TEMPLATE_MIN_SAMPLES):
+        self.path = path
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._entries = {name: OrderedDict(entries) for name, entries in self._load().items()}
+        self._delta = {}  # what this process learned since the last save, merged into the file by save()
+        self._warm = self._warm_analyzers()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _trusted(self, entry):
+        return entry[1] >= self.min_samples and not entry[2]
+
+    def _warm_analyzers(self):
+        return {name for name, entries in self._entries.items() if any(map(self._trusted, entries.values()))}
+
+    def warm(self, analyzer):
+        # Whether any template is trusted yet; until then a lookup cannot hit
+        return analyzer in self._warm
+
+    def lookup(self, analyzer, digest):
+        # Cached outcome for a trusted template, else None
+        with self._lock:
+            entry = self._entries.get(analyzer, {}).get(digest)
+            if entry and self._trusted(entry):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def learn(self, analyzer, digest, outcome):
+        # outcome must be JSON-serializable; a template that ever disagrees is never trusted
+        with self._lock:
+            for entries in (self._entries.setdefault(analyzer, OrderedDict()),
+                            self._delta.setdefault(analyzer, OrderedDict())):
+                _count(entries, digest, outcome, 1, 0)
+            if self._trusted(self._entries[analyzer][digest]):
+                self._warm.add(analyzer)
+
+    def save(self):
+        if not self.path:
+            return
+        # Shard processes share the file: under a file lock, re-read it and add only what was
+        # learned here since the last save, so no process overwrites another's entries
+        with self._lock:
+            delta, self._delta = self._delta, {}
+        with _file_lock(self.path + ".lock"):
+            data = {name: OrderedDict(entries) for name, entries in self._load().items()}
+            for analyzer, learned in delta.items():
+                entries = data.setdefault(analyzer, OrderedDict())
+                for digest, (outcome, agree, disagree) in learned.items():
+                    _count(entries, digest, outcome, agree, disagree)
+            text = json.dumps(data)
+            tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self.path)
+        with self._lock:
+            # Pick up what the other processes learned; anything learned meanwhile is re-applied
+            self._entries = data
+            for analyzer, learned in self._delta.items():
+                entries = data.setdefault(analyzer, OrderedDict())
+                for digest, (outcome, agree, disagree) in learned.items():
+                    _count(entries, digest, outcome, agree, disagree)
+            self._warm = self._warm_analyzers()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "templates": sum(len(e) for e in self._entries.values())}
+
+
+def _count(entries, digest, outcome, agree, disagree):
+    # Adds agree/disagree samples for one template; a different outcome counts as disagreement
+    entry = entries.get(digest)
+    if entry is None:
+        entries[digest] = [outcome, agree, disagree]
+    elif entry[0] == outcome:
+        entry[1] += agree
+        entry[2] += disagree
+    else:
+        entry[2] += agree + disagree
+    entries.move_to_end(digest)
+    while len(entries) > TEMPLATE_MAX_ENTRIES:
+        entries.popitem(last=False)
+
+
+@contextmanager
+def _file_lock(path):
+    # Advisory lock between processes where fcntl exists; elsewhere saves are only atomic
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -1,4 +1,3 @@
-import re
 import csv
 import json
 import time
@@ -14,6 +13,8 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from concurrent.futures import ThreadPoolExecutor
+from json_scan import iter_json_objects, iter_global_literals
+from ab_records import deep_extract, serialize_records
 
 AB_HINTS = {
     "optimizely": ["optimizely", "_opt_", "cdn.optimizely.com", "optimizelyData"],
@@ -32,6 +33,8 @@ KNOWN_GLOBALS = [
     "Qubit", "mbox", "__INITIAL_DATA__", "experiment", "experiments"
 ]
 
+GOAL_KEYS = ("goal",)
+
 INPUT_FILE = "newdomains.txt"
 OUTPUT_FILE = "ab_test_outputv2.csv"
 MAX_WORKERS = 5
@@ -48,39 +51,18 @@ def get_driver():
 
 def extract_ab_data(text):
     results = []
-    try:
-        json_blocks = re.findall(r'\{[^{}]{20,30000}\}', text)
-        for block in json_blocks:
-            try:
-                obj = json.loads(block)
-                results.extend(deep_extract(obj))
-            except:
-                continue
-    except:
-        pass
+    for obj in iter_json_objects(text):
+        results.extend(deep_extract(obj, goal_keys=GOAL_KEYS))
+    for _, obj in iter_global_literals(text, KNOWN_GLOBALS):
+        results.extend(deep_extract(obj, goal_keys=GOAL_KEYS))
     try:
         decoded = base64.b64decode(text).decode("utf-8")
         obj = json.loads(decoded)
-        results.extend(deep_extract(obj))
+        results.extend(deep_extract(obj, goal_keys=GOAL_KEYS))
     except:
         pass
     return results
 
-def deep_extract(obj, prefix=""):
-    kvs = []
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            full_key = f"{prefix}.{k}" if prefix else k
-            if "variant" in k.lower():
-                kvs.append(f"variant::{full_key}={v}")
-            elif "goal" in k.lower():
-                kvs.append(f"goal::{full_key}={v}")
-            kvs.extend(deep_extract(v, full_key))
-    elif isinstance(obj, list):
-        for idx, item in enumerate(obj):
-            kvs.extend(deep_extract(item, f"{prefix}[{idx}]"))
-    return kvs
-
 def detect_platforms(text):
     detected = set()
     for tool, hints in AB_HINTS.items():
@@ -98,7 +80,7 @@ def scrape_domain(domain):
     for attempt in range(attempts):
         driver = get_driver()
         url = f"https://{domain}"
-        ab_config, detected, scripts = set(), set(), set()
+        ab_config, detected, scripts = [], set(), set()
 
         try:
             driver.set_page_load_timeout(30)
@@ -120,7 +102,7 @@ def scrape_domain(domain):
                     platforms = detect_platforms(script.string)
                     for tool in platforms:
                         scripts.add(f"inline::{tool}::{snip}")
-                    ab_config.update(extract_ab_data(script.string))
+                    ab_config.extend(extract_ab_data(script.string))
                     detected.update(platforms)
 
             # External scripts
@@ -133,14 +115,14 @@ def scrape_domain(domain):
                         platforms = detect_platforms(body)
                         for tool in platforms:
                             scripts.add(f"external::{tool}::{full_url}")
-                        ab_config.update(extract_ab_data(body))
+                        ab_config.extend(extract_ab_data(body))
                         detected.update(platforms)
                 except:
                     continue
 
             # Cookies
             for c in driver.get_cookies():
-                ab_config.update(extract_ab_data(c.get("value", "")))
+                ab_config.extend(extract_ab_data(c.get("value", "")))
                 detected.update(detect_platforms(c.get("name", "") + c.get("value", "")))
 
             # Local storage
@@ -153,7 +135,7 @@ def scrape_domain(domain):
                 return out;
             """)
             for k, v in ls.items():
-                ab_config.update(extract_ab_data(v))
+                ab_config.extend(extract_ab_data(v))
                 detected.update(detect_platforms(k + v))
 
             # Session storage
@@ -166,7 +148,7 @@ def scrape_domain(domain):
                 return out;
             """)
             for k, v in ss.items():
-                ab_config.update(extract_ab_data(v))
+                ab_config.extend(extract_ab_data(v))
                 detected.update(detect_platforms(k + v))
 
             # Known window globals
@@ -176,10 +158,10 @@ def scrape_domain(domain):
                     if val:
                         if var == "__INITIAL_STATE__":
                             if "optimist" in str(val) or "variationId" in str(val):
-                                ab_config.update(extract_ab_data(json.dumps(val)))
+                                ab_config.extend(extract_ab_data(json.dumps(val)))
                                 detected.add("optimizely")
                         else:
-                            ab_config.update(extract_ab_data(json.dumps(val)))
+                            ab_config.extend(extract_ab_data(json.dumps(val)))
                 except:
                     continue
 
@@ -188,7 +170,7 @@ def scrape_domain(domain):
                 dl = driver.execute_script("return window.dataLayer")
                 if isinstance(dl, list):
                     for entry in dl:
-                        ab_config.update(extract_ab_data(json.dumps(entry)))
+                        ab_config.extend(extract_ab_data(json.dumps(entry)))
             except:
                 pass
 
@@ -199,13 +181,13 @@ def scrape_domain(domain):
                     if 'postMessage' in entry.get("message", ""):
                         msg = entry["message"]
                         detected.update(detect_platforms(msg))
-                        ab_config.update(extract_ab_data(msg))
+                        ab_config.extend(extract_ab_data(msg))
             except:
                 pass
 
             return [
                 domain,
-                ";".join(sorted(ab_config)),
+                ab_config,
                 ";".join(sorted(detected)),
                 ";".join(sorted(scripts))
             ]
@@ -237,6 +219,7 @@ def main():
             for future in futures:
                 try:
                     result = future.result()
+                    result[1] = serialize_records(result[1])
                     with lock:
                         writer.writerow(result)
                 except Exception as e:
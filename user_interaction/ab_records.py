@@ -0,0 +1,98 @@
+import re
+import reprlib
+from functools import lru_cache
+
+# --- Settings ---
+GOAL_KEYS = ("goal", "metric", "track", "kpi")
+MAX_DEPTH = 32
+MAX_NODES = 50000
+MAX_VALUE_CHARS = 500
+
+_VARIANT_KEY = re.compile("variant", re.I)
+
+_value_repr = reprlib.Repr()
+_value_repr.maxlevel = 3
+_value_repr.maxdict = 10
+_value_repr.maxlist = 10
+_value_repr.maxstring = MAX_VALUE_CHARS
+_value_repr.maxother = MAX_VALUE_CHARS
+
+
+@lru_cache(maxsize=8)
+def _goal_pattern(goal_keys):
+    return re.compile("|".join(re.escape(k) for k in goal_keys), re.I)
+
+
+@lru_cache(maxsize=8192)
+def classify_key(key, goal_keys=GOAL_KEYS):
+    if _VARIANT_KEY.search(key):
+        return "variant"
+    if _goal_pattern(goal_keys).search(key):
+        return "goal"
+    return None
+
+
+def deep_extract(obj, goal_keys=GOAL_KEYS, max_depth=MAX_DEPTH, max_nodes=MAX_NODES):
+    # Records are (kind, path, value). A path is a linked (parent, key) pair so
+    # extending it is O(1); it is only turned into "a.b[0].c" by format_record.
+    # Every container, key and list item visited counts against max_nodes.
+    records = []
+    stack = [(obj, None, 0)]
+    nodes = 0
+    while stack and nodes < max_nodes:
+        node, path, depth = stack.pop()
+        nodes += 1
+        if depth >= max_depth:
+            continue
+        if isinstance(node, dict):
+            for k, v in node.items():
+                nodes += 1
+                if nodes > max_nodes:
+                    break
+                key = str(k)
+                key_path = (path, key)
+                kind = classify_key(key, goal_keys)
+                if kind:
+                    records.append((kind, key_path, v))
+                if isinstance(v, (dict, list)):
+                    stack.append((v, key_path, depth + 1))
+        elif isinstance(node, list):
+            for i, item in enumerate(node):
+                nodes += 1
+                if nodes > max_nodes:
+                    break
+                if isinstance(item, (dict, list)):
+                    # Items of a root-level list keep bare paths ("key", not "[0].key"), as before
+                    stack.append((item, (path, i) if path else None, depth + 1))
+    return records
+
+
+def format_path(path):
+    parts = []
+    while path:
+        path, key = path
+        parts.append(key)
+    out = ""
+    for key in reversed(parts):
+        if isinstance(key, int):
+            out += f"[{key}]"
+        else:
+            out = f"{out}.{key}" if out else key
+    return out
+
+
+def format_value(value, max_chars=MAX_VALUE_CHARS):
+    if isinstance(value, (dict, list)):
+        text = _value_repr.repr(value)
+    else:
+        text = str(value)
+    return text[:max_chars]
+
+
+def format_record(record):
+    kind, path, value = record
+    return f"{kind}::{format_path(path)}={format_value(value)}"
+
+
+def serialize_records(records):
+    return ";".join(sorted({format_record(r) for r in records}))
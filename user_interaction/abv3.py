@@ -1,17 +1,27 @@
-import csv
 import json
-import re
+import os
+import sys
 import base64
+import re
 import time
+import queue
 import threading
-import requests
-from urllib.parse import urljoin
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+from json_scan import iter_json_objects, iter_global_literals
+from ab_records import deep_extract, serialize_records
+from script_fetcher import LRUCache, ScriptFetcher, SCRIPT_MAX_BYTES
+from network_capture import enable_capture, start_capture, collect_responses, document_response
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from block_profiles import apply_cdp_blocking, count_blocked
+from deadline import Deadline, BUDGET_MARKER, DOMAIN_BUDGET
+from egress import as_pool
+from memory_governor import MemoryGovernor, MEMORY_BUDGET_MB
+from output_sinks import open_sink
+import priority
+from result_index import ResultIndex, RESULT_DB, STATUS_OK, STATUS_PARTIAL, STATUS_FAILED
+from template_cache import TemplateCache, TEMPLATE_MIN_FEATURES, TEMPLATE_SCAN_CHARS, fingerprint
 
 AB_HINTS = {
     "optimizely": ["optimizely", "_opt_", "cdn.optimizely.com", "optimizelyData"],
@@ -42,20 +52,249 @@ KNOWN_GLOBALS = [
 
 INPUT_FILE = "newdomains.txt"
 OUTPUT_FILE = "ab_test_outputv4.csv"
+OUTPUT_FORMAT = "csv"  # csv, jsonl.zst, parquet or arrow (see output_sinks.py)
+OUTPUT_COLUMNS = ["domain", "ab_configuration", "detected_platforms", "ab_tool_scripts"]
+BLOB_COLUMNS = ["ab_configuration", "ab_tool_scripts"]  # see blob_store.py
+ANALYZER = "abv3"  # key in the result index (see result_index.py)
+RULESET_VERSION = "1"  # bump when AB_HINTS or the extractors change
+SKIP_COMPLETED = False  # only scan domains without a current result in the index
 FAILED_FILE = "failed.txt"
 BATCH_START = 200
 BATCH_END = 300
 THREADS = 5
+BLOCK_PROFILE = "ab"
+SCRIPT_RESULT_CACHE_SIZE = 20000
+TEMPLATE_CACHE = True  # skip the browser on known page templates (see template_cache.py)
+STATIC_FETCH_TIMEOUT = 5
+STATIC_FETCH_MAX_BYTES = 1024 * 1024
+STATIC_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_INLINE_SCRIPT = re.compile(r"<script\b(?![^>]*\bsrc\s*=)[^>]*>(.*?)</script>", re.I | re.S)
+_SCRIPT_SRC = re.compile(r"<script\b[^>]*?\bsrc\s*=\s*[\"']([^\"']+)", re.I)
+
+# Bounds for the in-page harvest payload
+HARVEST_MAX_VALUE_CHARS = 20000
+HARVEST_MAX_SCRIPT_CHARS = 1000000
+HARVEST_MAX_DEPTH = 12
+HARVEST_MAX_TOTAL_CHARS = 8000000
+HARVEST_TRUNCATED_MARKER = "harvest_truncated"  # a bound above cut the payload; the row is partial
+
+# Collects readyState, scripts, storage, KNOWN_GLOBALS and dataLayer in a single
+# execute_script call. Cookies come from driver.get_cookies() instead, since
+# document.cookie hides the HttpOnly ones many A/B tools keep assignments in.
+# Values are cloned with cycle and depth guards and the whole payload is
+# returned as one JSON string, with truncated set when a bound cut it short.
+HARVEST_SCRIPT = """
+var names = arguments[0], maxValue = arguments[1], maxScript = arguments[2],
+    maxDepth = arguments[3], budget = arguments[4];
+var truncated = false;
+
+function cut(s, limit) {
+    if (s.length > limit) { s = s.slice(0, limit); truncated = true; }
+    budget -= s.length;
+    return s;
+}
+
+function clone(v, depth, stack) {
+    if (budget <= 0) { truncated = true; return null; }
+    if (v === null || v === undefined) return null;
+    var t = typeof v;
+    if (t === "string") return cut(v, maxValue);
+    if (t === "number") { budget -= 8; return isFinite(v) ? v : String(v); }
+    if (t === "boolean") { budget -= 5; return v; }
+    if (t !== "object") return null;
+    if (depth >= maxDepth) { truncated = true; return "[depth]"; }
+    if (stack.indexOf(v) !== -1) return "[circular]";
+    stack.push(v);
+    var out = null;
+    try {
+        if (Array.isArray(v)) {
+            out = [];
+            for (var i = 0; i < v.length && budget > 0; i++) out.push(clone(v[i], depth + 1, stack));
+        } else if (!(typeof Node !== "undefined" && v instanceof Node) && v !== window) {
+            out = {};
+            var keys = Object.keys(v);
+            for (var j = 0; j < keys.length && budget > 0; j++) {
+                var val;
+                try { val = v[keys[j]]; } catch (e) { continue; }
+                budget -= keys[j].length;
+                out[keys[j]] = clone(val, depth + 1, stack);
+            }
+        }
+    } catch (e) {}
+    stack.pop();
+    if (budget <= 0) truncated = true;
+    return out;
+}
+
+function storage(name) {
+    var out = {};
+    try {
+        var s = window[name];
+        for (var i = 0; i < s.length && budget > 0; i++) {
+            var k = s.key(i);
+            out[k] = cut(s.getItem(k) || "", maxValue);
+        }
+    } catch (e) {}
+    return out;
+}
+
+var out = {
+    readyState: document.readyState,
+    inline_scripts: [],
+    script_srcs: [],
+    localStorage: storage("localStorage"),
+    sessionStorage: storage("sessionStorage"),
+    globals: {},
+    dataLayer: null
+};
+
+var scripts = document.scripts;
+for (var i = 0; i < scripts.length; i++) {
+    var s = scripts[i];
+    if (s.src) {
+        out.script_srcs.push(s.src);
+    } else if (s.text && budget > 0) {
+        out.inline_scripts.push(cut(s.text, maxScript));
+    }
+}
+
+for (var n = 0; n < names.length; n++) {
+    var g;
+    try { g = window[names[n]]; } catch (e) { continue; }
+    if (g !== undefined && g !== null) out.globals[names[n]] = clone(g, 0, []);
+}
+try { out.dataLayer = clone(window.dataLayer, 0, []); } catch (e) {}
+
+out.truncated = truncated;
+return JSON.stringify(out);
+"""
 
 def get_driver():
+    # Selenium is imported with the first driver; template-cache hits never need it
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
     opts = Options()
     opts.add_argument("--headless=new")
     opts.add_argument("--disable-gpu")
     opts.add_argument("--no-sandbox")
     opts.add_argument("--window-size=1920,1080")
+    enable_capture(opts)
     return webdriver.Chrome(options=opts)
 
 
+_script_fetcher = None
+_script_fetcher_lock = threading.Lock()
+_script_results = LRUCache(SCRIPT_RESULT_CACHE_SIZE)
+_templates = None
+_templates_lock = threading.Lock()
+_egress = None  # EgressPool for the static fetch and script downloads, set by configure_egress()
+metrics = {"blocked_requests": 0}
+metrics_lock = threading.Lock()
+
+
+def get_script_fetcher():
+    global _script_fetcher
+    with _script_fetcher_lock:
+        if _script_fetcher is None:
+            _script_fetcher = ScriptFetcher(egress=_egress)
+        return _script_fetcher
+
+
+def configure_egress(egress=None):
+    # Takes effect for script downloads once the current script fetcher is closed
+    global _egress
+    _egress = as_pool(egress)
+    return _egress
+
+
+def close_script_fetcher():
+    # The next get_script_fetcher() starts a fresh one, so scan() can be called again
+    global _script_fetcher
+    with _script_fetcher_lock:
+        if _script_fetcher is not None:
+            _script_fetcher.close()
+            _script_fetcher = None
+
+
+def get_templates():
+    global _templates
+    with _templates_lock:
+        if _templates is None:
+            _templates = TemplateCache()
+        return _templates
+
+
+def fetch_static(url, timeout=STATIC_FETCH_TIMEOUT):
+    # Plain GET of the page for the template fingerprint: (final url, html, headers) or None
+    if timeout <= 0:
+        return None
+    request = urllib.request.Request(url, headers={"User-Agent": STATIC_USER_AGENT})
+    try:
+        opener = _egress.urlopen if _egress else urllib.request.urlopen
+        with opener(request, timeout=timeout) as resp:
+            charset = resp.headers.get_content_charset() or "utf-8"
+            html = resp.read(STATIC_FETCH_MAX_BYTES).decode(charset, errors="ignore")
+            return resp.geturl(), html, {k.lower(): v for k, v in resp.headers.items()}
+    except Exception:
+        return None
+
+
+def scrape_static(domain, page_url, html, cached, template, deadline):
+    # Known template: the platforms its rendered pages showed, plus what the static HTML holds
+    ab_config, detected, scripts = [], set(), set()
+    for text in _INLINE_SCRIPT.findall(html):
+        snippet = text[:200].replace("\n", " ")
+        platforms = detect_platforms(text)
+        for tool in platforms:
+            scripts.add(f"inline::{tool}::{snippet}")
+        ab_config.extend(extract_ab_data(text))
+        detected.update(platforms)
+
+    srcs = [urljoin(page_url, src) for src in _SCRIPT_SRC.findall(html)]
+    entries = get_script_fetcher().fetch_many(srcs, timeout=deadline.remaining())
+    for full_url, entry in entries.items():
+        if not entry:
+            continue
+        platforms, records = analyze_script(entry)
+        for tool in platforms:
+            scripts.add(f"external::{tool}::{full_url}")
+        ab_config.extend(records)
+        detected.update(platforms)
+
+    for tool in cached:
+        if tool not in detected:
+            scripts.add(f"template::{tool}::{template[:12]}")
+    detected.update(cached)
+    return [domain, ab_config, ";".join(sorted(detected)), ";".join(sorted(scripts))]
+
+
+def analyze_script(entry):
+    # Detection results are keyed by script content, so a CDN file shared by
+    # many sites is analyzed once per run
+    result = _script_results.get(entry["key"])
+    if result is None:
+        body = entry["body"]
+        result = (detect_platforms(body), extract_ab_data(body))
+        _script_results.put(entry["key"], result)
+    return result
+
+
+def harvest_page(driver):
+    raw = driver.execute_script(
+        HARVEST_SCRIPT, KNOWN_GLOBALS, HARVEST_MAX_VALUE_CHARS,
+        HARVEST_MAX_SCRIPT_CHARS, HARVEST_MAX_DEPTH, HARVEST_MAX_TOTAL_CHARS
+    )
+    page = json.loads(raw) if raw else {}
+    try:
+        page["cookies"] = {c.get("name", ""): c.get("value", "")[:HARVEST_MAX_VALUE_CHARS]
+                           for c in driver.get_cookies()}
+    except Exception:
+        page["cookies"] = {}
+    return page
+
+
 def detect_platforms(text):
     detected = set()
     for tool, hints in AB_HINTS.items():
@@ -66,129 +305,133 @@ def detect_platforms(text):
     return detected
 
 
-def deep_extract(obj, prefix=""):
-    kvs = set()
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            full_key = f"{prefix}.{k}" if prefix else k
-            if "variant" in k.lower():
-                kvs.add(f"variant::{full_key}={v}")
-            elif any(x in k.lower() for x in ["goal", "metric", "track", "kpi"]):
-                kvs.add(f"goal::{full_key}={v}")
-            kvs.update(deep_extract(v, full_key))
-    elif isinstance(obj, list):
-        for i, item in enumerate(obj):
-            kvs.update(deep_extract(item, f"{prefix}[{i}]") if prefix else deep_extract(item))
-    return kvs
-
-
 def extract_ab_data(text):
-    results = set()
-    try:
-        json_blocks = re.findall(r'\{[^\{\}]{20,30000}\}', text)
-        for block in json_blocks:
-            try:
-                obj = json.loads(block)
-                results.update(deep_extract(obj))
-            except:
-                continue
-    except:
-        pass
+    results = []
+    for obj in iter_json_objects(text):
+        results.extend(deep_extract(obj))
+    for _, obj in iter_global_literals(text, KNOWN_GLOBALS):
+        results.extend(deep_extract(obj))
     try:
         decoded = base64.b64decode(text).decode("utf-8")
         obj = json.loads(decoded)
-        results.update(deep_extract(obj))
+        results.extend(deep_extract(obj))
     except:
         pass
     return results
 
 
-def scrape_domain(domain):
-    url = f"https://{domain}"
-    ab_config, detected, scripts = set(), set(), set()
-
+def scrape_domain(domain, driver=None, deadline=None):
+    # A driver passed in (e.g. from a warm pool) is reused and left running
+    own_driver = driver is None
+    url = domain if domain.startswith(("http://", "https://")) else f"https://{domain}"
+    ab_config, detected, scripts = [], set(), set()
+    deadline = deadline or Deadline(DOMAIN_BUDGET)
+
+    template = None
+    # The extra GET only pays off once some template is trusted; a cold cache learns
+    # from the document the browser downloads anyway (see below)
+    if TEMPLATE_CACHE and get_templates().warm(ANALYZER):
+        static = fetch_static(url, deadline.timeout(STATIC_FETCH_TIMEOUT))
+        if static:
+            page_url, html, headers = static
+            digest, features = fingerprint(html, headers, urlsplit(page_url).hostname)
+            if features >= TEMPLATE_MIN_FEATURES:
+                template = digest
+                cached = get_templates().lookup(ANALYZER, template)
+                if cached is not None:
+                    return scrape_static(domain, page_url, html, cached, template, deadline)
+
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    deadline.mark("render")
     for attempt in range(2):
-        driver = get_driver()
+        if own_driver:
+            driver = get_driver()
         try:
-            driver.set_page_load_timeout(30)
+            deadline.check()
+            driver.set_page_load_timeout(max(1, deadline.timeout(30)))
+            if not own_driver:
+                # A pooled driver carries the previous sites' cookies; each site starts clean
+                try:
+                    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                except Exception:
+                    pass
+            start_capture(driver)
+            apply_cdp_blocking(driver, BLOCK_PROFILE)
             driver.get(url)
-            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            time.sleep(5)
+            WebDriverWait(driver, deadline.timeout(15)).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+            time.sleep(deadline.timeout(5))
 
-            ready_state = driver.execute_script("return document.readyState")
-            if ready_state != "complete":
+            page = harvest_page(driver)
+            if page.get("readyState") != "complete":
                 raise Exception("Page did not load completely")
 
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-
-            for script in soup.find_all("script"):
-                if script.string:
-                    snippet = script.string[:200].replace("\n", " ")
-                    platforms = detect_platforms(script.string)
-                    for tool in platforms:
-                        scripts.add(f"inline::{tool}::{snippet}")
-                    ab_config.update(extract_ab_data(script.string))
-                    detected.update(platforms)
-
-            for script in soup.find_all("script", src=True):
-                full_url = urljoin(url, script['src'])
-                try:
-                    r = requests.get(full_url, timeout=5)
-                    if r.status_code == 200:
-                        body = r.text[:3000]
-                        platforms = detect_platforms(body)
-                        for tool in platforms:
-                            scripts.add(f"external::{tool}::{full_url}")
-                        ab_config.update(extract_ab_data(body))
-                        detected.update(platforms)
-                except:
-                    continue
-
-            for c in driver.get_cookies():
-                ab_config.update(extract_ab_data(c.get("value", "")))
-                detected.update(detect_platforms(c.get("name", "") + c.get("value", "")))
-
-            ls = driver.execute_script("""
-                var out = {};
-                for (var i = 0; i < localStorage.length; i++) {
-                    var k = localStorage.key(i);
-                    out[k] = localStorage.getItem(k);
-                }
-                return out;
-            """)
-            for k, v in ls.items():
-                ab_config.update(extract_ab_data(v))
-                detected.update(detect_platforms(k + v))
-
-            ss = driver.execute_script("""
-                var out = {};
-                for (var i = 0; i < sessionStorage.length; i++) {
-                    var k = sessionStorage.key(i);
-                    out[k] = sessionStorage.getItem(k);
-                }
-                return out;
-            """)
-            for k, v in ss.items():
-                ab_config.update(extract_ab_data(v))
-                detected.update(detect_platforms(k + v))
-
-            for var in KNOWN_GLOBALS:
-                try:
-                    val = driver.execute_script(f"return window.{var}")
-                    if val:
-                        ab_config.update(extract_ab_data(json.dumps(val)))
-                        detected.update(detect_platforms(str(val)))
-                except:
+            for text in page.get("inline_scripts", []):
+                snippet = text[:200].replace("\n", " ")
+                platforms = detect_platforms(text)
+                for tool in platforms:
+                    scripts.add(f"inline::{tool}::{snippet}")
+                ab_config.extend(extract_ab_data(text))
+                detected.update(platforms)
+
+            # Script and XHR bodies the browser already downloaded. Scripts keep the
+            # same prefix budget as fetched ones so detection does not depend on the path.
+            perf_log = driver.get_log("performance")
+            with metrics_lock:
+                metrics["blocked_requests"] += count_blocked(perf_log)
+            if TEMPLATE_CACHE and template is None:
+                document = document_response(driver, perf_log, TEMPLATE_SCAN_CHARS)
+                if document:
+                    digest, features = fingerprint(document[1], document[2], urlsplit(document[0]).hostname)
+                    if features >= TEMPLATE_MIN_FEATURES:
+                        template = digest
+            captured_urls = set()
+            for full_url, resource_type, body, key in collect_responses(driver, perf_log, script_chars=SCRIPT_MAX_BYTES):
+                captured_urls.add(full_url)
+                platforms, records = analyze_script({"key": key, "body": body})
+                source = "external" if resource_type == "Script" else "xhr"
+                for tool in platforms:
+                    scripts.add(f"{source}::{tool}::{full_url}")
+                ab_config.extend(records)
+                detected.update(platforms)
+
+            # Only scripts the capture missed (served from cache, evicted) are re-fetched
+            missing = [src for src in page.get("script_srcs", []) if src not in captured_urls]
+            entries = get_script_fetcher().fetch_many(missing, timeout=deadline.remaining())
+            if len(entries) < len(set(missing)):
+                deadline.exhausted = True
+            for full_url, entry in entries.items():
+                if not entry:
                     continue
-
-            try:
-                dl = driver.execute_script("return window.dataLayer")
-                if isinstance(dl, list):
-                    for entry in dl:
-                        ab_config.update(extract_ab_data(json.dumps(entry)))
-                        detected.update(detect_platforms(str(entry)))
-            except:
-                pass
+                platforms, records = analyze_script(entry)
+                for tool in platforms:
+                    scripts.add(f"external::{tool}::{full_url}")
+                ab_config.extend(records)
+                detected.update(platforms)
+
+            for name, value in page.get("cookies", {}).items():
+                ab_config.extend(extract_ab_data(value))
+                detected.update(detect_platforms(name + value))
+
+            for store in ("localStorage", "sessionStorage"):
+                for k, v in page.get(store, {}).items():
+                    ab_config.extend(extract_ab_data(v))
+                    detected.update(detect_platforms(k + v))
+
+            for var, val in page.get("globals", {}).items():
+                if val:
+                    blob = json.dumps(val)
+                    ab_config.extend(extract_ab_data(blob))
+                    detected.update(detect_platforms(blob))
+
+            dl = page.get("dataLayer")
+            if isinstance(dl, list):
+                for entry in dl:
+                    blob = json.dumps(entry)
+                    ab_config.extend(extract_ab_data(blob))
+                    detected.update(detect_platforms(blob))
 
             try:
                 logs = driver.get_log("browser")
@@ -196,52 +439,128 @@ def scrape_domain(domain):
                     if 'postMessage' in entry.get("message", ""):
                         msg = entry["message"]
                         detected.update(detect_platforms(msg))
-                        ab_config.update(extract_ab_data(msg))
+                        ab_config.extend(extract_ab_data(msg))
             except:
                 pass
 
+            markers = ([BUDGET_MARKER] if deadline.exhausted else []) + \
+                ([HARVEST_TRUNCATED_MARKER] if page.get("truncated") else [])
+            if template and not markers:
+                get_templates().learn(ANALYZER, template, sorted(detected))
             return [
                 domain,
-                ";".join(sorted(ab_config)),
+                ab_config,
                 ";".join(sorted(detected)),
-                ";".join(sorted(scripts))
+                ";".join(sorted(scripts) + markers)
             ]
 
         except Exception as e:
+            if deadline.expired():
+                # Out of budget during navigation or harvest: keep what was collected, marked as partial
+                return [
+                    domain,
+                    ab_config,
+                    ";".join(sorted(detected)),
+                    ";".join(sorted(scripts) + [BUDGET_MARKER])
+                ]
             if attempt == 1:
                 with open(FAILED_FILE, "a") as ferr:
                     ferr.write(f"{domain}\n")
                 return None
         finally:
-            driver.quit()
-
-def main():
-    with open(INPUT_FILE) as f:
+            if own_driver:
+                driver.quit()
+
+def result_row(row):
+    # (index status, output row or None, error reason or None) for a scrape_domain() result
+    if not row:
+        return STATUS_FAILED, None, "scrape failed"
+    record = dict(zip(OUTPUT_COLUMNS, row))
+    record["ab_configuration"] = serialize_records(row[1])
+    partial = BUDGET_MARKER in row[3] or HARVEST_TRUNCATED_MARKER in row[3]
+    return (STATUS_PARTIAL if partial else STATUS_OK), record, None
+
+
+def load_domains(filename=INPUT_FILE, start=BATCH_START, end=BATCH_END):
+    # start is 1-based, as in the batch settings above
+    with open(filename) as f:
         domains = [line.strip() for line in f if line.strip()]
-    domains = domains[BATCH_START - 1:BATCH_END]
-
-    with open(OUTPUT_FILE, "a", newline="") as fout:
-        writer = csv.writer(fout)
-        writer.writerow(["domain", "ab_configuration", "detected_platforms", "ab_tool_scripts"])
-
-        threads = []
+    return domains[start - 1:end]
+
+
+def scan(domains, output_file=OUTPUT_FILE, fmt=OUTPUT_FORMAT, index_path=RESULT_DB,
+         skip_completed=SKIP_COMPLETED, threads=THREADS, memory_budget_mb=MEMORY_BUDGET_MB, egress=None):
+    # Library entry point; returns counts, rows go to the sink and the result index.
+    # egress covers the plain HTTP requests (static fetch, scripts), not the browser.
+    close_script_fetcher()
+    configure_egress(egress)
+    index = ResultIndex(index_path)
+    index.register(ANALYZER, OUTPUT_COLUMNS)
+    if skip_completed:
+        domains = index.pending(ANALYZER, domains, RULESET_VERSION)
+    counts = {"domains": len(domains), "ok": 0, "failed": 0}
+
+    # Slowest domains first (see priority.py); threads pull from one shared queue
+    # so a thread that drew quick sites keeps working instead of idling
+    work = queue.SimpleQueue()
+    for domain in priority.plan(index, ANALYZER, domains):
+        work.put(domain)
+
+    governor = MemoryGovernor(memory_budget_mb)
+    active = [0]  # threads inside scrape_domain; pausing only helps while some are
+
+    sink = open_sink(output_file, OUTPUT_COLUMNS, fmt, blob_columns=BLOB_COLUMNS)
+    try:
+        workers = []
         lock = threading.Lock()
 
-        def process_chunk(chunk):
-            for domain in chunk:
-                row = scrape_domain(domain)
-                if row:
+        def process_queue():
+            while True:
+                governor.admit_blocking(lambda: active[0])
+                try:
+                    domain = work.get_nowait()
+                except queue.Empty:
+                    return
+                deadline = Deadline(DOMAIN_BUDGET)
+                with lock:
+                    active[0] += 1
+                try:
+                    row = scrape_domain(domain, deadline=deadline)
+                finally:
                     with lock:
-                        writer.writerow(row)
-
-        chunk_size = max(1, len(domains) // THREADS)
-        for i in range(0, len(domains), chunk_size):
-            t = threading.Thread(target=process_chunk, args=(domains[i:i + chunk_size],))
+                        active[0] -= 1
+                state, record, error = result_row(row)
+                index.record(domain, ANALYZER, state, row=record, error=error, ruleset_version=RULESET_VERSION)
+                index.record_history(domain, ANALYZER, deadline.elapsed(), row is not None,
+                                     rendered="render" in deadline.stages)
+                with lock:
+                    counts["ok" if record is not None else "failed"] += 1
+                    if record is not None:
+                        sink.write_row(record)
+
+        for _ in range(min(threads, len(domains))):
+            t = threading.Thread(target=process_queue)
             t.start()
-            threads.append(t)
+            workers.append(t)
 
-        for t in threads:
+        for t in workers:
             t.join()
+    finally:
+        sink.close()
+        index.close()
+
+    close_script_fetcher()
+    if _templates is not None:
+        _templates.save()
+    print(f"Memory: {governor.stats()}")
+    return counts
+
+
+def main():
+    scan(load_domains())
+    if _templates is not None:
+        print(f"Template cache: {_templates.stats()}")
+    print(f"Blocked requests: {metrics['blocked_requests']}")
 
 
 if __name__ == "__main__":
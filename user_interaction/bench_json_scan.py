@@ -0,0 +1,61 @@
+import json
+import re
+import time
+
+from json_scan import iter_json_objects
+
+# Compares the old flat-object regex in extract_ab_data with the balanced scanner
+# on a synthetic bundle: minified code with nested experiment configs mixed in.
+
+ROUNDS = 5
+BUNDLE_REPEAT = 400
+
+CONFIG = {
+    "experiments": [
+        {"id": str(i), "variations": [{"id": f"v{i}{j}", "variant_name": f"V{j}",
+                                       "weight": 50} for j in range(2)],
+         "goals": [{"id": f"g{i}", "metric": "revenue"}]}
+        for i in range(20)
+    ],
+    "revision": "1024"
+}
+
+CODE = ("function a(b){if(b){return {x:b,y:\"}{\"}}else{for(var i=0;i<b;i++){c(i)}}}"
+        "var s='it\\'s {fine}';/* { block } */"
+        "e.exports={render:function(){return h('div',{staticClass:\"wrap\"})}};")
+
+
+def build_bundle():
+    chunk = CODE * 20 + "window.__cfg=" + json.dumps(CONFIG) + ";" + CODE * 20
+    return chunk * BUNDLE_REPEAT
+
+
+def regex_extract(text):
+    found = []
+    for block in re.findall(r'\{[^\{\}]{20,30000}\}', text):
+        try:
+            found.append(json.loads(block))
+        except:
+            continue
+    return found
+
+
+def timed(fn, text):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        out = fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+if __name__ == "__main__":
+    bundle = build_bundle()
+    mb = len(bundle) / 1e6
+    t_regex, regex_objs = timed(regex_extract, bundle)
+    t_scan, scan_objs = timed(lambda t: list(iter_json_objects(t)), bundle)
+    print(f"Bundle: {mb:.1f} MB")
+    print(f"regex:   {mb / t_regex:7.1f} MB/s, {len(regex_objs)} objects, "
+          f"{sum('experiments' in o for o in regex_objs)} full configs")
+    print(f"scanner: {mb / t_scan:7.1f} MB/s, {len(scan_objs)} objects, "
+          f"{sum('experiments' in o for o in scan_objs)} full configs")
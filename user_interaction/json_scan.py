@@ -0,0 +1,162 @@
+import json
+import re
+from functools import lru_cache
+
+# --- Settings ---
+MIN_OBJECT_CHARS = 20
+MAX_OBJECT_CHARS = 500000
+MAX_LITERAL_CHARS = 2000000
+
+# Braces outside string literals, template literals and comments. Unterminated
+# quotes (apostrophes in prose, regex literals) simply fail to match and are skipped.
+_TOKEN = re.compile(r"""
+    "[^"\\\n]*(?:\\.[^"\\\n]*)*"
+  | '[^'\\\n]*(?:\\.[^'\\\n]*)*'
+  | `[^`\\]*(?:\\.[^`\\]*)*`
+  | //[^\n]*
+  | /\*.{0,20000}?\*/
+  | [{}]
+""", re.X | re.S)
+# "{" followed by a complete "key": (or "}"), so code braces are rejected before any scanning
+_JSON_START = re.compile(r'\{\s*(?:\}|"[^"\\\n]*(?:\\.[^"\\\n]*)*"\s*:)')
+_KEY_COLON = re.compile(r'"\s*:')
+
+_JS_TOKEN = re.compile(r"""
+    (?P<dq>"(?:[^"\\]|\\.)*")
+  | (?P<sq>'(?:[^'\\]|\\.)*')
+  | (?P<bt>`[^`\\$]*`)
+  | (?P<num>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_$][\w$]*)
+  | (?P<punct>[{}\[\]:,])
+  | (?P<ws>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+""", re.X | re.S)
+_NEXT_IS_COLON = re.compile(r"\s*:")
+_JS_CONSTANTS = {"true": "true", "false": "false", "null": "null",
+                 "undefined": "null", "NaN": "null", "Infinity": "null"}
+
+
+def _braces(text, pos=0):
+    # Yields (char, index) for every "{" / "}" outside string literals and comments.
+    for m in _TOKEN.finditer(text, pos):
+        tok = m.group()
+        if tok == "{" or tok == "}":
+            yield tok, m.start()
+
+
+def balanced_end(text, start, max_len=MAX_LITERAL_CHARS):
+    depth = 0
+    for ch, i in _braces(text, start):
+        if i - start > max_len:
+            return -1
+        depth += 1 if ch == "{" else -1
+        if depth == 0:
+            return i + 1
+    return -1
+
+
+def _parse_outermost(text, node, min_len):
+    # node is (start, end, nested candidates). Each span goes to json.loads once;
+    # the candidates nested in it are only tried when it does not parse.
+    pending = [node]
+    while pending:
+        start, end, nested = pending.pop()
+        if end - start < min_len:
+            continue
+        try:
+            obj = json.loads(text[start:end])
+        except RecursionError:
+            continue  # nested too deep for the decoder; so is everything in it
+        except ValueError:
+            pending.extend(reversed(nested))
+            continue
+        yield obj
+
+
+def iter_json_objects(text, min_len=MIN_OBJECT_CHARS, max_len=MAX_OBJECT_CHARS):
+    if not _KEY_COLON.search(text):
+        return
+    # One left-to-right pass with a brace stack. A closed object that starts like
+    # JSON and holds nothing but such objects stays a candidate inside its parent.
+    # Once a parent turns out to be code (or is never closed), its candidates are
+    # parsed, outermost first, so nested JSON is not parsed level by level.
+    stack = []  # [start, nested candidates, clean]
+    for m in _TOKEN.finditer(text):
+        tok = m.group()
+        if tok == "{":
+            stack.append([m.start(), [], True])
+        elif tok == "}" and stack:
+            start, nested, clean = stack.pop()
+            end = m.end()
+            if clean and end - start <= max_len and _JSON_START.match(text, start):
+                if stack:
+                    stack[-1][1].append((start, end, nested))
+                else:
+                    yield from _parse_outermost(text, (start, end, nested), min_len)
+                continue
+            if stack:
+                stack[-1][2] = False
+            for node in nested:
+                yield from _parse_outermost(text, node, min_len)
+    for _, nested, _ in stack:
+        for node in nested:
+            yield from _parse_outermost(text, node, min_len)
+
+
+def parse_lenient(literal):
+    # Converts a JS object literal (bare keys, single quotes, trailing commas,
+    # undefined) to JSON. Returns None for anything that is not plain data.
+    out = []
+    pos, n = 0, len(literal)
+    while pos < n:
+        m = _JS_TOKEN.match(literal, pos)
+        if not m:
+            return None
+        pos = m.end()
+        kind, tok = m.lastgroup, m.group()
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "punct" and tok in "}]" and out and out[-1] == ",":
+            out.pop()
+        if kind == "dq" or kind == "punct":
+            out.append(tok)
+        elif kind == "sq":
+            body = tok[1:-1].replace("\\'", "'").replace('"', '\\"')
+            out.append(f'"{body}"')
+        elif kind == "bt":
+            out.append(json.dumps(tok[1:-1]))
+        elif _NEXT_IS_COLON.match(literal, pos):
+            out.append(json.dumps(tok))
+        elif kind == "num":
+            out.append(tok)
+        elif tok in _JS_CONSTANTS:
+            out.append(_JS_CONSTANTS[tok])
+        else:
+            return None
+    try:
+        return json.loads("".join(out))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def _assignment_pattern(names):
+    alternatives = "|".join(re.escape(n) for n in names)
+    return re.compile(rf"(?<![\w$.])(?:window\.)?({alternatives})\s*=\s*\{{")
+
+
+def iter_global_literals(text, names, max_len=MAX_LITERAL_CHARS):
+    if not names:
+        return
+    for m in _assignment_pattern(tuple(names)).finditer(text):
+        start = m.end() - 1
+        end = balanced_end(text, start, max_len)
+        if end == -1:
+            continue
+        literal = text[start:end]
+        try:
+            obj = json.loads(literal)
+        except ValueError:
+            obj = parse_lenient(literal)
+        if isinstance(obj, dict):
+            yield m.group(1), obj
@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import json
+import re
+
+# --- Settings ---
+CAPTURE_TYPES = {"Script", "XHR", "Fetch"}
+CAPTURE_MIME = re.compile(r"javascript|ecmascript|json|text/plain", re.I)
+# Beacons and ad pixels never carry experiment config
+CAPTURE_SKIP_URLS = re.compile(
+    r"google-analytics\.com/(?:g/)?collect|doubleclick\.net|googlesyndication\.com|facebook\.com/tr", re.I
+)
+CAPTURE_MAX_CHARS = 300000
+CAPTURE_MAX_RESPONSE_BYTES = 5000000
+CAPTURE_BUFFER_BYTES = 50000000
+
+
+def enable_capture(opts):
+    # Performance logs carry the CDP Network events; must be set before the driver starts
+    opts.set_capability("goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"})
+
+
+def start_capture(driver):
+    # Called before driver.get so Chrome keeps response bodies around for getResponseBody
+    driver.execute_cdp_cmd("Network.enable", {
+        "maxTotalBufferSize": CAPTURE_BUFFER_BYTES,
+        "maxResourceBufferSize": CAPTURE_MAX_RESPONSE_BYTES,
+    })
+
+
+def _wanted(response, resource_type):
+    if resource_type not in CAPTURE_TYPES:
+        return False
+    url = response.get("url", "")
+    if not url.startswith("http") or CAPTURE_SKIP_URLS.search(url):
+        return False
+    return bool(CAPTURE_MIME.search(response.get("mimeType", "")))
+
+
+def collect_responses(driver, log_entries, script_chars=CAPTURE_MAX_CHARS, max_chars=CAPTURE_MAX_CHARS):
+    # Returns [(url, resource_type, body, key)] for finished script/XHR responses
+    # the browser already downloaded. key identifies the body for result caching.
+    # log_entries is the drained driver.get_log("performance") list.
+    pending, finished = {}, {}
+    for entry in log_entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        method, params = message.get("method"), message.get("params", {})
+        if method == "Network.responseReceived":
+            response = params.get("response", {})
+            if _wanted(response, params.get("type")):
+                pending[params["requestId"]] = (response["url"], params["type"])
+        elif method == "Network.loadingFinished":
+            finished[params.get("requestId")] = params.get("encodedDataLength", 0)
+
+    captured = []
+    for request_id, (url, resource_type) in pending.items():
+        size = finished.get(request_id)
+        if size is None or size > CAPTURE_MAX_RESPONSE_BYTES:
+            continue
+        try:
+            result = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+        except Exception:
+            continue
+        body = result.get("body", "")
+        if result.get("base64Encoded"):
+            try:
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            except ValueError:
+                continue
+        body = body[:script_chars if resource_type == "Script" else max_chars]
+        key = hashlib.sha1(body.encode("utf-8", "replace")).hexdigest()
+        captured.append((url, resource_type, body, key))
+    return captured
+
+
+def document_response(driver, log_entries, max_chars=CAPTURE_MAX_CHARS):
+    # (url, html, headers with lowercased names) of the page's own document as the
+    # server sent it, or None. The first Document response is the main frame's.
+    for entry in log_entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, ValueError):
+            continue
+        if message.get("method") != "Network.responseReceived" or message["params"].get("type") != "Document":
+            continue
+        params = message["params"]
+        response = params.get("response", {})
+        try:
+            result = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": params["requestId"]})
+        except Exception:
+            return None
+        body = result.get("body", "")
+        if result.get("base64Encoded"):
+            try:
+                body = base64.b64decode(body).decode("utf-8", errors="replace")
+            except ValueError:
+                return None
+        headers = {k.lower(): v for k, v in response.get("headers", {}).items()}
+        return response.get("url", ""), body[:max_chars], headers
+    return None
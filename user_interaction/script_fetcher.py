@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aiohttp
+
+# --- Settings ---
+SCRIPT_MAX_BYTES = 3000
+SCRIPT_TIMEOUT = aiohttp.ClientTimeout(total=5)
+SCRIPT_CONCURRENCY = 50
+SCRIPT_PER_HOST = 6
+MEMORY_CACHE_ENTRIES = 5000
+FAILURE_TTL = 5  # seconds a failed script is answered from cache; shorter than a page render, so a retry refetches it
+DISK_CACHE_DIR = ".script_cache"
+DISK_CACHE_MAX_FILES = 100000  # oldest entries beyond this are removed
+DISK_CACHE_MAX_AGE = 7 * 86400  # seconds since an entry was last written or revalidated
+DISK_PRUNE_EVERY = 5000  # disk writes between prunes; one also runs at startup
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+    # Plain bytes so a Range response can be decoded on its own
+    "Accept-Encoding": "identity",
+}
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8", "replace")).hexdigest()
+
+
+class ScriptFetcher:
+    # One event loop thread and one pooled ClientSession shared by every
+    # scanning thread. Entries are dicts with url, etag, last_modified, body and
+    # key, where key identifies the exact script content for result caching.
+
+    def __init__(self, max_bytes=SCRIPT_MAX_BYTES, concurrency=SCRIPT_CONCURRENCY,
+                 per_host=SCRIPT_PER_HOST, memory_entries=MEMORY_CACHE_ENTRIES,
+                 cache_dir=DISK_CACHE_DIR, egress=None, disk_max_files=DISK_CACHE_MAX_FILES,
+                 disk_max_age=DISK_CACHE_MAX_AGE):
+        self.max_bytes = max_bytes
+        self.egress = egress  # optional EgressPool (see egress.py)
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.cache_dir = cache_dir
+        self.disk_max_files = disk_max_files
+        self.disk_max_age = disk_max_age
+        self._disk_writes = 0
+        self._pruning = threading.Lock()
+        self.memory = LRUCache(memory_entries)
+        self._failed = LRUCache(memory_entries)  # url -> monotonic time until which it is not retried
+        self._inflight = {}
+        self._session = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._start_prune()
+
+    # --- Disk cache ---
+    # One file per script URL, so a long run would otherwise grow it without limit.
+    # Pruning walks the directory on a background thread: entries not written or
+    # revalidated within disk_max_age go first, then the oldest beyond disk_max_files.
+    def _disk_path(self, url):
+        name = _digest(url)
+        return os.path.join(self.cache_dir, name[:2], name + ".json")
+
+    def _read_disk(self, url):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+            return entry if entry.get("url") == url else None
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, entry):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(entry["url"])
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        self._disk_writes += 1
+        if self._disk_writes % DISK_PRUNE_EVERY == 0:
+            self._start_prune()
+
+    def _touch_disk(self, url):
+        # A 304 confirms the entry, so it counts as fresh for pruning
+        try:
+            os.utime(self._disk_path(url))
+        except OSError:
+            pass
+
+    def _start_prune(self):
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            threading.Thread(target=self._prune_disk, daemon=True).start()
+
+    def _prune_disk(self):
+        if not self._pruning.acquire(blocking=False):
+            return  # a prune is already running
+        try:
+            cutoff = time.time() - self.disk_max_age
+            kept = []
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        mtime = os.stat(path).st_mtime
+                        if mtime < cutoff:
+                            os.remove(path)  # also clears temp files left by a crash
+                        elif name.endswith(".json"):
+                            kept.append((mtime, path))
+                    except OSError:
+                        pass
+            kept.sort()
+            for _, path in kept[:max(0, len(kept) - self.disk_max_files)]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        finally:
+            self._pruning.release()
+
+    # --- Network ---
+    async def _get_session(self):
+        if self._session is None:
+            connector = {"limit": self.concurrency, "limit_per_host": self.per_host, "ttl_dns_cache": 300}
+            if self.egress:
+                from egress import client_session  # repo root is on sys.path once abv3 has loaded
+                self._session = client_session(self.egress, connector, timeout=SCRIPT_TIMEOUT,
+                                               cookie_jar=aiohttp.DummyCookieJar())
+            else:
+                self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(**connector),
+                                                      timeout=SCRIPT_TIMEOUT, cookie_jar=aiohttp.DummyCookieJar())
+        return self._session
+
+    async def _read_prefix(self, resp):
+        chunks, remaining = [], self.max_bytes
+        while remaining > 0:
+            chunk = await resp.content.read(remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks).decode(resp.charset or "utf-8", errors="replace")
+
+    async def _load(self, url):
+        cached = self._read_disk(url)
+        headers = dict(HEADERS)
+        headers["Range"] = f"bytes=0-{self.max_bytes - 1}"
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            session = await self._get_session()
+            async with session.get(url, headers=headers) as resp:
+                if resp.status == 304 and cached:
+                    self._touch_disk(url)
+                    return cached
+                if resp.status not in (200, 206):
+                    return None
+                body = await self._read_prefix(resp)
+                etag = resp.headers.get("ETag", "")
+                last_modified = resp.headers.get("Last-Modified", "")
+        except Exception:
+            return cached
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+            "key": _digest(url + "\n" + (etag or last_modified or _digest(body))),
+        }
+        self._write_disk(entry)
+        return entry
+
+    async def _fetch(self, url):
+        entry = self.memory.get(url)
+        if entry is not None:
+            return entry
+        if self._failed.get(url, 0) > time.monotonic():
+            return None
+        task = self._inflight.get(url)
+        if task is None:
+            task = self.loop.create_task(self._load(url))
+            self._inflight[url] = task
+            try:
+                entry = await asyncio.shield(task)
+            finally:
+                self._inflight.pop(url, None)
+            if entry is not None:
+                self.memory.put(url, entry)
+            else:
+                self._failed.put(url, time.monotonic() + FAILURE_TTL)
+            return entry
+        return await asyncio.shield(task)
+
+    async def _fetch_all(self, urls, timeout=None):
+        tasks = {url: self.loop.create_task(self._fetch(url)) for url in dict.fromkeys(urls)}
+        done, pending = await asyncio.wait(tasks.values(), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return {url: task.result() for url, task in tasks.items() if task in done}
+
+    def fetch_many(self, urls, timeout=None):
+        # Blocking entry point for worker threads; failed scripts map to None. With a
+        # timeout, scripts still in flight when it expires are cancelled and left out.
+        if not urls:
+            return {}
+        future = asyncio.run_coroutine_threadsafe(self._fetch_all(urls, timeout), self.loop)
+        return future.result(None if timeout is None else timeout + 5)
+
+    def close(self):
+        async def _close():
+            if self._session is not None:
+                await self._session.close()
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), self.loop).result(10)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(10)